@@ -1,16 +1,52 @@
+import os
+
 from flask import Flask, request
 from flask_pymongo import PyMongo
 from flasgger import Swagger
+from utils.common import DEFAULT_MONGO_URI, mongo_client_options
+from utils.metrics import MONGO_LISTENERS, MetricsMiddleware
+from utils.slow_queries import slow_queries
 
 app = Flask(__name__)
-app.config["MONGO_URI"] = "mongodb://mongo:27017/reservas_db"
-mongo = PyMongo(app)
+app.config["MONGO_URI"] = os.environ.get("MONGO_URI", DEFAULT_MONGO_URI)
+# el cliente no se conecta hasta la primera operación; con gunicorn cada worker crea
+# el suyo después del fork (ver gunicorn.conf.py)
+mongo_event_listeners = [*MONGO_LISTENERS, slow_queries]
+mongo = PyMongo(app, event_listeners=mongo_event_listeners, **mongo_client_options())
+# los explain de las consultas lentas usan el cliente de cada worker
+slow_queries.bind(lambda: mongo.cx)
 
 from crud.users import *
 from crud.vehicles import *
 from crud.reserves import *
+from crud.admin import *
+from utils.cache import user_cache, vehicle_cache
+from utils.utils import admin_only, conditional, run_maintenance
+from utils.indexes import bootstrap_indexes
+from utils.sweeper import sweeper
+from utils.change_stream import change_listener
+
+# barrido periódico de reservas vencidas (SWEEPER_INTERVAL=0 lo desactiva)
+sweeper.bind(lambda: mongo.db, run_maintenance)
+# invalidación de las cachés de este proceso con un change stream (solo con replica
+# set, CHANGE_STREAM=0 lo desactiva)
+change_listener.bind(lambda: mongo.db)
+
+
+def start_background_tasks():
+    """Inicia los hilos de mantenimiento de este proceso."""
+    sweeper.start()
+    change_listener.start()
 
 
+# gunicorn importa la aplicación en el maestro antes del fork (preload_app) y define
+# BACKGROUND_TASKS=0: los hilos se inician en cada worker, ver gunicorn.conf.py
+if os.environ.get("BACKGROUND_TASKS", "1") == "1":
+    start_background_tasks()
+
+# métricas de Prometheus por ruta, publicadas en /metrics
+app.wsgi_app = MetricsMiddleware(app, app.wsgi_app)
+
 # inicializamos swagger
 
 swagger = Swagger(
@@ -29,14 +65,43 @@ swagger = Swagger(
 
 
 @app.route("/users", methods=["GET"])
+@conditional("usuarios")
 def get_users_endpoint():
     """
     Listar todos los usuarios
     ---
-    description: Obtiene todos los usuarios de la base de datos.
+    description: Obtiene los usuarios de la base de datos. Por defecto no incluye historial_reservas, ver /users/{id}/historial.
+    parameters:
+      - name: limit
+        in: query
+        description: Cantidad máxima de resultados (por defecto 100, máximo 1000)
+        required: false
+        type: integer
+      - name: after
+        in: query
+        description: Cursor de la página siguiente (cabecera X-Next-Cursor de la respuesta anterior)
+        required: false
+        type: string
+      - name: fields
+        in: query
+        description: Campos a incluir separados por comas (ej. nombre,email)
+        required: false
+        type: string
+      - name: exclude
+        in: query
+        description: Campos a excluir separados por comas, no se puede combinar con fields
+        required: false
+        type: string
     responses:
       200:
         description: Lista de usuarios
+        headers:
+          X-Total-Count:
+            type: integer
+            description: Total aproximado de resultados
+          X-Next-Cursor:
+            type: string
+            description: Cursor para pedir la página siguiente, ausente en la última página
         schema:
           type: array
           items:
@@ -53,7 +118,7 @@ def get_users_endpoint():
                 description: Correo electrónico del usuario
               historial_reservas:
                 type: array
-                description: Historial de reservas del usuario
+                description: Últimas entradas del historial de reservas (ver /users/{id}/historial)
                 items:
                   type: object
                   properties:
@@ -69,10 +134,16 @@ def get_users_endpoint():
                       description: Estado de la reserva
                       example: "confirmada"
     """
-    return get_users()
+    return get_users(
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
 
 
 @app.route("/users/<id>", methods=["GET"])
+@conditional("usuarios", "id", user_cache)
 def get_user_by_id_endpoint(id):
     """
     Buscar un usuario por su ID
@@ -84,6 +155,16 @@ def get_user_by_id_endpoint(id):
         description: ID del usuario a buscar
         required: true
         type: string
+      - name: fields
+        in: query
+        description: Campos a incluir separados por comas (ej. nombre,email)
+        required: false
+        type: string
+      - name: exclude
+        in: query
+        description: Campos a excluir separados por comas, no se puede combinar con fields
+        required: false
+        type: string
     responses:
         200:
             description: Usuario encontrado
@@ -101,7 +182,7 @@ def get_user_by_id_endpoint(id):
                         description: Correo electrónico del usuario
                     historial_reservas:
                         type: array
-                        description: Historial de reservas del usuario
+                        description: Últimas entradas del historial de reservas (ver /users/{id}/historial)
                         items:
                             type: object
                             properties:
@@ -121,7 +202,57 @@ def get_user_by_id_endpoint(id):
         400:
             description: ID inválido
     """
-    return get_user_by_id(id)
+    return get_user_by_id(id, request.args.get("fields"), request.args.get("exclude"))
+
+
+@app.route("/users/<id>/historial", methods=["GET"])
+@conditional("usuarios", "id")
+def get_user_historial_endpoint(id):
+    """
+    Historial de reservas de un usuario
+    ---
+    description: Obtiene una página del historial completo de reservas de un usuario, en orden cronológico
+    parameters:
+      - name: id
+        in: path
+        description: ID del usuario
+        required: true
+        type: string
+      - name: limit
+        in: query
+        description: Cantidad máxima de entradas (por defecto 100, máximo 1000)
+        required: false
+        type: integer
+      - name: offset
+        in: query
+        description: Posición de la primera entrada a devolver (por defecto 0)
+        required: false
+        type: integer
+    responses:
+        200:
+            description: Entradas del historial
+            schema:
+                type: array
+                items:
+                    type: object
+                    properties:
+                        reserva_id:
+                            type: string
+                            description: ID de la reserva
+                        fecha:
+                            type: string
+                            description: Fecha de la reserva
+                            example: "2025-03-09T15:00:00"
+                        estado:
+                            type: string
+                            description: Estado de la reserva
+                            example: "confirmada"
+        400:
+            description: ID o paginación inválidos
+        404:
+            description: Usuario no encontrado
+    """
+    return get_user_historial(id, request.args.get("limit"), request.args.get("offset"))
 
 
 @app.route("/users", methods=["POST"])
@@ -221,14 +352,43 @@ def delete_user_endpoint(id):
 
 # rutas de vehiculos
 @app.route("/vehicles", methods=["GET"])
+@conditional("vehiculos")
 def get_vehicles_endpoint():
     """
     Listar todos los vehículos
     ---
     description: Obtiene todos los vehículos de la base de datos.
+    parameters:
+      - name: limit
+        in: query
+        description: Cantidad máxima de resultados (por defecto 100, máximo 1000)
+        required: false
+        type: integer
+      - name: after
+        in: query
+        description: Cursor de la página siguiente (cabecera X-Next-Cursor de la respuesta anterior)
+        required: false
+        type: string
+      - name: fields
+        in: query
+        description: Campos a incluir separados por comas (ej. nombre,email)
+        required: false
+        type: string
+      - name: exclude
+        in: query
+        description: Campos a excluir separados por comas, no se puede combinar con fields
+        required: false
+        type: string
     responses:
       200:
         description: Lista de vehículos
+        headers:
+          X-Total-Count:
+            type: integer
+            description: Total aproximado de resultados
+          X-Next-Cursor:
+            type: string
+            description: Cursor para pedir la página siguiente, ausente en la última página
         schema:
           type: array
           items:
@@ -244,10 +404,134 @@ def get_vehicles_endpoint():
                 type: boolean
                 description: Estado de reserva del vehículo
     """
-    return get_vehicles()
+    return get_vehicles(
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
+
+
+@app.route("/vehicles/available", methods=["GET"])
+def get_available_vehicles_endpoint():
+    """
+    Buscar vehículos disponibles
+    ---
+    description: Obtiene los vehículos sin reservas activas entre dos fechas, con una sola agregación en la base de datos
+    parameters:
+      - name: from
+        in: query
+        description: Fecha inicial (YYYY-MM-DD)
+        required: true
+        type: string
+        example: "2025-03-10"
+      - name: to
+        in: query
+        description: Fecha final (YYYY-MM-DD)
+        required: true
+        type: string
+        example: "2025-03-12"
+      - name: tipo
+        in: query
+        description: Tipo de vehículo
+        required: false
+        type: string
+      - name: limit
+        in: query
+        description: Cantidad máxima de resultados (por defecto 100, máximo 1000)
+        required: false
+        type: integer
+      - name: after
+        in: query
+        description: Cursor de la página siguiente (cabecera X-Next-Cursor de la respuesta anterior)
+        required: false
+        type: string
+    responses:
+      200:
+        description: Vehículos disponibles en las fechas
+        headers:
+          X-Next-Cursor:
+            type: string
+            description: Cursor para pedir la página siguiente, ausente en la última página
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              _id:
+                type: string
+                description: ID del vehículo
+              placa:
+                type: string
+                description: Placa del vehículo
+              tipo:
+                type: string
+                description: Tipo de vehículo
+      400:
+        description: Fechas o paginación inválidas
+    """
+    return get_available_vehicles(
+        request.args.get("from"),
+        request.args.get("to"),
+        request.args.get("tipo"),
+        request.args.get("limit"),
+        request.args.get("after"),
+    )
+
+
+@app.route("/vehicles/occupancy", methods=["GET"])
+def get_occupancy_endpoint():
+    """
+    Calendario de ocupación de la flota
+    ---
+    description: Obtiene, desde hoy, qué días está ocupado cada vehículo y el porcentaje de utilización total, por tipo y por día
+    parameters:
+      - name: days
+        in: query
+        description: Cantidad de días del calendario (por defecto y como máximo 90)
+        required: false
+        type: integer
+      - name: tipo
+        in: query
+        description: Tipo de vehículo
+        required: false
+        type: string
+    responses:
+      200:
+        description: Calendario de ocupación
+        schema:
+          type: object
+          properties:
+            desde:
+              type: string
+              description: Primer día del calendario
+              example: "2025-03-09"
+            dias:
+              type: integer
+              description: Cantidad de días del calendario
+            vehiculos:
+              type: array
+              description: Vehículos en el orden de las filas de ocupacion
+              items:
+                type: object
+            ocupacion:
+              type: array
+              description: Una fila por vehículo con un 1 en cada día ocupado
+              items:
+                type: array
+                items:
+                  type: integer
+            utilizacion:
+              type: object
+              description: Porcentaje de días ocupados (total, por_tipo y por_dia)
+      400:
+        description: Cantidad de días inválida
+    """
+    return get_occupancy(request.args.get("days"), request.args.get("tipo"))
 
 
 @app.route("/vehicles/<id>", methods=["GET"])
+@conditional("vehiculos", "id", vehicle_cache)
 def get_vehicle_by_id_endpoint(id):
     """
     Buscar un vehículo por su ID
@@ -259,6 +543,16 @@ def get_vehicle_by_id_endpoint(id):
         description: ID del vehículo a buscar
         required: true
         type: string
+      - name: fields
+        in: query
+        description: Campos a incluir separados por comas
+        required: false
+        type: string
+      - name: exclude
+        in: query
+        description: Campos a excluir separados por comas, no se puede combinar con fields
+        required: false
+        type: string
     responses:
         200:
             description: Vehículo encontrado
@@ -282,7 +576,9 @@ def get_vehicle_by_id_endpoint(id):
         400:
             description: ID inválido
     """
-    return get_vehicle_by_id(id)
+    return get_vehicle_by_id(
+        id, request.args.get("fields"), request.args.get("exclude")
+    )
 
 
 @app.route("/vehicles", methods=["POST"])
@@ -396,9 +692,37 @@ def get_reserves_endpoint():
     Listar todas las reservas
     ---
     description: Obtiene todas las reservas de la base de datos.
+    parameters:
+      - name: limit
+        in: query
+        description: Cantidad máxima de resultados (por defecto 100, máximo 1000)
+        required: false
+        type: integer
+      - name: after
+        in: query
+        description: Cursor de la página siguiente (cabecera X-Next-Cursor de la respuesta anterior)
+        required: false
+        type: string
+      - name: fields
+        in: query
+        description: Campos a incluir separados por comas (ej. nombre,email)
+        required: false
+        type: string
+      - name: exclude
+        in: query
+        description: Campos a excluir separados por comas, no se puede combinar con fields
+        required: false
+        type: string
     responses:
       200:
         description: Lista de reservas
+        headers:
+          X-Total-Count:
+            type: integer
+            description: Total aproximado de resultados
+          X-Next-Cursor:
+            type: string
+            description: Cursor para pedir la página siguiente, ausente en la última página
         schema:
           type: array
           items:
@@ -422,7 +746,59 @@ def get_reserves_endpoint():
                 format: date
                 description: Fecha y hora de inicio de la reserva (formato YYYY-MM-DD)
     """
-    return get_reserves()
+    return get_reserves(
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
+
+
+@app.route("/reserve/export", methods=["GET"])
+def export_reserves_endpoint():
+    """
+    Exportar reservas
+    ---
+    description: Transmite las reservas ordenadas por fecha_inicio en NDJSON o CSV, por lotes, para exportar la colección completa sin cargarla en memoria.
+    parameters:
+      - name: format
+        in: query
+        description: Formato de la exportación, ndjson (por defecto) o csv
+        required: false
+        type: string
+      - name: from
+        in: query
+        description: Primer día de fecha_inicio (formato YYYY-MM-DD)
+        required: false
+        type: string
+      - name: to
+        in: query
+        description: Último día de fecha_inicio, incluido (formato YYYY-MM-DD)
+        required: false
+        type: string
+      - name: estado
+        in: query
+        description: Estado de las reservas (activa, cancelado o terminada)
+        required: false
+        type: string
+      - name: join
+        in: query
+        description: Con 1 o true agrega el email del usuario y la placa del vehiculo
+        required: false
+        type: string
+    responses:
+      200:
+        description: Una reserva por línea en NDJSON, o CSV con encabezado
+      400:
+        description: Formato, fechas o estado inválidos
+    """
+    return export_reserves(
+        request.args.get("format"),
+        request.args.get("from"),
+        request.args.get("to"),
+        request.args.get("estado"),
+        request.args.get("join"),
+    )
 
 
 @app.route("/reserve", methods=["POST"])
@@ -465,6 +841,62 @@ def create_reservation_endpoint():
     return create_reservation(reservation)
 
 
+@app.route("/reserve/bulk", methods=["POST"])
+def create_reservations_bulk_endpoint():
+    """
+    Crear reservas en lote
+    ---
+    description: Crea varias reservas en una sola solicitud (máximo 1000) y devuelve un resultado por reserva
+    parameters:
+      - name: reservations
+        in: body
+        required: true
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              id_usuario:
+                type: string
+                description: Id del usuario
+              id_vehiculo:
+                type: string
+                description: Id del vehiculo
+              fecha_inicio:
+                type: string
+                format: date
+                description: Fecha de inicio de la reserva (formato YYYY-MM-DD)
+              fecha_fin:
+                type: string
+                format: date
+                description: Fecha de fin de la reserva (formato YYYY-MM-DD)
+    responses:
+      200:
+          description: Resultado de cada reserva, en el mismo orden del lote
+          schema:
+              type: array
+              items:
+                  type: object
+                  properties:
+                      index:
+                          type: integer
+                          description: Posición de la reserva en el lote
+                      status:
+                          type: integer
+                          description: 201 si se creó, o el código de error de la reserva
+                      _id:
+                          type: string
+                          description: ID de la reserva creada
+                      error:
+                          type: string
+                          description: Motivo por el que no se creó
+      400:
+          description: El cuerpo no es una lista o supera el máximo permitido
+    """
+    reservations = request.json
+    return create_reservations_bulk(reservations)
+
+
 @app.route("/reserve/<id>", methods=["PUT"])
 def cancel_reservation_endpoint(id):
     """
@@ -485,6 +917,10 @@ def cancel_reservation_endpoint(id):
                 description: ID de la reserva cancelada
         400:
             description: ID inválido
+        404:
+            description: Reserva no encontrada
+        409:
+            description: La reserva ya no está activa
 
     """
     return cancel_reservation(id)
@@ -528,9 +964,41 @@ def get_reservations_by_user_endpoint(id):
           description: ID del usuario a consultar
           required: true
           type: string
+        - name: limit
+          in: query
+          description: Cantidad máxima de resultados (por defecto 100, máximo 1000)
+          required: false
+          type: integer
+        - name: after
+          in: query
+          description: Cursor de la página siguiente (cabecera X-Next-Cursor de la respuesta anterior)
+          required: false
+          type: string
+        - name: fields
+          in: query
+          description: Campos a incluir separados por comas (ej. nombre,email)
+          required: false
+          type: string
+        - name: exclude
+          in: query
+          description: Campos a excluir separados por comas, no se puede combinar con fields
+          required: false
+          type: string
+        - name: count
+          in: query
+          description: true para contar el total de reservas del usuario en X-Total-Count
+          required: false
+          type: boolean
     responses:
       200:
         description: Lista de reservas
+        headers:
+          X-Total-Count:
+            type: integer
+            description: Total de reservas del usuario, solo con count=true
+          X-Next-Cursor:
+            type: string
+            description: Cursor para pedir la página siguiente, ausente en la última página
         schema:
           type: array
           items:
@@ -554,7 +1022,13 @@ def get_reservations_by_user_endpoint(id):
                 format: date
                 description: Fecha y hora de inicio de la reserva (formato YYYY-MM-DD)
     """
-    return get_reservations_by_user(id)
+    return get_reservations_by_user(
+        id,
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
 
 
 @app.route("/reserve/vehicle/", methods=["GET"])
@@ -595,18 +1069,60 @@ def get_most_reserved_vehicle_endpoint():
     return get_most_reserved_vehicle()
 
 
+@app.route("/reserve/vehicles/<int:limit>", methods=["GET"])
+def get_most_reserved_vehicles_endpoint(limit):
+    """
+    Vehículos más reservados
+    ---
+    description: Obtiene los vehículos con más reservas, de mayor a menor
+    parameters:
+      - name: limit
+        in: path
+        description: Límite de resultados (máximo 1000)
+        required: true
+        type: integer
+    responses:
+        200:
+            description: Vehículos más reservados
+            schema:
+                type: array
+                items:
+                    type: object
+                    properties:
+                        id_vehiculo:
+                            type: string
+                            description: ID del vehículo
+                        cantidad_reservas:
+                            type: integer
+                            description: Cantidad de reservas del vehículo
+                        vehiculo:
+                            type: object
+                            description: Datos del vehículo
+        404:
+            description: No se encontraron reservas
+        400:
+            description: Límite inválido
+    """
+    return get_most_reserved_vehicles(limit)
+
+
 @app.route("/reserve/users/<int:limit>", methods=["GET"])
 def get_most_canceling_user_limit(limit):
     """
     Usuarios con más cancelaciones
       ---
-      description: Obtiene los usuarios que más han cancelado reservas
+      description: Obtiene los usuarios que más han cancelado reservas. Los eventos de cancelación se conservan CANCELLATION_RETENTION_DAYS días (365 por defecto), así que el ranking cubre ese período.
       parameters:
         - name: limit
           in: path
           description: Límite de resultados
           required: true
           type: integer
+        - name: days
+          in: query
+          description: Solo cuenta las cancelaciones de los últimos días (como máximo CANCELLATION_RETENTION_DAYS)
+          required: false
+          type: integer
       responses:
         200:
             description: Usuarios con más cancelaciones
@@ -633,10 +1149,10 @@ def get_most_canceling_user_limit(limit):
         404:
             description: No se encontraron cancelaciones
         400:
-            description: Límite inválido
+            description: Límite o días inválidos
     """
     return get_most_canceling_user(
-        limit
+        limit, request.args.get("days")
     )  # Pasar el 'limit' a la función de obtener el usuario que más ha cancelado
 
 
@@ -660,10 +1176,173 @@ def finished_reservation_endpoint(id):
                 description: ID de la reserva terminada
         400:
             description: ID inválido
+        404:
+            description: Reserva no encontrada
+        409:
+            description: La reserva ya no está activa
 
     """
     return finished_reservation(id)
 
 
+# Rutas administración
+
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """
+    Crea los índices declarados en utils/indexes.py, reintentando mientras MongoDB no
+    responde.
+    """
+    created = bootstrap_indexes(mongo.db)
+    print(f"{sum(len(names) for names in created.values())} indexes ensured")
+
+
+@app.cli.command("rebuild-counters")
+def rebuild_counters_command():
+    """Recalcula los contadores de reservas por vehículo desde la colección reservas."""
+    print(f"{rebuild_reservation_counters()} vehicle counters rebuilt")
+
+
+@app.cli.command("rebuild-occupancy")
+def rebuild_occupancy_command():
+    """Recalcula los días ocupados por vehículo desde las reservas activas."""
+    print(f"{rebuild_occupancy()} occupied days rebuilt")
+
+
+@app.cli.command("sweep-reservations")
+def sweep_reservations_command():
+    """
+    Pasa a terminada las reservas activas vencidas, desbloquea a los usuarios cuyo
+    bloqueo venció y libera los días ocupados sin reserva activa, como el barrido
+    periódico.
+    """
+    try:
+        result = sweeper.run_once()
+    finally:
+        # el comando no renueva la concesión: si se la queda, los workers no barren
+        # hasta que vence
+        sweeper.release()
+    if result is None:
+        print("Another process holds the sweeper lease")
+    else:
+        print(
+            f"{result['reservas']} reservations finished for {result['usuarios']} "
+            f"users in {result['lotes']} batches, "
+            f"{result['desbloqueados']} users unblocked, "
+            f"{result['dias_liberados']} orphan occupied days released"
+        )
+
+
+@app.cli.command("migrate-historial")
+def migrate_historial_command():
+    """Pasa el historial de los usuarios a historial_buckets y lo recorta en el usuario."""
+    print(f"{migrate_historial()} users migrated")
+
+
+@app.route("/admin/cache", methods=["GET"])
+@admin_only
+def get_cache_stats_endpoint():
+    """
+    Estadísticas de caché
+    ---
+    description: Obtiene los aciertos, fallos y tamaño de las cachés de usuarios y vehículos de este proceso, y si el change stream que las invalida está conectado
+    responses:
+        200:
+            description: Contadores por caché
+            schema:
+                type: object
+                properties:
+                    usuarios:
+                        type: object
+                        description: Contadores de la caché de usuarios
+                    vehiculos:
+                        type: object
+                        description: Contadores de la caché de vehículos
+                    cambios:
+                        type: object
+                        description: Estado del change stream que invalida las cachés
+        401:
+            description: Falta el token de administración (ADMIN_TOKEN) o no es válido
+        404:
+            description: Las rutas de administración están desactivadas, sin ADMIN_TOKEN
+    """
+    return get_cache_stats()
+
+
+@app.route("/metrics", methods=["GET"])
+@admin_only
+def get_metrics_endpoint():
+    """
+    Métricas de Prometheus
+    ---
+    description: Duración, códigos y tamaño de las respuestas por ruta, duración de los comandos de MongoDB por colección y comando, y espera por conexiones del pool, en formato de texto de Prometheus
+    produces:
+        - text/plain
+    responses:
+        200:
+            description: Métricas en formato de texto de Prometheus
+        401:
+            description: Falta el token de administración (ADMIN_TOKEN) o no es válido
+        404:
+            description: Las rutas de administración están desactivadas, sin ADMIN_TOKEN
+    """
+    return get_metrics()
+
+
+@app.route("/admin/slow-queries", methods=["GET"])
+@admin_only
+def get_slow_queries_endpoint():
+    """
+    Consultas lentas
+    ---
+    description: Obtiene los comandos de MongoDB de este proceso que superaron SLOW_QUERY_MS, con la forma del filtro, el plan ganador y si recorrieron la colección completa
+    parameters:
+        - name: limit
+          in: query
+          type: integer
+          required: false
+          description: Cantidad máxima de entradas, de la más reciente a la más antigua
+    responses:
+        200:
+            description: Consultas lentas
+            schema:
+                type: array
+                items:
+                    type: object
+                    properties:
+                        fecha:
+                            type: string
+                        route:
+                            type: string
+                            description: Plantilla de la ruta que ejecutó el comando
+                        collection:
+                            type: string
+                        command:
+                            type: string
+                        duration_ms:
+                            type: number
+                        shape:
+                            type: object
+                            description: Filtro con los valores reemplazados por "?"
+                        plan:
+                            type: string
+                            description: Etapas del plan ganador, null mientras se obtiene el explain
+                        collscan:
+                            type: boolean
+        400:
+            description: Límite inválido
+        401:
+            description: Falta el token de administración (ADMIN_TOKEN) o no es válido
+        404:
+            description: Las rutas de administración están desactivadas, sin ADMIN_TOKEN
+    """
+    return get_slow_queries(request.args.get("limit"))
+
+
 if __name__ == "__main__":
+    # creamos los índices declarados en utils/indexes.py; con gunicorn se crean en
+    # when_ready (ver gunicorn.conf.py)
+    if os.environ.get("MONGO_ENSURE_INDEXES", "1") == "1":
+        bootstrap_indexes(mongo.db)
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,272 @@
+import asyncio
+import os
+
+from pymongo import MongoClient
+from quart import Quart, request
+from utils.async_mongo import AsyncPyMongo
+from utils.common import DEFAULT_MONGO_URI, mongo_client_options
+from utils.metrics import MONGO_LISTENERS, AsgiMetricsMiddleware
+from utils.slow_queries import slow_queries
+
+# Variante asíncrona de app.py: mismas rutas y tareas de fondo, servidas con Quart y
+# el cliente asíncrono de pymongo. Se ejecuta con: hypercorn app_async:app --bind 0.0.0.0:5000
+# La documentación Swagger se publica desde app.py.
+
+app = Quart(__name__)
+app.config["MONGO_URI"] = os.environ.get("MONGO_URI", DEFAULT_MONGO_URI)
+mongo_event_listeners = [*MONGO_LISTENERS, slow_queries]
+mongo = AsyncPyMongo(
+    app, event_listeners=mongo_event_listeners, **mongo_client_options()
+)
+# los hilos del proceso (explain de las consultas lentas, barrido y change stream) no
+# pueden usar el cliente asíncrono, que pertenece al event loop; usan este, que se
+# conecta al primer uso
+sync_client = MongoClient(
+    app.config["MONGO_URI"], connect=False, **mongo_client_options()
+)
+slow_queries.bind(lambda: sync_client)
+
+from crud_async.users import *
+from crud_async.vehicles import *
+from crud_async.reserves import *
+from crud_async.admin import *
+from utils.async_utils import admin_only, conditional, run_maintenance
+from utils.cache import user_cache, vehicle_cache
+from utils.change_stream import change_listener
+from utils.indexes import bootstrap_indexes_async
+from utils.sweeper import sweeper
+
+
+@app.before_serving
+async def bootstrap():
+    # creamos los índices declarados en utils/indexes.py
+    if os.environ.get("MONGO_ENSURE_INDEXES", "1") == "1":
+        await bootstrap_indexes_async(mongo.db)
+
+    # barrido periódico y change stream, como en app.py: los hilos toman la concesión y
+    # leen el stream con el cliente síncrono, y el barrido se ejecuta en el event loop
+    loop = asyncio.get_running_loop()
+    sweeper.bind(
+        sync_client.get_database,
+        lambda: asyncio.run_coroutine_threadsafe(run_maintenance(), loop).result(),
+    )
+    change_listener.bind(sync_client.get_database)
+    if os.environ.get("BACKGROUND_TASKS", "1") == "1":
+        sweeper.start()
+        change_listener.start()
+
+
+# métricas de Prometheus por ruta, publicadas en /metrics
+app.asgi_app = AsgiMetricsMiddleware(app, app.asgi_app)
+
+
+# Rutas usuarios
+
+
+@app.route("/users", methods=["GET"])
+@conditional("usuarios")
+async def get_users_endpoint():
+    return await get_users(
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
+
+
+@app.route("/users/<id>", methods=["GET"])
+@conditional("usuarios", "id", user_cache)
+async def get_user_by_id_endpoint(id):
+    return await get_user_by_id(
+        id, request.args.get("fields"), request.args.get("exclude")
+    )
+
+
+@app.route("/users/<id>/historial", methods=["GET"])
+@conditional("usuarios", "id")
+async def get_user_historial_endpoint(id):
+    return await get_user_historial(
+        id, request.args.get("limit"), request.args.get("offset")
+    )
+
+
+@app.route("/users", methods=["POST"])
+async def create_user_endpoint():
+    user = await request.get_json()
+    return await create_user(user)
+
+
+@app.route("/users/<id>", methods=["PUT"])
+async def update_user_endpoint(id):
+    user = await request.get_json()
+    return await update_user(id, user)
+
+
+@app.route("/users/<id>", methods=["DELETE"])
+async def delete_user_endpoint(id):
+    return await delete_user(id)
+
+
+# rutas de vehiculos
+
+
+@app.route("/vehicles", methods=["GET"])
+@conditional("vehiculos")
+async def get_vehicles_endpoint():
+    return await get_vehicles(
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
+
+
+@app.route("/vehicles/available", methods=["GET"])
+async def get_available_vehicles_endpoint():
+    return await get_available_vehicles(
+        request.args.get("from"),
+        request.args.get("to"),
+        request.args.get("tipo"),
+        request.args.get("limit"),
+        request.args.get("after"),
+    )
+
+
+@app.route("/vehicles/occupancy", methods=["GET"])
+async def get_occupancy_endpoint():
+    return await get_occupancy(request.args.get("days"), request.args.get("tipo"))
+
+
+@app.route("/vehicles/<id>", methods=["GET"])
+@conditional("vehiculos", "id", vehicle_cache)
+async def get_vehicle_by_id_endpoint(id):
+    return await get_vehicle_by_id(
+        id, request.args.get("fields"), request.args.get("exclude")
+    )
+
+
+@app.route("/vehicles", methods=["POST"])
+async def create_vehicle_endpoint():
+    vehicle = await request.get_json()
+    return await create_vehicle(vehicle)
+
+
+@app.route("/vehicles/<id>", methods=["PUT"])
+async def update_vehicle_endpoint(id):
+    vehicle = await request.get_json()
+    return await update_vehicle(id, vehicle)
+
+
+@app.route("/vehicles/<id>", methods=["DELETE"])
+async def delete_vehicle_endpoint(id):
+    return await delete_vehicle(id)
+
+
+# Rutas reservas
+
+
+@app.route("/reserve", methods=["GET"])
+async def get_reserves_endpoint():
+    return await get_reserves(
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
+
+
+@app.route("/reserve/export", methods=["GET"])
+async def export_reserves_endpoint():
+    return await export_reserves(
+        request.args.get("format"),
+        request.args.get("from"),
+        request.args.get("to"),
+        request.args.get("estado"),
+        request.args.get("join"),
+    )
+
+
+@app.route("/reserve", methods=["POST"])
+async def create_reservation_endpoint():
+    reservation = await request.get_json()
+    return await create_reservation(reservation)
+
+
+@app.route("/reserve/bulk", methods=["POST"])
+async def create_reservations_bulk_endpoint():
+    reservations = await request.get_json()
+    return await create_reservations_bulk(reservations)
+
+
+@app.route("/reserve/<id>", methods=["PUT"])
+async def cancel_reservation_endpoint(id):
+    return await cancel_reservation(id)
+
+
+@app.route("/reserve/user/<id>", methods=["PUT"])
+async def activate_user_endpoint(id):
+    return await activate_user(id)
+
+
+@app.route("/reserve/user/<id>", methods=["GET"])
+async def get_reservations_by_user_endpoint(id):
+    return await get_reservations_by_user(
+        id,
+        request.args.get("limit"),
+        request.args.get("after"),
+        request.args.get("fields"),
+        request.args.get("exclude"),
+    )
+
+
+@app.route("/reserve/vehicle/", methods=["GET"])
+async def get_most_reserved_vehicle_endpoint():
+    return await get_most_reserved_vehicle()
+
+
+@app.route("/reserve/vehicles/<int:limit>", methods=["GET"])
+async def get_most_reserved_vehicles_endpoint(limit):
+    return await get_most_reserved_vehicles(limit)
+
+
+@app.route("/reserve/users/<int:limit>", methods=["GET"])
+async def get_most_canceling_user_limit(limit):
+    return await get_most_canceling_user(limit, request.args.get("days"))
+
+
+@app.route("/reserve/finished/<id>", methods=["PUT"])
+async def finished_reservation_endpoint(id):
+    return await finished_reservation(id)
+
+
+# Rutas administración
+
+
+@app.route("/admin/cache", methods=["GET"])
+@admin_only
+async def get_cache_stats_endpoint():
+    return await get_cache_stats()
+
+
+@app.route("/metrics", methods=["GET"])
+@admin_only
+async def get_metrics_endpoint():
+    return await get_metrics()
+
+
+@app.route("/admin/slow-queries", methods=["GET"])
+@admin_only
+async def get_slow_queries_endpoint():
+    return await get_slow_queries(request.args.get("limit"))
+
+
+@app.after_serving
+async def shutdown():
+    # se espera en otro hilo: el barrido en curso necesita el event loop para terminar
+    await asyncio.to_thread(sweeper.stop, 30)
+    await asyncio.to_thread(change_listener.stop, 30)
+    sync_client.close()
+
+
+if __name__ == "__main__":
+    app.run(debug=True, host="0.0.0.0", port=5000)
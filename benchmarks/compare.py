@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+
+
+def compare(before, after, metric="p95_ms", threshold=1.2):
+    """
+    Compara dos reportes de benchmarks/run.py ruta por ruta
+
+    Args:
+        before: Reporte de referencia
+        after: Reporte nuevo
+        metric: Métrica a comparar
+        threshold: Cociente after / before a partir del cual hay una regresión
+    returns:
+        list[tuple]: (tamaño, ruta, valor anterior, valor nuevo, cociente, regresión)
+    """
+    previous = {
+        (size["usuarios"], size["vehiculos"], size["reservas"]): size["routes"]
+        for size in before["sizes"]
+    }
+    rows = []
+    for size in after["sizes"]:
+        key = (size["usuarios"], size["vehiculos"], size["reservas"])
+        for route, result in size["routes"].items():
+            old = previous.get(key, {}).get(route)
+            if old is None:
+                continue
+            ratio = result[metric] / old[metric] if old[metric] else float("inf")
+            rows.append(
+                (
+                    ":".join(map(str, key)),
+                    route,
+                    old[metric],
+                    result[metric],
+                    ratio,
+                    ratio > threshold,
+                )
+            )
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dos reportes de benchmark")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--metric", default="p95_ms")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+    rows = compare(before, after, args.metric, args.threshold)
+    for size, route, old, new, ratio, regression in rows:
+        flag = "REGRESSION" if regression else ""
+        print(f"{size:>20} {route:<32} {old:>10.3f} {new:>10.3f} {ratio:>6.2f}x {flag}")
+    # código de salida 1 si alguna ruta empeoró más que el umbral, para usarlo en CI
+    sys.exit(1 if any(row[5] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from utils.availability import AvailabilityIndex
+from utils.common import (
+    HISTORIAL_RECENT,
+    HISTORIAL_BUCKET_SIZE,
+    blocked_until,
+    historial_entry,
+    occupancy_slots,
+)
+
+COLLECTIONS = [
+    "usuarios",
+    "vehiculos",
+    "reservas",
+    "cancelaciones",
+    "cancelaciones_ventana",
+    "conteo_reservas",
+    "versiones",
+    "ocupacion",
+    "historial_buckets",
+]
+VEHICLE_TYPES = ["sedan", "suv", "hatchback", "pickup", "van"]
+BATCH_SIZE = 1000
+
+
+def _ids(rng, count):
+    # ObjectId deterministas: el mismo seed produce los mismos _id
+    return [ObjectId(rng.getrandbits(96).to_bytes(12, "big")) for _ in range(count)]
+
+
+def _insert(collection, documents):
+    for start in range(0, len(documents), BATCH_SIZE):
+        collection.insert_many(documents[start : start + BATCH_SIZE], ordered=False)
+
+
+def generate(
+    db,
+    users=100,
+    vehicles=20,
+    reservations=1000,
+    seed=0,
+    cancel_rate=0.15,
+    now=None,
+):
+    """
+    Llena una base de datos con usuarios, vehículos y reservas generados a partir de un
+    seed, con el mismo formato que producen los endpoints de la API
+
+    Unos pocos vehículos concentran la mayoría de las reservas, así que muchas solicitudes
+    chocan entre sí: las que se superponen con una reserva vigente quedan canceladas,
+    igual que una fracción cancel_rate del resto. Las reservas que ya terminaron quedan
+    en estado terminada. Borra antes las colecciones de la API.
+
+    Args:
+        db: Base de datos de pymongo (o mongomock)
+        users: Cantidad de usuarios
+        vehicles: Cantidad de vehículos
+        reservations: Cantidad de reservas
+        seed: Semilla del generador
+        cancel_rate: Fracción de reservas sin conflicto que se cancelan
+        now: Fecha de referencia, por defecto la fecha actual sin hora
+    returns:
+        dict: _id generados por colección y reservas por estado
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for name in COLLECTIONS:
+        db.drop_collection(name)
+
+    user_ids = _ids(rng, users)
+    vehicle_ids = _ids(rng, vehicles)
+    reservation_ids = _ids(rng, reservations)
+    # distribución de Zipf: el vehículo i recibe reservas en proporción a 1 / (i + 1)
+    weights = [1 / (rank + 1) for rank in range(vehicles)]
+
+    taken = AvailabilityIndex(ttl=float("inf"))
+    for vehicle_id in vehicle_ids:
+        taken.load(vehicle_id, [])
+
+    historial = {user_id: [] for user_id in user_ids}
+    windows = {user_id: {} for user_id in user_ids}
+    counters = {}
+    cancellations = []
+    documents = []
+    by_state = {"activa": [], "cancelado": [], "terminada": []}
+    for reservation_id in reservation_ids:
+        user_id = rng.choice(user_ids)
+        vehicle_id = rng.choices(vehicle_ids, weights)[0]
+        start = now + timedelta(days=rng.randint(-60, 120))
+        end = start + timedelta(days=rng.randint(1, 7))
+        _, conflict = taken.find_conflict(vehicle_id, start, end)
+        if conflict is not None or rng.random() < cancel_rate:
+            estado = "cancelado"
+        else:
+            estado = "terminada" if end < now else "activa"
+            taken.add(vehicle_id, reservation_id, start, end)
+        documents.append(
+            {
+                "_id": reservation_id,
+                "id_usuario": user_id,
+                "id_vehiculo": vehicle_id,
+                "fecha_inicio": start,
+                "fecha_fin": end,
+                "estado": estado,
+            }
+        )
+        by_state[estado].append(reservation_id)
+        counters[vehicle_id] = counters.get(vehicle_id, 0) + 1
+        entry = historial_entry(reservation_id, start)
+        if estado == "cancelado":
+            entry["estado"] = "cancelado"
+            when = now - timedelta(
+                days=rng.randint(0, 14), minutes=rng.randint(0, 1439)
+            )
+            cancellations.append(
+                {"fecha": when, "id_usuario": user_id, "id_reserva": reservation_id}
+            )
+            day = when.strftime("%Y-%m-%d")
+            windows[user_id][day] = windows[user_id].get(day, 0) + 1
+        historial[user_id].append(entry)
+
+    users = []
+    for index, user_id in enumerate(user_ids):
+        until = blocked_until(windows[user_id], now)
+        user = {
+            "_id": user_id,
+            "nombre": f"Usuario {index}",
+            "email": f"usuario{index}@example.com",
+            "estado": until is not None,
+            "historial_reservas": historial[user_id][-HISTORIAL_RECENT:],
+            "historial_total": len(historial[user_id]),
+        }
+        if until is not None:
+            user["bloqueado_hasta"] = until
+        users.append(user)
+    _insert(db.usuarios, users)
+    _insert(
+        db.vehiculos,
+        [
+            {
+                "_id": vehicle_id,
+                "placa": f"BEN{index:05d}",
+                "tipo": rng.choice(VEHICLE_TYPES),
+                "disponibilidad": True,
+            }
+            for index, vehicle_id in enumerate(vehicle_ids)
+        ],
+    )
+    _insert(db.reservas, documents)
+    _insert(
+        db.ocupacion,
+        [
+            slot
+            for document in documents
+            if document["estado"] == "activa"
+            for slot in occupancy_slots(document)
+        ],
+    )
+    _insert(
+        db.historial_buckets,
+        [
+            {
+                "id_usuario": user_id,
+                "seq": start // HISTORIAL_BUCKET_SIZE,
+                "cantidad": len(entries[start : start + HISTORIAL_BUCKET_SIZE]),
+                "entradas": entries[start : start + HISTORIAL_BUCKET_SIZE],
+            }
+            for user_id, entries in historial.items()
+            for start in range(0, len(entries), HISTORIAL_BUCKET_SIZE)
+        ],
+    )
+    _insert(db.cancelaciones, cancellations)
+    _insert(
+        db.cancelaciones_ventana,
+        [{"_id": user_id, "dias": days} for user_id, days in windows.items() if days],
+    )
+    _insert(
+        db.conteo_reservas,
+        [
+            {"_id": vehicle_id, "cantidad": count}
+            for vehicle_id, count in counters.items()
+        ],
+    )
+    return {
+        "usuarios": user_ids,
+        "vehiculos": vehicle_ids,
+        "reservas": by_state,
+    }
@@ -0,0 +1,404 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+# El arranque de app.py no debe barrer reservas vencidas ni observar cambios: el
+# benchmark prepara su propia base de datos antes de medir
+os.environ.setdefault("SWEEPER_INTERVAL", "0")
+os.environ.setdefault("CHANGE_STREAM", "0")
+# /admin/cache es una de las rutas medidas
+os.environ.setdefault("ADMIN_TOKEN", "benchmark")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import generate
+
+DEFAULT_URI = "mongodb://localhost:27017/reservas_bench"
+DEFAULT_SIZES = "100:20:1000,1000:100:10000"
+
+
+def percentile(values, q):
+    """
+    Percentil por rango más cercano
+
+    Args:
+        values: Lista ordenada de valores
+        q: Percentil entre 0 y 100
+    returns:
+        float: Valor del percentil
+    """
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[index]
+
+
+def summarize(durations, statuses):
+    """
+    Resume los tiempos de una ruta
+
+    Args:
+        durations: Duración de cada solicitud en segundos
+        statuses: Código HTTP de cada solicitud
+    returns:
+        dict: Percentiles en milisegundos, solicitudes por segundo y códigos HTTP
+    """
+    ordered = sorted(durations)
+    codes = {}
+    for status in statuses:
+        codes[str(status)] = codes.get(str(status), 0) + 1
+    return {
+        "requests": len(ordered),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "throughput_rps": round(len(ordered) / sum(ordered), 1),
+        "status": codes,
+    }
+
+
+def scenarios(data, rng):
+    """
+    Solicitudes de cada ruta de app.py, en el orden en que se miden: primero las
+    lecturas y al final las escrituras que consumen los datos generados
+
+    Args:
+        data: Resultado de benchmarks.generator.generate
+        rng: Generador aleatorio con seed
+    returns:
+        list[tuple]: (nombre, regla de la ruta, función i -> (método, url, kwargs))
+    """
+    users = [str(id) for id in data["usuarios"]]
+    vehicles = [str(id) for id in data["vehiculos"]]
+    active = [str(id) for id in data["reservas"]["activa"]]
+    # las rutas que borran o modifican consumen cada una su propia porción de datos
+    half = len(active) // 2
+    to_cancel, to_finish = active[:half], active[half:]
+    deletable_users = users[len(users) // 2 :]
+    deletable_vehicles = vehicles[len(vehicles) // 2 :]
+    today = datetime.now()
+
+    def new_reservation(i):
+        start = today + timedelta(days=rng.randint(200, 2000))
+        return {
+            "id_usuario": rng.choice(users),
+            "id_vehiculo": rng.choice(vehicles),
+            "fecha_inicio": start.strftime("%Y-%m-%d"),
+            "fecha_fin": (start + timedelta(days=rng.randint(1, 5))).strftime(
+                "%Y-%m-%d"
+            ),
+        }
+
+    def available_range():
+        start = today + timedelta(days=rng.randint(0, 120))
+        end = start + timedelta(days=rng.randint(1, 7))
+        return f"from={start:%Y-%m-%d}&to={end:%Y-%m-%d}"
+
+    def take(items, i):
+        return items[i % len(items)] if items else str(None)
+
+    return [
+        ("GET /users", "/users", lambda i: ("get", "/users?limit=100", {})),
+        (
+            "GET /users (304)",
+            "/users",
+            lambda i: ("get", "/users?limit=100", {"etag": True}),
+        ),
+        (
+            "GET /users/<id>",
+            "/users/<id>",
+            lambda i: ("get", f"/users/{rng.choice(users)}", {}),
+        ),
+        (
+            "GET /users/<id>/historial",
+            "/users/<id>/historial",
+            lambda i: ("get", f"/users/{rng.choice(users)}/historial?limit=50", {}),
+        ),
+        ("GET /vehicles", "/vehicles", lambda i: ("get", "/vehicles?limit=100", {})),
+        (
+            "GET /vehicles/<id>",
+            "/vehicles/<id>",
+            lambda i: ("get", f"/vehicles/{rng.choice(vehicles)}", {}),
+        ),
+        (
+            "GET /vehicles/available",
+            "/vehicles/available",
+            lambda i: ("get", f"/vehicles/available?{available_range()}&limit=100", {}),
+        ),
+        (
+            "GET /vehicles/occupancy",
+            "/vehicles/occupancy",
+            lambda i: ("get", "/vehicles/occupancy", {}),
+        ),
+        ("GET /reserve", "/reserve", lambda i: ("get", "/reserve?limit=100", {})),
+        (
+            "GET /reserve/export",
+            "/reserve/export",
+            lambda i: ("get", "/reserve/export?format=csv&join=1", {}),
+        ),
+        (
+            "GET /reserve/user/<id>",
+            "/reserve/user/<id>",
+            lambda i: ("get", f"/reserve/user/{rng.choice(users)}?limit=100", {}),
+        ),
+        (
+            "GET /reserve/vehicle/",
+            "/reserve/vehicle/",
+            lambda i: ("get", "/reserve/vehicle/", {}),
+        ),
+        (
+            "GET /reserve/vehicles/<limit>",
+            "/reserve/vehicles/<int:limit>",
+            lambda i: ("get", "/reserve/vehicles/10", {}),
+        ),
+        (
+            "GET /reserve/users/<limit>",
+            "/reserve/users/<int:limit>",
+            lambda i: ("get", "/reserve/users/10?days=7", {}),
+        ),
+        (
+            "GET /admin/cache",
+            "/admin/cache",
+            lambda i: (
+                "get",
+                "/admin/cache",
+                {"headers": {"Authorization": f"Bearer {os.environ['ADMIN_TOKEN']}"}},
+            ),
+        ),
+        (
+            "POST /users",
+            "/users",
+            lambda i: (
+                "post",
+                "/users",
+                {"json": {"nombre": f"Bench {i}", "email": f"bench{i}@example.com"}},
+            ),
+        ),
+        (
+            "PUT /users/<id>",
+            "/users/<id>",
+            lambda i: (
+                "put",
+                f"/users/{take(users, i)}",
+                {"json": {"nombre": f"Usuario {i}", "email": f"put{i}@example.com"}},
+            ),
+        ),
+        (
+            "POST /vehicles",
+            "/vehicles",
+            lambda i: (
+                "post",
+                "/vehicles",
+                {"json": {"placa": f"NEW{i:05d}", "tipo": "suv"}},
+            ),
+        ),
+        (
+            "PUT /vehicles/<id>",
+            "/vehicles/<id>",
+            lambda i: (
+                "put",
+                f"/vehicles/{take(vehicles, i)}",
+                {
+                    "json": {
+                        "placa": f"PUT{i:05d}",
+                        "tipo": "sedan",
+                        "disponibilidad": True,
+                    }
+                },
+            ),
+        ),
+        (
+            "POST /reserve",
+            "/reserve",
+            lambda i: ("post", "/reserve", {"json": new_reservation(i)}),
+        ),
+        (
+            "POST /reserve/bulk",
+            "/reserve/bulk",
+            lambda i: (
+                "post",
+                "/reserve/bulk",
+                {"json": [new_reservation(i) for _ in range(50)]},
+            ),
+        ),
+        (
+            "PUT /reserve/<id>",
+            "/reserve/<id>",
+            lambda i: ("put", f"/reserve/{take(to_cancel, i)}", {}),
+        ),
+        (
+            "PUT /reserve/finished/<id>",
+            "/reserve/finished/<id>",
+            lambda i: ("put", f"/reserve/finished/{take(to_finish, i)}", {}),
+        ),
+        (
+            "PUT /reserve/user/<id>",
+            "/reserve/user/<id>",
+            lambda i: ("put", f"/reserve/user/{take(users, i)}", {}),
+        ),
+        (
+            "DELETE /users/<id>",
+            "/users/<id>",
+            lambda i: ("delete", f"/users/{take(deletable_users, i)}", {}),
+        ),
+        (
+            "DELETE /vehicles/<id>",
+            "/vehicles/<id>",
+            lambda i: ("delete", f"/vehicles/{take(deletable_vehicles, i)}", {}),
+        ),
+    ]
+
+
+def measure(client, request, requests):
+    """
+    Ejecuta una ruta requests veces con el cliente de pruebas de Flask
+
+    Args:
+        client: Cliente de pruebas de Flask
+        request: Función i -> (método, url, kwargs)
+        requests: Cantidad de solicitudes
+    returns:
+        dict: Resumen de tiempos, ver summarize
+    """
+    durations = []
+    statuses = []
+    for i in range(requests):
+        method, url, kwargs = request(i)
+        if kwargs.pop("etag", False):
+            etag = client.get(url).headers.get("ETag")
+            kwargs["headers"] = {"If-None-Match": etag} if etag else {}
+        start = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        response.get_data()
+        durations.append(time.perf_counter() - start)
+        statuses.append(response.status_code)
+    return summarize(durations, statuses)
+
+
+def in_memory_database():
+    """
+    Base de datos en memoria con mongomock, para medir sin un mongod
+
+    Los tiempos no son comparables con los de MongoDB, pero sirven para comparar el
+    costo en Python de la API entre commits.
+    mongomock no implementa $lookup con pipeline, así que /vehicles/available responde
+    500 con este backend.
+    """
+    import mongomock
+    from tests.conftest import patch_mongomock
+
+    patch_mongomock()
+    return mongomock.MongoClient()["reservas_bench"]
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de las rutas de app.py")
+    parser.add_argument(
+        "--backend",
+        choices=["mongod", "memory"],
+        default="mongod",
+        help="mongod usa --uri, memory usa mongomock",
+    )
+    parser.add_argument("--uri", default=DEFAULT_URI, help="se borra su contenido")
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="tamaños usuarios:vehículos:reservas separados por coma",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="solicitudes por ruta"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="archivo JSON de resultados")
+    args = parser.parse_args(argv)
+
+    if args.backend == "mongod":
+        os.environ["MONGO_URI"] = args.uri
+    from app import app, mongo
+    from utils.availability import availability
+    from utils.cache import seen_versions, user_cache, vehicle_cache
+    from utils.indexes import ensure_indexes
+    from utils.occupancy import occupancy
+
+    if args.backend == "memory":
+        mongo.db = in_memory_database()
+        mongo.cx = mongo.db.client
+    ensure_indexes(mongo.db)
+
+    routes = {rule.rule for rule in app.url_map.iter_rules()} - {
+        "/static/<path:filename>"
+    }
+    results = []
+    for size in args.sizes.split(","):
+        users, vehicles, reservations = (int(value) for value in size.split(":"))
+        data = generate(mongo.db, users, vehicles, reservations, seed=args.seed)
+        for cache in (user_cache, vehicle_cache, seen_versions):
+            cache.clear()
+        availability.invalidate()
+        occupancy.invalidate()
+        availability.warm(mongo.db.reservas)
+
+        rng = random.Random(args.seed)
+        measured = {}
+        covered = set()
+        with app.test_client() as client:
+            for name, rule, request in scenarios(data, rng):
+                measured[name] = measure(client, request, args.requests)
+                covered.add(rule)
+                print(
+                    f"{size:>20} {name:<32} p50 {measured[name]['p50_ms']:>9.3f} ms"
+                    f"  p99 {measured[name]['p99_ms']:>9.3f} ms"
+                    f"  {measured[name]['throughput_rps']:>9.1f} req/s",
+                    file=sys.stderr,
+                )
+        results.append(
+            {
+                "usuarios": users,
+                "vehiculos": vehicles,
+                "reservas": reservations,
+                "routes": measured,
+            }
+        )
+
+    missing = sorted(
+        route
+        for route in routes - covered
+        if not route.startswith(("/apidocs", "/apispec", "/flasgger", "/oauth2"))
+    )
+    report = {
+        "commit": commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "seed": args.seed,
+        "requests_per_route": args.requests,
+        "sizes": results,
+        "routes_not_measured": missing,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
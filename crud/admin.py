@@ -0,0 +1,58 @@
+from flask import Response, jsonify
+from utils.cache import user_cache, vehicle_cache
+from utils.change_stream import change_listener
+from utils.metrics import metrics_payload
+from utils.serializer import dumps
+from utils.slow_queries import slow_queries
+from utils.common import parse_limit
+
+
+def get_cache_stats():
+    """
+    Obtiene los contadores de las cachés en memoria de este proceso.
+
+    Returns:
+        JSON: Aciertos, fallos, expulsiones y tamaño de cada caché, y estado del change
+        stream que las invalida.
+    """
+    return jsonify(
+        {
+            "usuarios": user_cache.stats(),
+            "vehiculos": vehicle_cache.stats(),
+            "cambios": change_listener.stats(),
+        }
+    )
+
+
+def get_metrics():
+    """
+    Obtiene las métricas de la API en formato de texto de Prometheus.
+
+    Returns:
+        Response: Métricas de todos los workers si PROMETHEUS_MULTIPROC_DIR está definida.
+    """
+    payload, content_type = metrics_payload()
+    return Response(payload, content_type=content_type, status=200)
+
+
+def get_slow_queries(limit=None):
+    """
+    Obtiene los comandos lentos registrados por este proceso.
+
+    Args:
+        limit (str): Cantidad máxima de entradas.
+
+    Returns:
+        JSON: Entradas de la más reciente a la más antigua.
+
+    Raises:
+        HTTPException:
+            - 400: Si el límite es inválido.
+    """
+    try:
+        limit = parse_limit(limit)
+    except Exception as e:
+        message = {"error": "Invalid limit", "message": str(e)}
+        return jsonify(message), 400
+    entries = slow_queries.recent(limit)
+    return Response(dumps(entries), mimetype="application/json", status=200)
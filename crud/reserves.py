@@ -1,25 +1,83 @@
 from app import mongo
-from bson.json_util import dumps
+from utils.serializer import dumps
 from bson import ObjectId
 from flask import Response, jsonify
-from datetime import datetime, timedelta
+from datetime import datetime
+from pymongo.errors import BulkWriteError, PyMongoError
 from utils.utils import *
+from utils.availability import availability
+from utils.occupancy import occupancy
+from utils.cache import cached_find_one, user_cache, vehicle_cache
+from utils.profiles import get_collection
 
 
-def get_reserves():
+def get_reserves(limit=None, after=None, fields=None, exclude=None):
     """
-    Obtiene todas las reservas de la base de datos.
+    Obtiene las reservas de la base de datos, paginadas por _id.
+
+    Args:
+        limit (str): Cantidad máxima de reservas a devolver.
+        after (str): _id de la última reserva de la página anterior.
+        fields (str): Campos a incluir, separados por comas.
+        exclude (str): Campos a excluir, separados por comas.
+
+    Returns:
+        list[reservation]: Una página de las reservas registradas.
+
+    Raises:
+        HTTPException:
+            - 400: Si los parámetros de paginación o de campos son inválidos.
+            - 500: Si ocurre un error inesperado al obtener las reservas.
+    """
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    return paginated_response(
+        get_collection(mongo.db, "reservas", "lists"), {}, limit, after, projection
+    )
+
+
+def export_reserves(
+    format=None, start_date=None, end_date=None, estado=None, join=None
+):
+    """
+    Exporta las reservas en NDJSON o CSV, transmitidas por lotes.
+
+    Args:
+        format (str): "ndjson" (por defecto) o "csv".
+        start_date (str): Primer día de fecha_inicio (YYYY-MM-DD).
+        end_date (str): Último día de fecha_inicio (YYYY-MM-DD).
+        estado (str): Estado de las reservas.
+        join (str): "1" o "true" para agregar el email del usuario y la placa.
 
     Returns:
-        list[reservation]: Una lista de todas las reservas registrados.
+        Response: Las reservas ordenadas por fecha_inicio.
 
     Raises:
         HTTPException:
-            - 500: Si ocurre un error inesperado al obtener los usuarios.
+            - 400: Si el formato, las fechas o el estado son inválidos.
     """
-    reservations = mongo.db.reservas.find()
-    reservations = dumps(reservations)
-    return Response(reservations, mimetype="application/json", status=200)
+    format = format or "ndjson"
+    if format not in EXPORT_FORMATS:
+        message = {"error": "Invalid format", "message": "Use 'ndjson' or 'csv'"}
+        return jsonify(message), 400
+    try:
+        query = export_query(start_date, end_date, estado)
+    except ValueError as e:
+        return jsonify({"error": "Invalid filters", "message": str(e)}), 400
+    return Response(
+        export_reservations(query, format, join in ("1", "true")),
+        mimetype=EXPORT_FORMATS[format],
+        status=200,
+        headers={"Content-Disposition": f"attachment; filename=reservas.{format}"},
+    )
 
 
 def create_reservation(reservation):
@@ -50,39 +108,37 @@ def create_reservation(reservation):
         return jsonify(message), 400
 
     # Verificamos si existe el usuario
-    user = mongo.db.usuarios.find_one({"_id": user_id})
+    user = get_collection(mongo.db, "usuarios", "primary").find_one(
+        {"_id": user_id}, USER_BLOCK_PROJECTION
+    )
     if user is None:
         return jsonify({"error": "User not found"}), 404
 
-    if user["estado"]:
+    if is_blocked(user):
         return (
             jsonify(
                 {
-                    "error": "User temporarily blocked from making reservations.",
+                    "error": USER_BLOCKED,
                     "message": "This user has temporary restrictions on making new reservations. Please try again later.",
                 }
             ),
             403,
         )
     # Verificamos si existe el vehiculo
-    vehicle = mongo.db.vehiculos.find_one({"_id": vehicle_id})
+    vehicle = cached_find_one(
+        vehicle_cache, get_collection(mongo.db, "vehiculos", "primary"), vehicle_id
+    )
     if vehicle is None:
         return jsonify({"error": "Vehicle not found"}), 404
 
     # Convertir las fechas de inicio y fin
     try:
-        start_date = datetime.strptime(start_date, "%Y-%m-%d").replace(
-            hour=0, minute=0, second=0
-        )
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").replace(
-            hour=0, minute=0, second=0
-        )
+        start_date, end_date = parse_reservation_dates(start_date, end_date)
     except ValueError as e:
         return jsonify({"error": "Invalid date format", "message": str(e)}), 400
 
     # Validar que la fecha de inicio sea en el futuro y que la fecha de fin sea posterior
-    today_date = datetime.now().date()
-    if start_date > end_date or start_date.date() < today_date:
+    if not valid_reservation_dates(start_date, end_date):
         return (
             jsonify(
                 {
@@ -91,29 +147,47 @@ def create_reservation(reservation):
             ),
             400,
         )
+    if not valid_reservation_length(start_date, end_date):
+        return (
+            jsonify(
+                {
+                    "error": f"Reservation too long. The maximum is {MAX_RESERVATION_DAYS} days."
+                }
+            ),
+            400,
+        )
 
     # Verificar si ya existe una reserva activa para el vehículo en las fechas solicitadas
     reservation = check_reserve(vehicle_id, start_date, end_date)
 
     if reservation:
         response = {
-            "message": "there are already active reservations for these dates",
+            "message": RESERVATION_CONFLICT,
             "reservation": reservation,
         }
         return Response(dumps(response), mimetype="application/json", status=400)
 
     # Defino el JSON para crear la reserva
-    reservation = {
-        "id_usuario": user_id,
-        "id_vehiculo": vehicle_id,
-        "fecha_inicio": start_date,
-        "fecha_fin": end_date,
-        "estado": "activa",
-    }
+    reservation = new_reservation(user_id, vehicle_id, start_date, end_date)
+
+    # Ocupamos los días del vehículo; el índice único rechaza a la solicitud concurrente
+    # que llegue segunda aunque ambas hayan pasado check_reserve
+    if claim_slots([reservation]):
+        response = {
+            "message": RESERVATION_CONFLICT,
+            "reservation": find_slot_conflict(reservation),
+        }
+        return Response(dumps(response), mimetype="application/json", status=400)
 
     # Insertar la nueva reserva en la base de datos
-    result = mongo.db.reservas.insert_one(reservation)
-    reservation["_id"] = result.inserted_id
+    try:
+        mongo.db.reservas.insert_one(reservation)
+    except PyMongoError:
+        release_slots([reservation["_id"]])
+        raise
+    availability.add(vehicle_id, reservation["_id"], start_date, end_date)
+    occupancy.add(vehicle_id, start_date, end_date)
+    update_reservation_counters({vehicle_id: 1})
 
     # Actualizamos el historial de reservas
     update_historial(user_id, reservation["_id"], start_date)
@@ -122,6 +196,129 @@ def create_reservation(reservation):
     return Response(dumps(reservation), mimetype="application/json", status=201)
 
 
+def create_reservations_bulk(reservations):
+    """
+    Crea varias reservas en una sola operación.
+
+    Los usuarios y vehículos se validan con una consulta $in por colección, los conflictos
+    (también entre reservas del mismo lote) se revisan en una sola pasada, las reservas se
+    insertan con insert_many y los historiales se actualizan con append_historial.
+
+    Args:
+        reservations (list[dict]): Reservas a crear, cada una con id_usuario, id_vehiculo, fecha_inicio, fecha_fin.
+
+    returns:
+        list[result]: Un resultado por reserva, en el mismo orden, con index, status y _id o error.
+
+    Raises:
+        HTTPException:
+            - 400: Si el cuerpo no es una lista o supera MAX_BULK_RESERVATIONS.
+    """
+    if not isinstance(reservations, list) or not reservations:
+        return jsonify({"error": "Expected a non-empty list of reservations"}), 400
+    if len(reservations) > MAX_BULK_RESERVATIONS:
+        return (
+            jsonify(
+                {
+                    "error": f"Too many reservations, the maximum is {MAX_BULK_RESERVATIONS}"
+                }
+            ),
+            400,
+        )
+
+    # Validamos ids y fechas sin consultar la base de datos
+    results, candidates = bulk_candidates(reservations)
+
+    # Una consulta $in por colección para usuarios y vehículos
+    users = {}
+    vehicles = set()
+    if candidates:
+        user_ids = list({candidate[1] for candidate in candidates})
+        vehicle_ids = list({candidate[2] for candidate in candidates})
+        users = {
+            user["_id"]: user
+            for user in get_collection(mongo.db, "usuarios", "primary").find(
+                {"_id": {"$in": user_ids}}, USER_BLOCK_PROJECTION
+            )
+        }
+        vehicles = {
+            vehicle["_id"]
+            for vehicle in get_collection(mongo.db, "vehiculos", "primary").find(
+                {"_id": {"$in": vehicle_ids}}, {"_id": 1}
+            )
+        }
+    valid = bulk_valid(candidates, users, vehicles, results)
+
+    # Revisamos los conflictos con las reservas activas que pueden chocar con el lote
+    documents = []
+    if valid:
+        active = get_collection(mongo.db, "reservas", "primary").find(
+            bulk_active_query(valid),
+            {"id_vehiculo": 1, "fecha_inicio": 1, "fecha_fin": 1},
+        )
+        documents = bulk_reservations(valid, active, results)
+
+    # Ocupamos los días de todas las reservas aceptadas en una sola operación
+    failed = set()
+    if documents:
+        rejected = claim_slots([reservation for _, reservation in documents])
+        accepted = []
+        for index, reservation in documents:
+            if reservation["_id"] in rejected:
+                results[index] = {
+                    "index": index,
+                    "status": 400,
+                    "error": RESERVATION_CONFLICT,
+                    "reservation": find_slot_conflict(reservation),
+                }
+            else:
+                accepted.append((index, reservation))
+        documents = accepted
+
+    # Insertamos todas las reservas aceptadas en una sola operación
+    if documents:
+        try:
+            mongo.db.reservas.insert_many(
+                [reservation for _, reservation in documents], ordered=False
+            )
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                index = documents[error["index"]][0]
+                failed.add(index)
+                results[index] = {
+                    "index": index,
+                    "status": 500,
+                    "error": "Reservation could not be created",
+                    "message": error.get("errmsg"),
+                }
+            release_slots(
+                reservation["_id"]
+                for index, reservation in documents
+                if index in failed
+            )
+
+    # Actualizamos los historiales con un bulk_write por colección
+    created, historial, counters = bulk_created(documents, failed, results)
+    for reservation in created:
+        availability.add(
+            reservation["id_vehiculo"],
+            reservation["_id"],
+            reservation["fecha_inicio"],
+            reservation["fecha_fin"],
+        )
+        occupancy.add(
+            reservation["id_vehiculo"],
+            reservation["fecha_inicio"],
+            reservation["fecha_fin"],
+        )
+    if historial:
+        append_historial(historial)
+    if counters:
+        update_reservation_counters(counters)
+
+    return Response(dumps(results), mimetype="application/json", status=200)
+
+
 def cancel_reservation(id):
     try:
         id = ObjectId(id)
@@ -131,26 +328,39 @@ def cancel_reservation(id):
     reservation = mongo.db.reservas.find_one({"_id": id})
     if reservation is None:
         return jsonify({"error": "Reservation not found"}), 404
-    mongo.db.reservas.update_one({"_id": id}, {"$set": {"estado": "cancelado"}})
+    # solo una solicitud cambia la reserva activa; repetirla no vuelve a liberar sus
+    # días ni a contar la cancelación
+    result = mongo.db.reservas.update_one(
+        {"_id": id, "estado": "activa"}, {"$set": {"estado": "cancelado"}}
+    )
+    if result.matched_count == 0:
+        message = {
+            "error": "Reservation is not active",
+            "message": f"Reservation {id} is {reservation['estado']}",
+        }
+        return jsonify(message), 409
+    availability.remove(reservation["id_vehiculo"], id)
+    release_slots([id])
+    occupancy.remove(
+        reservation["id_vehiculo"],
+        reservation["fecha_inicio"],
+        reservation["fecha_fin"],
+    )
 
-    # penalización para usuarios que cancelen +3 veces en una semana (ultimos 7 días)
+    # registro de la cancelación, expira por el índice TTL de cancelaciones.fecha
+    now = datetime.now()
     data = {
-        "fecha": datetime.now(),
+        "fecha": now,
         "id_usuario": reservation["id_usuario"],
         "id_reserva": id,
     }
-    mongo.db.cancelaciones.insert_one(data)
+    get_collection(mongo.db, "cancelaciones", "cancellations_log").insert_one(data)
 
-    seven_days_ago = datetime.now() - timedelta(days=7)
-    count = mongo.db.cancelaciones.count_documents(
-        {"id_usuario": reservation["id_usuario"], "fecha": {"$gte": seven_days_ago}}
-    )
+    # penalización para usuarios que cancelen +3 veces en una semana (ultimos 7 días)
+    _, until = register_cancellation(reservation["id_usuario"], now)
 
     # actualización del historial y estado del usuario
-    mongo.db.usuarios.update_one(
-        {"_id": reservation["id_usuario"], "historial_reservas.reserva_id": id},
-        {"$set": {"historial_reservas.$.estado": "cancelado", "estado": count > 3}},
-    )
+    cancel_historial_entry(reservation["id_usuario"], id, until)
 
     message = {"message": f"Reserva {id} cancelada"}
     return jsonify(message), 200
@@ -162,30 +372,41 @@ def activate_user(id):
     except Exception as e:
         message = {"error": "Invalid ID", "message": str(e)}
         return jsonify(message), 400
-    user = mongo.db.usuarios.find_one({"_id": ObjectId(id)})
-    if user is None:
+    result = mongo.db.usuarios.update_one({"_id": id}, block_update(None))
+    user_cache.invalidate(id)
+    bump_versions("usuarios", [id])
+    if result.matched_count == 0:
         return jsonify({"error": "User not found"}), 404
-
-    mongo.db.usuarios.update_one(
-        {"_id": id},
-        {"$set": {"estado": False}},
-    )
     message = {"message": f"Usuario {id} activado"}
     return jsonify(message), 200
 
 
-def get_reservations_by_user(id):
+def get_reservations_by_user(id, limit=None, after=None, fields=None, exclude=None):
     try:
         id = ObjectId(id)
     except Exception as e:
         message = {"error": "Invalid ID", "message": str(e)}
         return jsonify(message), 400
-    user = mongo.db.usuarios.find_one({"_id": ObjectId(id)})
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    user = mongo.db.usuarios.find_one({"_id": ObjectId(id)}, {"_id": 1})
     if user is None:
         return jsonify({"error": "User not found"}), 404
-    reservations = mongo.db.reservas.find({"id_usuario": id})
-    reservations = dumps(reservations)
-    return Response(reservations, mimetype="application/json", status=200)
+    return paginated_response(
+        get_collection(mongo.db, "reservas", "lists"),
+        {"id_usuario": id},
+        limit,
+        after,
+        projection,
+    )
 
 
 def get_most_reserved_vehicle():
@@ -199,72 +420,113 @@ def get_most_reserved_vehicle():
         HTTPException:
             - 500: Si ocurre un error inesperado al obtener el vehículo más reservado.
     """
-    pipeline = [
-        {"$group": {"_id": "$id_vehiculo", "cantidad": {"$sum": 1}}},
-        {"$sort": {"cantidad": -1}},
-        {"$limit": 1},
-    ]
-    resultado = mongo.db.reservas.aggregate(pipeline)
-    vehicle = list(resultado)
+    # conteo_reservas se mantiene con $inc al crear reservas, ver update_reservation_counters
+    vehicle = get_collection(mongo.db, "conteo_reservas", "analytics").find_one(
+        {}, sort=[("cantidad", -1)]
+    )
     if not vehicle:
         return jsonify({"error": "No reservations found"}), 404
 
-    most_reserved_vehicle_id = vehicle[0]["_id"]
-    vehicle_ = mongo.db.vehiculos.find_one({"_id": most_reserved_vehicle_id})
+    most_reserved_vehicle_id = vehicle["_id"]
+    vehicle_ = cached_find_one(
+        vehicle_cache,
+        get_collection(mongo.db, "vehiculos", "analytics"),
+        most_reserved_vehicle_id,
+    )
     if not vehicle_:
         return jsonify({"error": "Vehicle not found"}), 404
 
     response = {
         "id_vehiculo": most_reserved_vehicle_id,
-        "cantidad_reservas": vehicle[0]["cantidad"],
+        "cantidad_reservas": vehicle["cantidad"],
         "vehiculo": vehicle_,
     }
 
     return Response(dumps(response), mimetype="application/json", status=200)
 
 
-def get_most_canceling_user(limit=1):
+def get_most_reserved_vehicles(limit=1):
+    """
+    Obtiene los vehículos con más reservas.
+
+    Args:
+        limit (int): Número máximo de vehículos a devolver, por defecto 1.
+
+    Returns:
+        JSON: Vehículos con más reservas, de mayor a menor.
+
+    Raises:
+        HTTPException:
+            - 400: Si el límite no es un entero positivo.
+            - 404: Si no hay reservas.
+    """
+    if not isinstance(limit, int) or limit <= 0 or limit > MAX_PAGE_LIMIT:
+        return (
+            jsonify(
+                {"error": f"'limit' must be an integer between 1 and {MAX_PAGE_LIMIT}."}
+            ),
+            400,
+        )
+
+    counters = list(
+        get_collection(mongo.db, "conteo_reservas", "analytics")
+        .find({})
+        .sort("cantidad", -1)
+        .limit(limit)
+    )
+    if not counters:
+        return jsonify({"error": "No reservations found"}), 404
+
+    vehicles = {
+        vehicle["_id"]: vehicle
+        for vehicle in get_collection(mongo.db, "vehiculos", "analytics").find(
+            {"_id": {"$in": [counter["_id"] for counter in counters]}}
+        )
+    }
+    response = [
+        {
+            "id_vehiculo": counter["_id"],
+            "cantidad_reservas": counter["cantidad"],
+            "vehiculo": vehicles[counter["_id"]],
+        }
+        for counter in counters
+        if counter["_id"] in vehicles
+    ]
+
+    return Response(dumps(response), mimetype="application/json", status=200)
+
+
+def get_most_canceling_user(limit=1, days=None):
     """
     Obtiene los usuarios que más han cancelado reservas.
 
+    Los datos de cada usuario se unen en el servidor con $lookup, en la misma consulta.
+
     Args:
         limit (int): Número máximo de usuarios a devolver, por defecto 1.
+        days (str): Si se entrega, solo cuenta las cancelaciones de los últimos días,
+            como máximo CANCELLATION_RETENTION_DAYS.
 
     Returns:
-        JSON: Usuarios con más cancelaciones.
+        JSON: Usuarios con más cancelaciones en el período que se conservan los
+        eventos (CANCELLATION_RETENTION_DAYS).
 
     Raises:
         HTTPException:
+            - 400: Si el límite o los días son inválidos.
             - 500: Si ocurre un error inesperado al obtener los usuarios que más cancelan.
     """
     try:
-        if not isinstance(limit, int) or limit <= 0:
-            return jsonify({"error": "'limit' must be a positive integer."}), 400
-
-        pipeline = [
-            {"$group": {"_id": "$id_usuario", "cantidad_cancelaciones": {"$sum": 1}}},
-            {"$sort": {"cantidad_cancelaciones": -1}},
-            {"$limit": limit},
-        ]
-        resultado = mongo.db.cancelaciones.aggregate(pipeline)
-        users = list(resultado)
-
-        if not users:
-            return jsonify({"error": "No cancellations found"}), 404
-
-        response = []
-        for user in users:
-            user_id = user["_id"]
-            user_details = mongo.db.usuarios.find_one({"_id": user_id})
+        pipeline = most_canceling_pipeline(limit, days)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        response = list(
+            get_collection(mongo.db, "cancelaciones", "analytics").aggregate(pipeline)
+        )
 
-            if user_details:
-                response.append(
-                    {
-                        "id_usuario": user_id,
-                        "cantidad_cancelaciones": user["cantidad_cancelaciones"],
-                        "usuario": user_details,
-                    }
-                )
+        if not response:
+            return jsonify({"error": "No cancellations found"}), 404
 
         return Response(dumps(response), mimetype="application/json", status=200)
 
@@ -281,6 +543,24 @@ def finished_reservation(id):
     reservation = mongo.db.reservas.find_one({"_id": id})
     if reservation is None:
         return jsonify({"error": "Reservation not found"}), 404
-    mongo.db.reservas.update_one({"_id": id}, {"$set": {"estado": "terminada"}})
+    # solo una solicitud cambia la reserva activa; repetirla no vuelve a liberar sus
+    # días ni a contar la cancelación
+    result = mongo.db.reservas.update_one(
+        {"_id": id, "estado": "activa"}, {"$set": {"estado": "terminada"}}
+    )
+    if result.matched_count == 0:
+        message = {
+            "error": "Reservation is not active",
+            "message": f"Reservation {id} is {reservation['estado']}",
+        }
+        return jsonify(message), 409
+    availability.remove(reservation["id_vehiculo"], id)
+    release_slots([id])
+    occupancy.remove(
+        reservation["id_vehiculo"],
+        reservation["fecha_inicio"],
+        reservation["fecha_fin"],
+    )
+    set_historial_estado({reservation["id_usuario"]: [id]}, "terminada")
     message = {"message": f"Reserva {id} terminada"}
     return jsonify(message), 200
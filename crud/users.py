@@ -1,34 +1,65 @@
 from app import mongo
-from bson.json_util import dumps
+from utils.serializer import dumps
 from bson import ObjectId
 from flask import Response, jsonify
+from pymongo.errors import DuplicateKeyError
+from utils.cache import cached_find_one, user_cache
+from utils.profiles import get_collection
+from utils.utils import (
+    EMAIL_REGEX,
+    USER_LIST_PROJECTION,
+    bump_versions,
+    historial_page,
+    paginated_response,
+    parse_limit,
+    parse_pagination,
+    parse_projection,
+)
 import re
 
-EMAIL_REGEX = r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)"
 
-
-def get_users():
+def get_users(limit=None, after=None, fields=None, exclude=None):
     """
-    Obtiene todos los usuarios de la base de datos.
+    Obtiene los usuarios de la base de datos, paginados por _id.
+
+    Args:
+        limit (str): Cantidad máxima de usuarios a devolver.
+        after (str): _id del último usuario de la página anterior.
+        fields (str): Campos a incluir, separados por comas.
+        exclude (str): Campos a excluir, separados por comas.
 
     Returns:
-        list[users]: Una lista de todos los usuarios registrados.
+        list[users]: Una página de los usuarios registrados, sin historial_reservas por defecto.
 
     Raises:
         HTTPException:
+            - 400: Si los parámetros de paginación o de campos son inválidos.
             - 500: Si ocurre un error inesperado al obtener los usuarios.
     """
-    users = mongo.db.usuarios.find()
-    users = dumps(users)
-    return Response(users, mimetype="application/json", status=200)
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude, USER_LIST_PROJECTION)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    # se lee del primario, como la versión que usa el ETag de /users
+    return paginated_response(
+        get_collection(mongo.db, "usuarios", "primary"), {}, limit, after, projection
+    )
 
 
-def get_user_by_id(id):
+def get_user_by_id(id, fields=None, exclude=None):
     """
     Obtiene un usuario por su ID
 
     Args:
         id (str): ID del usuario a buscar.
+        fields (str): Campos a incluir, separados por comas.
+        exclude (str): Campos a excluir, separados por comas.
 
     returns:
         user: El objeto del usuario correspondiente al ID.
@@ -43,13 +74,63 @@ def get_user_by_id(id):
     except Exception as e:
         message = {"error": "Invalid ID", "message": str(e)}
         return jsonify(message), 400
-    user = mongo.db.usuarios.find_one({"_id": ObjectId(id)})
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    if projection is None:
+        user = cached_find_one(user_cache, mongo.db.usuarios, id)
+    else:
+        user = mongo.db.usuarios.find_one({"_id": id}, projection)
     if user is None:
         return jsonify({"error": "User not found"}), 404
     user = dumps(user)
     return Response(user, mimetype="application/json", status=200)
 
 
+def get_user_historial(id, limit=None, offset=None):
+    """
+    Obtiene una página del historial completo de reservas de un usuario
+
+    El documento del usuario guarda solo las entradas recientes; el historial completo
+    se lee de historial_buckets.
+
+    Args:
+        id (str): ID del usuario.
+        limit (str): Cantidad máxima de entradas a devolver.
+        offset (str): Posición de la primera entrada a devolver.
+
+    returns:
+        list[historial]: Las entradas del historial en el rango pedido.
+
+    Raises:
+        HTTPException:
+            - 400: Si el ID o los parámetros de paginación son inválidos.
+            - 404: Si el usuario no se encuentra en la base de datos.
+    """
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        limit = parse_limit(limit)
+        offset = int(offset) if offset else 0
+        if offset < 0:
+            raise ValueError("'offset' must be a non-negative integer")
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    historial = historial_page(id, offset, limit)
+    if historial is None:
+        # sin buckets: el usuario no existe o todavía no tiene reservas
+        if mongo.db.usuarios.find_one({"_id": id}, {"_id": 1}) is None:
+            return jsonify({"error": "User not found"}), 404
+        historial = []
+    return Response(dumps(historial), mimetype="application/json", status=200)
+
+
 def create_user(user):
     """
     Crea un nuevo usuario en la base de datos.
@@ -77,10 +158,19 @@ def create_user(user):
         )
     if re.match(EMAIL_REGEX, email) is None:
         return jsonify({"error": "Invalid email"}), 400
-    if mongo.db.usuarios.find_one({"email": email}):
+    user = {
+        "nombre": name,
+        "email": email,
+        "estado": False,
+        "historial_reservas": [],
+        "historial_total": 0,
+    }
+    # el índice único de email detecta los duplicados
+    try:
+        user_id = mongo.db.usuarios.insert_one(user)
+    except DuplicateKeyError:
         return jsonify({"error": "Email already exists"}), 400
-    user = {"nombre": name, "email": email, "estado": False, "historial_reservas": []}
-    user_id = mongo.db.usuarios.insert_one(user)
+    bump_versions("usuarios", [user_id.inserted_id])
     return jsonify({"id": str(user_id.inserted_id)}), 201
 
 
@@ -117,12 +207,13 @@ def update_user(id, user):
         )
     if re.match(EMAIL_REGEX, email) is None:
         return jsonify({"error": "Invalid email"}), 400
-    if mongo.db.usuarios.find_one(
-        {"$and": [{"email": email}, {"_id": {"$ne": ObjectId(id)}}]}
-    ):
-        return jsonify({"error": "Email already exists"}), 400
     user = {"nombre": name, "email": email, "historial_reservas": []}
-    mongo.db.usuarios.update_one({"_id": ObjectId(id)}, {"$set": user})
+    try:
+        mongo.db.usuarios.update_one({"_id": ObjectId(id)}, {"$set": user})
+    except DuplicateKeyError:
+        return jsonify({"error": "Email already exists"}), 400
+    user_cache.invalidate(id)
+    bump_versions("usuarios", [id])
     return jsonify({"id": str(id)}), 200
 
 
@@ -150,4 +241,8 @@ def delete_user(id):
     if user is None:
         return jsonify({"error": "User not found"}), 404
     mongo.db.usuarios.delete_one({"_id": ObjectId(id)})
+    mongo.db.cancelaciones_ventana.delete_one({"_id": id})
+    mongo.db.historial_buckets.delete_many({"id_usuario": id})
+    user_cache.invalidate(id)
+    bump_versions("usuarios", [id])
     return jsonify({"id": str(id)}), 204
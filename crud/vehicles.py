@@ -1,31 +1,133 @@
 from app import mongo
-from bson.json_util import dumps
+from utils.serializer import dumps
 from bson import ObjectId
 from flask import Response, jsonify
+from pymongo.errors import DuplicateKeyError
+from utils.cache import cached_find_one, vehicle_cache
+from utils.profiles import get_collection
+from utils.occupancy import OCCUPANCY_DAYS, occupancy, report
+from utils.utils import (
+    available_vehicles_pipeline,
+    bump_versions,
+    paginated_response,
+    parse_pagination,
+    parse_projection,
+    parse_reservation_dates,
+)
 
 
-def get_vehicles():
+def get_vehicles(limit=None, after=None, fields=None, exclude=None):
     """
-    Obtiene todos los vehiculos de la base de datos.
+    Obtiene los vehiculos de la base de datos, paginados por _id.
+
+    Args:
+        limit (str): Cantidad máxima de vehiculos a devolver.
+        after (str): _id del último vehiculo de la página anterior.
+        fields (str): Campos a incluir, separados por comas.
+        exclude (str): Campos a excluir, separados por comas.
 
     Returns:
-        list[vehicle]: Una lista de todos los vehicles registrados.
+        list[vehicle]: Una página de los vehiculos registrados.
 
     Raises:
         HTTPException:
+            - 400: Si los parámetros de paginación o de campos son inválidos.
             - 500: Si ocurre un error inesperado al obtener los vehicles.
     """
-    vehicles = mongo.db.vehiculos.find()
-    vehicles = dumps(vehicles)
-    return Response(vehicles, mimetype="application/json", status=200)
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    # se lee del primario, como la versión que usa el ETag de /vehicles
+    return paginated_response(
+        get_collection(mongo.db, "vehiculos", "primary"), {}, limit, after, projection
+    )
+
+
+def get_available_vehicles(start_date, end_date, tipo=None, limit=None, after=None):
+    """
+    Obtiene los vehiculos sin reservas activas entre dos fechas, paginados por _id.
+
+    Args:
+        start_date (str): Fecha inicial (YYYY-MM-DD).
+        end_date (str): Fecha final (YYYY-MM-DD).
+        tipo (str): Tipo de vehiculo, opcional.
+        limit (str): Cantidad máxima de vehiculos a devolver.
+        after (str): _id del último vehiculo de la página anterior.
+
+    Returns:
+        list[vehicle]: Una página de los vehiculos disponibles.
+
+    Raises:
+        HTTPException:
+            - 400: Si las fechas o los parámetros de paginación son inválidos.
+    """
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        start_date, end_date = parse_reservation_dates(start_date, end_date)
+    except ValueError as e:
+        return jsonify({"error": "Invalid date format", "message": str(e)}), 400
+    if start_date > end_date:
+        return jsonify({"error": "'from' must not be later than 'to'"}), 400
+    vehicles = list(
+        get_collection(mongo.db, "vehiculos", "lists").aggregate(
+            available_vehicles_pipeline(start_date, end_date, tipo, after, limit)
+        )
+    )
+    headers = {}
+    if len(vehicles) > limit:
+        vehicles = vehicles[:limit]
+        headers["X-Next-Cursor"] = str(vehicles[-1]["_id"])
+    return Response(
+        dumps(vehicles), mimetype="application/json", status=200, headers=headers
+    )
+
+
+def get_occupancy(days=None, tipo=None):
+    """
+    Obtiene el calendario de ocupación de la flota desde hoy.
+
+    Args:
+        days (str): Cantidad de días, por defecto y como máximo OCCUPANCY_DAYS.
+        tipo (str): Tipo de vehiculo, opcional.
 
+    Returns:
+        occupancy: Matriz vehiculo × día y porcentajes de utilización.
 
-def get_vehicle_by_id(id):
+    Raises:
+        HTTPException:
+            - 400: Si days es inválido.
+    """
+    try:
+        days = int(days) if days else OCCUPANCY_DAYS
+        if not 1 <= days <= OCCUPANCY_DAYS:
+            raise ValueError(f"'days' must be between 1 and {OCCUPANCY_DAYS}")
+    except ValueError as e:
+        return jsonify({"error": "Invalid days", "message": str(e)}), 400
+    if not occupancy.is_warm():
+        occupancy.warm(mongo.db)
+    calendar = report(occupancy.snapshot(days, tipo))
+    return Response(dumps(calendar), mimetype="application/json", status=200)
+
+
+def get_vehicle_by_id(id, fields=None, exclude=None):
     """
     Obtiene un vehiculo por su ID
 
     Args:
         id (str): ID del vehiculo a buscar.
+        fields (str): Campos a incluir, separados por comas.
+        exclude (str): Campos a excluir, separados por comas.
 
     returns:
         vehicle: El objeto del vehiculo correspondiente al ID.
@@ -40,7 +142,15 @@ def get_vehicle_by_id(id):
     except Exception as e:
         message = {"error": "Invalid ID", "message": str(e)}
         return jsonify(message), 400
-    vehicle = mongo.db.vehiculos.find_one({"_id": ObjectId(id)})
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    if projection is None:
+        vehicle = cached_find_one(vehicle_cache, mongo.db.vehiculos, id)
+    else:
+        vehicle = mongo.db.vehiculos.find_one({"_id": id}, projection)
     if vehicle is None:
         return jsonify({"error": "Vehicle not found"}), 404
     vehicle = dumps(vehicle)
@@ -73,10 +183,14 @@ def create_vehicle(vehicle):
             ),
             400,
         )
-    if mongo.db.vehiculos.find_one({"placa": placa}):
-        return jsonify({"error": "Vehicle already exists"}), 400
     vehiculo = {"placa": placa, "tipo": tipo, "disponibilidad": True}
-    vehicle_id = mongo.db.vehiculos.insert_one(vehiculo)
+    # el índice único de placa detecta los duplicados
+    try:
+        vehicle_id = mongo.db.vehiculos.insert_one(vehiculo)
+    except DuplicateKeyError:
+        return jsonify({"error": "Vehicle already exists"}), 400
+    bump_versions("vehiculos", [vehicle_id.inserted_id])
+    occupancy.invalidate()
     return jsonify({"id": str(vehicle_id.inserted_id)}), 201
 
 
@@ -114,13 +228,15 @@ def update_vehicle(id, vehicle):
             ),
             400,
         )
-    if mongo.db.vehiculos.find_one({"_id": ObjectId(id)}) is None:
-        return jsonify({"error": "Vehicle not found"}), 404
-    if mongo.db.vehiculos.find_one(
-        {"$and": [{"placa": placa}, {"_id": {"$ne": ObjectId(id)}}]}
-    ):
+    try:
+        result = mongo.db.vehiculos.update_one({"_id": ObjectId(id)}, {"$set": vehicle})
+    except DuplicateKeyError:
         return jsonify({"error": "Vehicle already exists"}), 400
-    mongo.db.vehiculos.update_one({"_id": ObjectId(id)}, {"$set": vehicle})
+    if result.matched_count == 0:
+        return jsonify({"error": "Vehicle not found"}), 404
+    vehicle_cache.invalidate(id)
+    occupancy.invalidate()
+    bump_versions("vehiculos", [id])
     return jsonify({"id": id}), 200
 
 
@@ -148,4 +264,8 @@ def delete_vehicle(id):
     if vehicle is None:
         return jsonify({"error": "Vehicle not found"}), 404
     mongo.db.vehiculos.delete_one({"_id": ObjectId(id)})
+    mongo.db.conteo_reservas.delete_one({"_id": id})
+    vehicle_cache.invalidate(id)
+    occupancy.invalidate()
+    bump_versions("vehiculos", [id])
     return jsonify({"id": id}), 204
@@ -0,0 +1,35 @@
+from quart import Response, jsonify
+from utils.cache import user_cache, vehicle_cache
+from utils.change_stream import change_listener
+from utils.common import parse_limit
+from utils.metrics import metrics_payload
+from utils.serializer import dumps
+from utils.slow_queries import slow_queries
+
+
+async def get_cache_stats():
+    """Versión asíncrona de crud.admin.get_cache_stats."""
+    return jsonify(
+        {
+            "usuarios": user_cache.stats(),
+            "vehiculos": vehicle_cache.stats(),
+            "cambios": change_listener.stats(),
+        }
+    )
+
+
+async def get_metrics():
+    """Versión asíncrona de crud.admin.get_metrics."""
+    payload, content_type = metrics_payload()
+    return Response(payload, content_type=content_type, status=200)
+
+
+async def get_slow_queries(limit=None):
+    """Versión asíncrona de crud.admin.get_slow_queries."""
+    try:
+        limit = parse_limit(limit)
+    except Exception as e:
+        message = {"error": "Invalid limit", "message": str(e)}
+        return jsonify(message), 400
+    entries = slow_queries.recent(limit)
+    return Response(dumps(entries), mimetype="application/json", status=200)
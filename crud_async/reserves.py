@@ -0,0 +1,479 @@
+from app_async import mongo
+from utils.serializer import dumps
+from bson import ObjectId
+from quart import Response, jsonify
+from datetime import datetime
+from pymongo.errors import BulkWriteError, PyMongoError
+from utils.async_mongo import aggregate
+from utils.async_utils import *
+from utils.availability import availability
+from utils.occupancy import occupancy
+from utils.cache import user_cache, vehicle_cache
+from utils.profiles import get_collection
+
+
+async def get_reserves(limit=None, after=None, fields=None, exclude=None):
+    """Versión asíncrona de crud.reserves.get_reserves."""
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    return await paginated_response(
+        get_collection(mongo.db, "reservas", "lists"), {}, limit, after, projection
+    )
+
+
+async def export_reserves(
+    format=None, start_date=None, end_date=None, estado=None, join=None
+):
+    """Versión asíncrona de crud.reserves.export_reserves."""
+    format = format or "ndjson"
+    if format not in EXPORT_FORMATS:
+        message = {"error": "Invalid format", "message": "Use 'ndjson' or 'csv'"}
+        return jsonify(message), 400
+    try:
+        query = export_query(start_date, end_date, estado)
+    except ValueError as e:
+        return jsonify({"error": "Invalid filters", "message": str(e)}), 400
+    return Response(
+        export_reservations(query, format, join in ("1", "true")),
+        mimetype=EXPORT_FORMATS[format],
+        status=200,
+        headers={"Content-Disposition": f"attachment; filename=reservas.{format}"},
+    )
+
+
+async def create_reservation(reservation):
+    """Versión asíncrona de crud.reserves.create_reservation."""
+    user_id = reservation.get("id_usuario")
+    vehicle_id = reservation.get("id_vehiculo")
+    start_date = reservation.get("fecha_inicio")
+    end_date = reservation.get("fecha_fin")
+
+    # Validamos y convertimos los ids
+    try:
+        user_id = ObjectId(user_id)
+        vehicle_id = ObjectId(vehicle_id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+
+    # Verificamos si existe el usuario
+    user = await get_collection(mongo.db, "usuarios", "primary").find_one(
+        {"_id": user_id}, USER_BLOCK_PROJECTION
+    )
+    if user is None:
+        return jsonify({"error": "User not found"}), 404
+
+    if is_blocked(user):
+        return (
+            jsonify(
+                {
+                    "error": USER_BLOCKED,
+                    "message": "This user has temporary restrictions on making new reservations. Please try again later.",
+                }
+            ),
+            403,
+        )
+    # Verificamos si existe el vehiculo
+    vehicle = await cached_find_one(
+        vehicle_cache, get_collection(mongo.db, "vehiculos", "primary"), vehicle_id
+    )
+    if vehicle is None:
+        return jsonify({"error": "Vehicle not found"}), 404
+
+    # Convertir las fechas de inicio y fin
+    try:
+        start_date, end_date = parse_reservation_dates(start_date, end_date)
+    except ValueError as e:
+        return jsonify({"error": "Invalid date format", "message": str(e)}), 400
+
+    # Validar que la fecha de inicio sea en el futuro y que la fecha de fin sea posterior
+    if not valid_reservation_dates(start_date, end_date):
+        return (
+            jsonify(
+                {
+                    "error": "Invalid dates. The start date must be in the future, and the end date must be later than the start date."
+                }
+            ),
+            400,
+        )
+    if not valid_reservation_length(start_date, end_date):
+        return (
+            jsonify(
+                {
+                    "error": f"Reservation too long. The maximum is {MAX_RESERVATION_DAYS} days."
+                }
+            ),
+            400,
+        )
+
+    # Verificar si ya existe una reserva activa para el vehículo en las fechas solicitadas
+    reservation = await check_reserve(vehicle_id, start_date, end_date)
+
+    if reservation:
+        response = {
+            "message": RESERVATION_CONFLICT,
+            "reservation": reservation,
+        }
+        return Response(dumps(response), mimetype="application/json", status=400)
+
+    # Defino el JSON para crear la reserva
+    reservation = new_reservation(user_id, vehicle_id, start_date, end_date)
+
+    # Ocupamos los días del vehículo, ver crud.reserves.create_reservation
+    if await claim_slots([reservation]):
+        response = {
+            "message": RESERVATION_CONFLICT,
+            "reservation": await find_slot_conflict(reservation),
+        }
+        return Response(dumps(response), mimetype="application/json", status=400)
+
+    # Insertar la nueva reserva en la base de datos
+    try:
+        await mongo.db.reservas.insert_one(reservation)
+    except PyMongoError:
+        await release_slots([reservation["_id"]])
+        raise
+    availability.add(vehicle_id, reservation["_id"], start_date, end_date)
+    occupancy.add(vehicle_id, start_date, end_date)
+    await update_reservation_counters({vehicle_id: 1})
+
+    # Actualizamos el historial de reservas
+    await update_historial(user_id, reservation["_id"], start_date)
+
+    # Convertir la reserva a JSON y devolverla en la respuesta
+    return Response(dumps(reservation), mimetype="application/json", status=201)
+
+
+async def create_reservations_bulk(reservations):
+    """Versión asíncrona de crud.reserves.create_reservations_bulk."""
+    if not isinstance(reservations, list) or not reservations:
+        return jsonify({"error": "Expected a non-empty list of reservations"}), 400
+    if len(reservations) > MAX_BULK_RESERVATIONS:
+        return (
+            jsonify(
+                {
+                    "error": f"Too many reservations, the maximum is {MAX_BULK_RESERVATIONS}"
+                }
+            ),
+            400,
+        )
+
+    # Validamos ids y fechas sin consultar la base de datos
+    results, candidates = bulk_candidates(reservations)
+
+    # Una consulta $in por colección para usuarios y vehículos
+    users = {}
+    vehicles = set()
+    if candidates:
+        user_ids = list({candidate[1] for candidate in candidates})
+        vehicle_ids = list({candidate[2] for candidate in candidates})
+        users = {
+            user["_id"]: user
+            async for user in get_collection(mongo.db, "usuarios", "primary").find(
+                {"_id": {"$in": user_ids}}, USER_BLOCK_PROJECTION
+            )
+        }
+        vehicles = {
+            vehicle["_id"]
+            async for vehicle in get_collection(mongo.db, "vehiculos", "primary").find(
+                {"_id": {"$in": vehicle_ids}}, {"_id": 1}
+            )
+        }
+    valid = bulk_valid(candidates, users, vehicles, results)
+
+    # Revisamos los conflictos con las reservas activas que pueden chocar con el lote
+    documents = []
+    if valid:
+        active = (
+            await get_collection(mongo.db, "reservas", "primary")
+            .find(
+                bulk_active_query(valid),
+                {"id_vehiculo": 1, "fecha_inicio": 1, "fecha_fin": 1},
+            )
+            .to_list(None)
+        )
+        documents = bulk_reservations(valid, active, results)
+
+    # Ocupamos los días de todas las reservas aceptadas en una sola operación
+    failed = set()
+    if documents:
+        rejected = await claim_slots([reservation for _, reservation in documents])
+        accepted = []
+        for index, reservation in documents:
+            if reservation["_id"] in rejected:
+                results[index] = {
+                    "index": index,
+                    "status": 400,
+                    "error": RESERVATION_CONFLICT,
+                    "reservation": await find_slot_conflict(reservation),
+                }
+            else:
+                accepted.append((index, reservation))
+        documents = accepted
+
+    # Insertamos todas las reservas aceptadas en una sola operación
+    if documents:
+        try:
+            await mongo.db.reservas.insert_many(
+                [reservation for _, reservation in documents], ordered=False
+            )
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                index = documents[error["index"]][0]
+                failed.add(index)
+                results[index] = {
+                    "index": index,
+                    "status": 500,
+                    "error": "Reservation could not be created",
+                    "message": error.get("errmsg"),
+                }
+            await release_slots(
+                reservation["_id"]
+                for index, reservation in documents
+                if index in failed
+            )
+
+    # Actualizamos los historiales con un bulk_write por colección
+    created, historial, counters = bulk_created(documents, failed, results)
+    for reservation in created:
+        availability.add(
+            reservation["id_vehiculo"],
+            reservation["_id"],
+            reservation["fecha_inicio"],
+            reservation["fecha_fin"],
+        )
+        occupancy.add(
+            reservation["id_vehiculo"],
+            reservation["fecha_inicio"],
+            reservation["fecha_fin"],
+        )
+    if historial:
+        await append_historial(historial)
+    if counters:
+        await update_reservation_counters(counters)
+
+    return Response(dumps(results), mimetype="application/json", status=200)
+
+
+async def cancel_reservation(id):
+    """Versión asíncrona de crud.reserves.cancel_reservation."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    reservation = await mongo.db.reservas.find_one({"_id": id})
+    if reservation is None:
+        return jsonify({"error": "Reservation not found"}), 404
+    # solo una solicitud cambia la reserva activa; repetirla no vuelve a liberar sus
+    # días ni a contar la cancelación
+    result = await mongo.db.reservas.update_one(
+        {"_id": id, "estado": "activa"}, {"$set": {"estado": "cancelado"}}
+    )
+    if result.matched_count == 0:
+        message = {
+            "error": "Reservation is not active",
+            "message": f"Reservation {id} is {reservation['estado']}",
+        }
+        return jsonify(message), 409
+    availability.remove(reservation["id_vehiculo"], id)
+    await release_slots([id])
+    occupancy.remove(
+        reservation["id_vehiculo"],
+        reservation["fecha_inicio"],
+        reservation["fecha_fin"],
+    )
+
+    # registro de la cancelación, expira por el índice TTL de cancelaciones.fecha
+    now = datetime.now()
+    data = {
+        "fecha": now,
+        "id_usuario": reservation["id_usuario"],
+        "id_reserva": id,
+    }
+    await get_collection(mongo.db, "cancelaciones", "cancellations_log").insert_one(
+        data
+    )
+
+    # penalización para usuarios que cancelen +3 veces en una semana (ultimos 7 días)
+    _, until = await register_cancellation(reservation["id_usuario"], now)
+
+    # actualización del historial y estado del usuario
+    await cancel_historial_entry(reservation["id_usuario"], id, until)
+
+    message = {"message": f"Reserva {id} cancelada"}
+    return jsonify(message), 200
+
+
+async def activate_user(id):
+    """Versión asíncrona de crud.reserves.activate_user."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    result = await mongo.db.usuarios.update_one({"_id": id}, block_update(None))
+    user_cache.invalidate(id)
+    await bump_versions("usuarios", [id])
+    if result.matched_count == 0:
+        return jsonify({"error": "User not found"}), 404
+    message = {"message": f"Usuario {id} activado"}
+    return jsonify(message), 200
+
+
+async def get_reservations_by_user(
+    id, limit=None, after=None, fields=None, exclude=None
+):
+    """Versión asíncrona de crud.reserves.get_reservations_by_user."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    user = await mongo.db.usuarios.find_one({"_id": ObjectId(id)}, {"_id": 1})
+    if user is None:
+        return jsonify({"error": "User not found"}), 404
+    return await paginated_response(
+        get_collection(mongo.db, "reservas", "lists"),
+        {"id_usuario": id},
+        limit,
+        after,
+        projection,
+    )
+
+
+async def get_most_reserved_vehicle():
+    """Versión asíncrona de crud.reserves.get_most_reserved_vehicle."""
+    # conteo_reservas se mantiene con $inc al crear reservas, ver update_reservation_counters
+    vehicle = await get_collection(mongo.db, "conteo_reservas", "analytics").find_one(
+        {}, sort=[("cantidad", -1)]
+    )
+    if not vehicle:
+        return jsonify({"error": "No reservations found"}), 404
+
+    most_reserved_vehicle_id = vehicle["_id"]
+    vehicle_ = await cached_find_one(
+        vehicle_cache,
+        get_collection(mongo.db, "vehiculos", "analytics"),
+        most_reserved_vehicle_id,
+    )
+    if not vehicle_:
+        return jsonify({"error": "Vehicle not found"}), 404
+
+    response = {
+        "id_vehiculo": most_reserved_vehicle_id,
+        "cantidad_reservas": vehicle["cantidad"],
+        "vehiculo": vehicle_,
+    }
+
+    return Response(dumps(response), mimetype="application/json", status=200)
+
+
+async def get_most_reserved_vehicles(limit=1):
+    """Versión asíncrona de crud.reserves.get_most_reserved_vehicles."""
+    if not isinstance(limit, int) or limit <= 0 or limit > MAX_PAGE_LIMIT:
+        return (
+            jsonify(
+                {"error": f"'limit' must be an integer between 1 and {MAX_PAGE_LIMIT}."}
+            ),
+            400,
+        )
+
+    counters = await (
+        get_collection(mongo.db, "conteo_reservas", "analytics")
+        .find({})
+        .sort("cantidad", -1)
+        .limit(limit)
+    ).to_list(limit)
+    if not counters:
+        return jsonify({"error": "No reservations found"}), 404
+
+    vehicles = {
+        vehicle["_id"]: vehicle
+        async for vehicle in get_collection(mongo.db, "vehiculos", "analytics").find(
+            {"_id": {"$in": [counter["_id"] for counter in counters]}}
+        )
+    }
+    response = [
+        {
+            "id_vehiculo": counter["_id"],
+            "cantidad_reservas": counter["cantidad"],
+            "vehiculo": vehicles[counter["_id"]],
+        }
+        for counter in counters
+        if counter["_id"] in vehicles
+    ]
+
+    return Response(dumps(response), mimetype="application/json", status=200)
+
+
+async def get_most_canceling_user(limit=1, days=None):
+    """Versión asíncrona de crud.reserves.get_most_canceling_user."""
+    try:
+        pipeline = most_canceling_pipeline(limit, days)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        cursor = await aggregate(
+            get_collection(mongo.db, "cancelaciones", "analytics"), pipeline
+        )
+        response = await cursor.to_list(limit)
+
+        if not response:
+            return jsonify({"error": "No cancellations found"}), 404
+
+        return Response(dumps(response), mimetype="application/json", status=200)
+
+    except Exception as e:
+        return jsonify({"error": "An error occurred", "message": str(e)}), 500
+
+
+async def finished_reservation(id):
+    """Versión asíncrona de crud.reserves.finished_reservation."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    reservation = await mongo.db.reservas.find_one({"_id": id})
+    if reservation is None:
+        return jsonify({"error": "Reservation not found"}), 404
+    # solo una solicitud cambia la reserva activa; repetirla no vuelve a liberar sus
+    # días ni a contar la cancelación
+    result = await mongo.db.reservas.update_one(
+        {"_id": id, "estado": "activa"}, {"$set": {"estado": "terminada"}}
+    )
+    if result.matched_count == 0:
+        message = {
+            "error": "Reservation is not active",
+            "message": f"Reservation {id} is {reservation['estado']}",
+        }
+        return jsonify(message), 409
+    availability.remove(reservation["id_vehiculo"], id)
+    await release_slots([id])
+    occupancy.remove(
+        reservation["id_vehiculo"],
+        reservation["fecha_inicio"],
+        reservation["fecha_fin"],
+    )
+    await set_historial_estado({reservation["id_usuario"]: [id]}, "terminada")
+    message = {"message": f"Reserva {id} terminada"}
+    return jsonify(message), 200
@@ -0,0 +1,161 @@
+from app_async import mongo
+from utils.serializer import dumps
+from bson import ObjectId
+from quart import Response, jsonify
+from pymongo.errors import DuplicateKeyError
+from utils.cache import user_cache
+from utils.profiles import get_collection
+from utils.async_utils import (
+    EMAIL_REGEX,
+    USER_LIST_PROJECTION,
+    bump_versions,
+    cached_find_one,
+    historial_page,
+    paginated_response,
+    parse_limit,
+    parse_pagination,
+    parse_projection,
+)
+import re
+
+
+async def get_users(limit=None, after=None, fields=None, exclude=None):
+    """Versión asíncrona de crud.users.get_users."""
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude, USER_LIST_PROJECTION)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    return await paginated_response(
+        get_collection(mongo.db, "usuarios", "primary"), {}, limit, after, projection
+    )
+
+
+async def get_user_by_id(id, fields=None, exclude=None):
+    """Versión asíncrona de crud.users.get_user_by_id."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    if projection is None:
+        user = await cached_find_one(user_cache, mongo.db.usuarios, id)
+    else:
+        user = await mongo.db.usuarios.find_one({"_id": id}, projection)
+    if user is None:
+        return jsonify({"error": "User not found"}), 404
+    user = dumps(user)
+    return Response(user, mimetype="application/json", status=200)
+
+
+async def get_user_historial(id, limit=None, offset=None):
+    """Versión asíncrona de crud.users.get_user_historial."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        limit = parse_limit(limit)
+        offset = int(offset) if offset else 0
+        if offset < 0:
+            raise ValueError("'offset' must be a non-negative integer")
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    historial = await historial_page(id, offset, limit)
+    if historial is None:
+        # sin buckets: el usuario no existe o todavía no tiene reservas
+        if await mongo.db.usuarios.find_one({"_id": id}, {"_id": 1}) is None:
+            return jsonify({"error": "User not found"}), 404
+        historial = []
+    return Response(dumps(historial), mimetype="application/json", status=200)
+
+
+async def create_user(user):
+    """Versión asíncrona de crud.users.create_user."""
+    name = user.get("nombre")
+    email = user.get("email")
+    if name is None or email is None:
+        return (
+            jsonify(
+                {
+                    "error": "Missing required fields, please ensure your data includes 'nombre' and 'email'"
+                }
+            ),
+            400,
+        )
+    if re.match(EMAIL_REGEX, email) is None:
+        return jsonify({"error": "Invalid email"}), 400
+    user = {
+        "nombre": name,
+        "email": email,
+        "estado": False,
+        "historial_reservas": [],
+        "historial_total": 0,
+    }
+    # el índice único de email detecta los duplicados
+    try:
+        user_id = await mongo.db.usuarios.insert_one(user)
+    except DuplicateKeyError:
+        return jsonify({"error": "Email already exists"}), 400
+    await bump_versions("usuarios", [user_id.inserted_id])
+    return jsonify({"id": str(user_id.inserted_id)}), 201
+
+
+async def update_user(id, user):
+    """Versión asíncrona de crud.users.update_user."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    name = user.get("nombre")
+    email = user.get("email")
+    if name is None or email is None:
+        return (
+            jsonify(
+                {
+                    "error": "Missing required fields, please ensure your data includes 'nombre' and 'email'"
+                }
+            ),
+            400,
+        )
+    if re.match(EMAIL_REGEX, email) is None:
+        return jsonify({"error": "Invalid email"}), 400
+    user = {"nombre": name, "email": email, "historial_reservas": []}
+    try:
+        await mongo.db.usuarios.update_one({"_id": ObjectId(id)}, {"$set": user})
+    except DuplicateKeyError:
+        return jsonify({"error": "Email already exists"}), 400
+    user_cache.invalidate(id)
+    await bump_versions("usuarios", [id])
+    return jsonify({"id": str(id)}), 200
+
+
+async def delete_user(id):
+    """Versión asíncrona de crud.users.delete_user."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    user = await mongo.db.usuarios.find_one({"_id": ObjectId(id)})
+    if user is None:
+        return jsonify({"error": "User not found"}), 404
+    await mongo.db.usuarios.delete_one({"_id": ObjectId(id)})
+    await mongo.db.cancelaciones_ventana.delete_one({"_id": id})
+    await mongo.db.historial_buckets.delete_many({"id_usuario": id})
+    user_cache.invalidate(id)
+    await bump_versions("usuarios", [id])
+    return jsonify({"id": str(id)}), 204
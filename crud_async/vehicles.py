@@ -0,0 +1,175 @@
+from app_async import mongo
+from utils.serializer import dumps
+from bson import ObjectId
+from quart import Response, jsonify
+from pymongo.errors import DuplicateKeyError
+from utils.cache import vehicle_cache
+from utils.profiles import get_collection
+from utils.occupancy import OCCUPANCY_DAYS, occupancy, report
+from utils.async_mongo import aggregate
+from utils.async_utils import (
+    available_vehicles_pipeline,
+    bump_versions,
+    cached_find_one,
+    paginated_response,
+    parse_pagination,
+    parse_projection,
+    parse_reservation_dates,
+)
+
+
+async def get_vehicles(limit=None, after=None, fields=None, exclude=None):
+    """Versión asíncrona de crud.vehicles.get_vehicles."""
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    return await paginated_response(
+        get_collection(mongo.db, "vehiculos", "primary"), {}, limit, after, projection
+    )
+
+
+async def get_available_vehicles(
+    start_date, end_date, tipo=None, limit=None, after=None
+):
+    """Versión asíncrona de crud.vehicles.get_available_vehicles."""
+    try:
+        limit, after = parse_pagination(limit, after)
+    except Exception as e:
+        message = {"error": "Invalid pagination", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        start_date, end_date = parse_reservation_dates(start_date, end_date)
+    except ValueError as e:
+        return jsonify({"error": "Invalid date format", "message": str(e)}), 400
+    if start_date > end_date:
+        return jsonify({"error": "'from' must not be later than 'to'"}), 400
+    cursor = await aggregate(
+        get_collection(mongo.db, "vehiculos", "lists"),
+        available_vehicles_pipeline(start_date, end_date, tipo, after, limit),
+    )
+    vehicles = await cursor.to_list(limit + 1)
+    headers = {}
+    if len(vehicles) > limit:
+        vehicles = vehicles[:limit]
+        headers["X-Next-Cursor"] = str(vehicles[-1]["_id"])
+    return Response(
+        dumps(vehicles), mimetype="application/json", status=200, headers=headers
+    )
+
+
+async def get_occupancy(days=None, tipo=None):
+    """Versión asíncrona de crud.vehicles.get_occupancy."""
+    try:
+        days = int(days) if days else OCCUPANCY_DAYS
+        if not 1 <= days <= OCCUPANCY_DAYS:
+            raise ValueError(f"'days' must be between 1 and {OCCUPANCY_DAYS}")
+    except ValueError as e:
+        return jsonify({"error": "Invalid days", "message": str(e)}), 400
+    if not occupancy.is_warm():
+        await occupancy.warm_async(mongo.db)
+    calendar = report(occupancy.snapshot(days, tipo))
+    return Response(dumps(calendar), mimetype="application/json", status=200)
+
+
+async def get_vehicle_by_id(id, fields=None, exclude=None):
+    """Versión asíncrona de crud.vehicles.get_vehicle_by_id."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    try:
+        projection = parse_projection(fields, exclude)
+    except Exception as e:
+        message = {"error": "Invalid fields", "message": str(e)}
+        return jsonify(message), 400
+    if projection is None:
+        vehicle = await cached_find_one(vehicle_cache, mongo.db.vehiculos, id)
+    else:
+        vehicle = await mongo.db.vehiculos.find_one({"_id": id}, projection)
+    if vehicle is None:
+        return jsonify({"error": "Vehicle not found"}), 404
+    vehicle = dumps(vehicle)
+    return Response(vehicle, mimetype="application/json", status=200)
+
+
+async def create_vehicle(vehicle):
+    """Versión asíncrona de crud.vehicles.create_vehicle."""
+    placa = vehicle.get("placa")
+    tipo = vehicle.get("tipo")
+    if placa is None or tipo is None:
+        return (
+            jsonify(
+                {
+                    "error": "Missing required fields, please ensure your data includes 'placa' and 'tipo'"
+                }
+            ),
+            400,
+        )
+    vehiculo = {"placa": placa, "tipo": tipo, "disponibilidad": True}
+    # el índice único de placa detecta los duplicados
+    try:
+        vehicle_id = await mongo.db.vehiculos.insert_one(vehiculo)
+    except DuplicateKeyError:
+        return jsonify({"error": "Vehicle already exists"}), 400
+    await bump_versions("vehiculos", [vehicle_id.inserted_id])
+    occupancy.invalidate()
+    return jsonify({"id": str(vehicle_id.inserted_id)}), 201
+
+
+async def update_vehicle(id, vehicle):
+    """Versión asíncrona de crud.vehicles.update_vehicle."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    placa = vehicle.get("placa")
+    tipo = vehicle.get("tipo")
+    disponibilidad = vehicle.get("disponibilidad")
+    if placa is None or tipo is None or disponibilidad is None:
+        return (
+            jsonify(
+                {
+                    "error": "Missing required fields, please ensure your data includes 'placa', 'tipo' and 'disponibilidad'"
+                }
+            ),
+            400,
+        )
+    try:
+        result = await mongo.db.vehiculos.update_one(
+            {"_id": ObjectId(id)}, {"$set": vehicle}
+        )
+    except DuplicateKeyError:
+        return jsonify({"error": "Vehicle already exists"}), 400
+    if result.matched_count == 0:
+        return jsonify({"error": "Vehicle not found"}), 404
+    vehicle_cache.invalidate(id)
+    occupancy.invalidate()
+    await bump_versions("vehiculos", [id])
+    return jsonify({"id": id}), 200
+
+
+async def delete_vehicle(id):
+    """Versión asíncrona de crud.vehicles.delete_vehicle."""
+    try:
+        id = ObjectId(id)
+    except Exception as e:
+        message = {"error": "Invalid ID", "message": str(e)}
+        return jsonify(message), 400
+    vehicle = await mongo.db.vehiculos.find_one({"_id": ObjectId(id)})
+    if vehicle is None:
+        return jsonify({"error": "Vehicle not found"}), 404
+    await mongo.db.vehiculos.delete_one({"_id": ObjectId(id)})
+    await mongo.db.conteo_reservas.delete_one({"_id": id})
+    vehicle_cache.invalidate(id)
+    occupancy.invalidate()
+    await bump_versions("vehiculos", [id])
+    return jsonify({"id": id}), 204
@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import shutil
+
+# Configuración de gunicorn para producción: gunicorn -c gunicorn.conf.py wsgi:app
+# Cada valor se puede cambiar con la variable de entorno indicada.
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+accesslog = "-"
+
+# La aplicación se importa una sola vez en el proceso maestro y los workers la heredan
+# con el fork
+preload_app = True
+# El maestro no inicia los hilos de mantenimiento al importar la aplicación: un hilo
+# activo durante el fork puede dejar a los workers con un lock tomado o con el cliente
+# de MongoDB que el maestro cierra en when_ready. Cada worker los inicia en post_fork.
+os.environ.setdefault("BACKGROUND_TASKS", "0")
+
+# Con PROMETHEUS_MULTIPROC_DIR cada worker escribe sus métricas en ese directorio y
+# /metrics las junta; se vacía en cada arranque
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def when_ready(server):
+    from app import mongo
+    from pymongo.errors import PyMongoError
+    from utils.change_stream import change_listener
+    from utils.indexes import bootstrap_indexes
+    from utils.sweeper import sweeper
+
+    # el maestro crea los índices antes de iniciar los workers, reintentando mientras
+    # MongoDB no responde; sin los índices únicos no hay validación de duplicados, así
+    # que si no se pueden crear gunicorn termina
+    if os.environ.get("MONGO_ENSURE_INDEXES", "1") == "1":
+        try:
+            bootstrap_indexes(mongo.db)
+        except PyMongoError as e:
+            server.halt(f"Could not create the unique indexes: {e}", 1)
+
+    # MongoClient no es fork-safe: el maestro cierra el cliente usado al arrancar para
+    # que los workers no hereden sus sockets ni sus hilos de monitoreo
+
+    # el barrido y el change stream corren en los workers, no en el maestro; si alguno
+    # se inició (por ejemplo con BACKGROUND_TASKS=1) se espera a que termine antes de
+    # cerrar el cliente que usa
+    sweeper.stop(timeout=30)
+    change_listener.stop(timeout=30)
+    mongo.cx.close()
+
+
+def post_fork(server, worker):
+    # cada worker abre su propio pool y lo calienta antes de recibir solicitudes; por
+    # defecto el pool mantiene una conexión abierta por hilo
+    from app import app, mongo, mongo_event_listeners
+    from pymongo.errors import PyMongoError
+    from utils.common import mongo_client_options
+
+    options = mongo_client_options()
+    options.setdefault("minPoolSize", min(threads, options.get("maxPoolSize", threads)))
+    mongo.init_app(app, event_listeners=mongo_event_listeners, **options)
+    try:
+        mongo.cx.admin.command("ping")
+    except PyMongoError as e:
+        server.log.warning("Worker %s could not reach MongoDB: %s", worker.pid, e)
+
+    # cada worker inicia su barrido (la concesión en la colección tareas decide cuál lo
+    # ejecuta) y su change stream
+    from app import start_background_tasks
+
+    start_background_tasks()
+
+
+def child_exit(server, worker):
+    # las métricas de los workers que terminan dejan de sumarse en /metrics
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,14 @@
+#!/bin/bash
+# Inicia el replica set rs0 con RS_NODES nodos (1 o 3) si todavía no existe
+until mongosh --host mongo --quiet --eval "db.adminCommand('ping')" > /dev/null 2>&1; do
+  sleep 1
+done
+
+mongosh --host mongo --quiet --eval '
+const hosts = ["mongo:27017", "mongo2:27017", "mongo3:27017"].slice(0, Number(process.env.RS_NODES));
+try {
+  rs.status();
+} catch (e) {
+  rs.initiate({ _id: "rs0", members: hosts.map((host, i) => ({ _id: i, host: host })) });
+}
+'
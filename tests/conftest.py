@@ -0,0 +1,97 @@
+import pytest
+
+# Ajustes de mongomock para las pruebas que usan un MongoDB en memoria
+
+
+def patch_mongomock():
+    """
+    Adapta mongomock a lo que usa la API, para las pruebas de la variante asíncrona y el
+    backend en memoria del benchmark
+
+    - pymongo >= 4.11 pasa sort a las operaciones de bulk_write y mongomock no lo acepta.
+    - mongomock no implementa arrayFilters; la API solo los usa con igualdad
+      ({"nombre.campo": valor}) o $in, que se traducen a posiciones del arreglo.
+
+    Se puede llamar más de una vez.
+    """
+    import mongomock.collection
+
+    builder = mongomock.collection.BulkOperationBuilder
+    if getattr(builder, "_patched_for_api", False):
+        return
+    builder._patched_for_api = True
+
+    for name in ("add_update", "add_replace"):
+        method = getattr(builder, name)
+
+        def patched(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+
+        setattr(builder, name, patched)
+
+    # add_update rechaza arrayFilters antes de llegar a _update
+    def add_update(
+        self, selector, doc, multi=False, upsert=False, array_filters=None, **kwargs
+    ):
+        if not array_filters:
+            return builder._add_update_without_filters(
+                self, selector, doc, multi=multi, upsert=upsert, **kwargs
+            )
+        operation = mongomock.collection.BulkWriteOperation(
+            self, selector, is_upsert=upsert
+        )
+        operation.register_update_op(doc, multi, array_filters=array_filters)
+
+    builder._add_update_without_filters = builder.add_update
+    builder.add_update = add_update
+
+    update = mongomock.collection.Collection._update
+
+    def matches(item, name, conditions):
+        for key, expected in conditions.items():
+            if not key.startswith(name + "."):
+                continue
+            value = item.get(key.split(".", 1)[1])
+            if isinstance(expected, dict) and "$in" in expected:
+                if value not in expected["$in"]:
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    def with_array_filters(
+        self, spec, document, *args, array_filters=None, multi=False, **kwargs
+    ):
+        if not array_filters:
+            return update(self, spec, document, *args, multi=multi, **kwargs)
+        conditions = {
+            key: value for filter in array_filters for key, value in filter.items()
+        }
+        result = {"n": 0, "nModified": 0, "ok": 1.0}
+        matched = self.find(spec)
+        for current in matched if multi else matched.limit(1):
+            resolved = {}
+            for operator, fields in document.items():
+                resolved[operator] = {}
+                for path, value in fields.items():
+                    if ".$[" not in path:
+                        resolved[operator][path] = value
+                        continue
+                    array, rest = path.split(".$[", 1)
+                    name, field = rest.split("].", 1)
+                    for position, item in enumerate(current.get(array, [])):
+                        if matches(item, name, conditions):
+                            resolved[operator][f"{array}.{position}.{field}"] = value
+            outcome = update(self, {"_id": current["_id"]}, resolved, **kwargs)
+            result["n"] += outcome.get("n", 0)
+            result["nModified"] += outcome.get("nModified", 0)
+        return result
+
+    mongomock.collection.Collection._update = with_array_filters
+
+
+@pytest.fixture(scope="session")
+def mongomock_compat():
+    """mongomock con los ajustes de patch_mongomock; omite la prueba si no está instalado."""
+    pytest.importorskip("mongomock")
+    patch_mongomock()
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import pytest
+from bson import ObjectId
+from datetime import datetime, timedelta
+
+# La variante asíncrona se prueba contra un MongoDB en memoria
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app_async import app, mongo
+from utils.indexes import ensure_indexes_async
+from utils.sweeper import utcnow
+
+
+@pytest.fixture(scope="module", autouse=True)
+def in_memory_mongo(mongomock_compat):
+    mongo.init_app(app, client=mongomock_motor.AsyncMongoMockClient())
+    asyncio.run(ensure_indexes_async(mongo.db))
+
+
+def request(method, path, **kwargs):
+    async def send():
+        client = app.test_client()
+        response = await getattr(client, method)(path, **kwargs)
+        return response.status_code, json.loads(await response.get_data())
+
+    return asyncio.run(send())
+
+
+def test_users_crud():
+    status, data = request(
+        "post", "/users", json={"nombre": "Ana Async", "email": "ana.async@example.com"}
+    )
+    assert status == 201
+    user_id = data["id"]
+
+    status, data = request(
+        "post", "/users", json={"nombre": "Otra", "email": "ana.async@example.com"}
+    )
+    assert status == 400
+    assert "Email already exists" in data["error"]
+
+    status, data = request("get", f"/users/{user_id}")
+    assert status == 200
+    assert ObjectId(user_id) == ObjectId(data["_id"]["$oid"])
+
+    status, data = request("get", "/users")
+    assert status == 200
+    assert isinstance(data, list)
+    assert all("historial_reservas" not in user for user in data)
+
+    status, _ = request("delete", f"/users/{user_id}")
+    assert status == 204
+
+
+def test_vehicles_pagination():
+    vehicle_ids = []
+    for placa in ["ASY001", "ASY002", "ASY003"]:
+        status, data = request(
+            "post", "/vehicles", json={"placa": placa, "tipo": "SUV"}
+        )
+        assert status == 201
+        vehicle_ids.append(data["id"])
+
+    status, data = request("get", "/vehicles?limit=2")
+    assert status == 200
+    assert len(data) == 2
+
+    status, _ = request("get", f"/vehicles/{ObjectId()}")
+    assert status == 404
+
+    for vehicle_id in vehicle_ids:
+        status, _ = request("delete", f"/vehicles/{vehicle_id}")
+        assert status == 204
+
+
+def test_conditional_get():
+    async def send():
+        client = app.test_client()
+        response = await client.post(
+            "/users", json={"nombre": "Eva Etag", "email": "eva.etag@example.com"}
+        )
+        user_id = (await response.get_json())["id"]
+        response = await client.get(f"/users/{user_id}")
+        etag = response.headers["ETag"]
+        cached = await client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+        await client.put(
+            f"/users/{user_id}",
+            json={"nombre": "Eva", "email": "eva.etag@example.com"},
+        )
+        changed = await client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+        await client.delete(f"/users/{user_id}")
+        return cached.status_code, changed.status_code
+
+    assert asyncio.run(send()) == (304, 200)
+
+
+def test_cancel_reservation_twice():
+    _, user = request(
+        "post", "/users", json={"nombre": "Ivo Async", "email": "ivo.async@example.com"}
+    )
+    _, vehicle = request("post", "/vehicles", json={"placa": "ASY010", "tipo": "SUV"})
+    day = (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")
+    status, reservation = request(
+        "post",
+        "/reserve",
+        json={
+            "id_usuario": user["id"],
+            "id_vehiculo": vehicle["id"],
+            "fecha_inicio": day,
+            "fecha_fin": day,
+        },
+    )
+    assert status == 201
+    reservation_id = reservation["_id"]["$oid"]
+
+    assert request("put", f"/reserve/{reservation_id}")[0] == 200
+    assert request("put", f"/reserve/{reservation_id}")[0] == 409
+    assert request("put", f"/reserve/finished/{reservation_id}")[0] == 409
+
+    request("delete", f"/users/{user['id']}")
+    request("delete", f"/vehicles/{vehicle['id']}")
+
+
+ADMIN_HEADERS = {"Authorization": "Bearer prueba"}
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr("utils.common.ADMIN_TOKEN", "prueba")
+
+
+def test_metrics(admin_token):
+    async def send():
+        client = app.test_client()
+        await client.get(f"/vehicles/{ObjectId()}")
+        response = await client.get("/metrics", headers=ADMIN_HEADERS)
+        return response.status_code, (await response.get_data()).decode()
+
+    status, metrics = asyncio.run(send())
+    assert status == 200
+    assert (
+        'http_requests_total{method="GET",route="/vehicles/<id>",status="404"}'
+        in metrics
+    )
+
+
+def test_slow_queries(admin_token):
+    status, data = request("get", "/admin/slow-queries?limit=5", headers=ADMIN_HEADERS)
+    assert status == 200
+    assert isinstance(data, list)
+    assert (
+        request("get", "/admin/slow-queries?limit=0", headers=ADMIN_HEADERS)[0] == 400
+    )
+    assert request("get", "/admin/slow-queries")[0] == 401
+
+
+def test_run_maintenance():
+    from utils.async_utils import run_maintenance
+
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    reservation = {
+        "_id": ObjectId(),
+        "id_usuario": ObjectId(),
+        "id_vehiculo": ObjectId(),
+        "fecha_inicio": today - timedelta(days=3),
+        "fecha_fin": today - timedelta(days=2),
+        "estado": "activa",
+    }
+    blocked = {"_id": ObjectId(), "estado": True, "bloqueado_hasta": today}
+    # día ocupado por una reserva que nunca se insertó, creada hace diez minutos
+    orphan = {
+        "id_vehiculo": ObjectId(),
+        "dia": today,
+        "id_reserva": ObjectId.from_datetime(utcnow() - timedelta(minutes=10)),
+    }
+
+    async def run():
+        await mongo.db.reservas.insert_one(reservation)
+        await mongo.db.usuarios.insert_one(blocked)
+        await mongo.db.ocupacion.insert_one(orphan)
+        summary = await run_maintenance()
+        finished = await mongo.db.reservas.find_one({"_id": reservation["_id"]})
+        user = await mongo.db.usuarios.find_one({"_id": blocked["_id"]})
+        return summary, finished["estado"], user["estado"]
+
+    summary, estado, blocked_estado = asyncio.run(run())
+    assert summary["reservas"] >= 1
+    assert summary["desbloqueados"] >= 1
+    assert summary["dias_liberados"] >= 1
+    assert estado == "terminada"
+    assert blocked_estado is False
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from utils.availability import AvailabilityIndex
+
+
+def day(n):
+    return datetime(2030, 1, n)
+
+
+def test_cold_vehicle():
+    index = AvailabilityIndex()
+    warm, conflict = index.find_conflict(ObjectId(), day(1), day(2))
+    assert warm is False
+    assert conflict is None
+
+
+def test_find_conflict():
+    index = AvailabilityIndex()
+    vehicle_id = ObjectId()
+    first, second = ObjectId(), ObjectId()
+    index.load(
+        vehicle_id,
+        [
+            {"_id": first, "fecha_inicio": day(3), "fecha_fin": day(5)},
+            {"_id": second, "fecha_inicio": day(10), "fecha_fin": day(12)},
+        ],
+    )
+
+    assert index.find_conflict(vehicle_id, day(1), day(2)) == (True, None)
+    assert index.find_conflict(vehicle_id, day(6), day(9)) == (True, None)
+    assert index.find_conflict(vehicle_id, day(13), day(20)) == (True, None)
+    # Las fechas límite se consideran ocupadas
+    assert index.find_conflict(vehicle_id, day(5), day(6))[1]["_id"] == first
+    assert index.find_conflict(vehicle_id, day(8), day(10))[1]["_id"] == second
+    assert index.find_conflict(vehicle_id, day(1), day(20))[1] is not None
+
+
+def test_add_and_remove():
+    index = AvailabilityIndex()
+    vehicle_id = ObjectId()
+    reservation_id = ObjectId()
+    index.load(vehicle_id, [])
+
+    index.add(vehicle_id, reservation_id, day(3), day(5))
+    assert index.find_conflict(vehicle_id, day(4), day(4))[1]["_id"] == reservation_id
+
+    index.remove(vehicle_id, reservation_id)
+    assert index.find_conflict(vehicle_id, day(4), day(4)) == (True, None)
+
+
+def test_overlapping_intervals():
+    index = AvailabilityIndex()
+    vehicle_id = ObjectId()
+    long_id = ObjectId()
+    index.load(
+        vehicle_id,
+        [
+            {"_id": long_id, "fecha_inicio": day(1), "fecha_fin": day(20)},
+            {"_id": ObjectId(), "fecha_inicio": day(2), "fecha_fin": day(3)},
+        ],
+    )
+    assert index.find_conflict(vehicle_id, day(10), day(11))[1]["_id"] == long_id
+
+
+def test_ttl_expiry():
+    index = AvailabilityIndex(ttl=-1)
+    vehicle_id = ObjectId()
+    index.load(vehicle_id, [])
+    assert index.is_warm(vehicle_id) is False
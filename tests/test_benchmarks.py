@@ -0,0 +1,29 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from benchmarks.generator import generate
+from benchmarks.run import percentile
+
+
+def test_generator_is_deterministic():
+    first = generate(mongomock.MongoClient().db, 20, 5, 200, seed=7)
+    db = mongomock.MongoClient().db
+    second = generate(db, 20, 5, 200, seed=7)
+    assert first == second
+    assert db.reservas.count_documents({}) == 200
+
+    # las reservas activas de un vehículo no se superponen
+    for vehicle_id in second["vehiculos"]:
+        active = sorted(
+            (r["fecha_inicio"], r["fecha_fin"])
+            for r in db.reservas.find({"id_vehiculo": vehicle_id, "estado": "activa"})
+        )
+        assert all(a[1] < b[0] for a, b in zip(active, active[1:]))
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3], 95) == 3
@@ -0,0 +1,128 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from app import mongo
+from bson import ObjectId
+from utils.availability import availability
+from utils.cache import user_cache, vehicle_cache
+from utils.change_stream import ChangeListener, apply_change
+
+
+def event(collection, operation, id, **fields):
+    return {
+        "ns": {"db": "reservas_db", "coll": collection},
+        "operationType": operation,
+        "documentKey": {"_id": id},
+        **fields,
+    }
+
+
+def test_apply_change_invalidates_caches():
+    user_id, vehicle_id = ObjectId(), ObjectId()
+    user_cache.set(user_id, {"_id": user_id})
+    vehicle_cache.set(vehicle_id, {"_id": vehicle_id})
+    apply_change(
+        event(
+            "usuarios",
+            "update",
+            user_id,
+            updateDescription={"updatedFields": {"estado": True}},
+        ),
+    )
+    apply_change(event("vehiculos", "delete", vehicle_id))
+    assert user_cache.get(user_id) is None
+    assert vehicle_cache.get(vehicle_id) is None
+
+
+def test_apply_change_updates_availability():
+    vehicle_id = ObjectId()
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    reservation = {
+        "_id": ObjectId(),
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": today + timedelta(days=2),
+        "fecha_fin": today + timedelta(days=4),
+        "estado": "activa",
+    }
+    availability.load(vehicle_id, [])
+
+    # reserva creada por otro proceso
+    apply_change(
+        event("reservas", "insert", reservation["_id"], fullDocument=reservation),
+    )
+    _, conflict = availability.find_conflict(
+        vehicle_id, reservation["fecha_inicio"], reservation["fecha_fin"]
+    )
+    assert conflict["_id"] == reservation["_id"]
+
+    # y cancelada por otro proceso; el evento trae la reserva actual
+    apply_change(
+        event(
+            "reservas",
+            "update",
+            reservation["_id"],
+            updateDescription={"updatedFields": {"estado": "cancelado"}},
+            fullDocument=dict(reservation, estado="cancelado"),
+        ),
+    )
+    assert availability.find_conflict(
+        vehicle_id, reservation["fecha_inicio"], reservation["fecha_fin"]
+    ) == (True, None)
+    availability.invalidate(vehicle_id)
+
+
+def test_listener_replica_set():
+    listener = ChangeListener("test_cambios", enabled=True)
+    listener.bind(lambda: mongo.db)
+    try:
+        supported = listener.supported()
+    except Exception:
+        supported = False
+    if not supported:
+        pytest.skip("MongoDB is not a replica set")
+
+    user_id = mongo.db.usuarios.insert_one(
+        {"nombre": "Cambios", "email": "cambios@example.com", "estado": False}
+    ).inserted_id
+    listener.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not listener.connected and time.monotonic() < deadline:
+            time.sleep(0.1)
+        user_cache.set(user_id, {"_id": user_id, "estado": False})
+        # una escritura que no pasa por la API, como la de un script
+        mongo.db.usuarios.update_one({"_id": user_id}, {"$set": {"estado": True}})
+        while user_cache.get(user_id) is not None and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert user_cache.get(user_id) is None
+    finally:
+        listener.stop()
+        mongo.db.usuarios.delete_one({"_id": user_id})
+
+
+def test_stop_keeps_caches():
+    listener = ChangeListener("test_stop_cambios", enabled=True)
+    listener.bind(lambda: mongo.db)
+    vehicle_id = ObjectId()
+    availability.load(vehicle_id, [])
+    ttl = user_cache.ttl
+    opened = threading.Event()
+
+    # stream que no recibe eventos hasta que se detiene el hilo
+    def listen():
+        listener._extend_ttls()
+        opened.set()
+        listener._stop.wait()
+
+    listener.supported = lambda: True
+    listener.listen = listen
+    listener.start()
+    assert opened.wait(5)
+    listener.stop(timeout=5)
+    # detenerlo a pedido no descarta lo que se cargó al arrancar
+    assert not listener._thread.is_alive()
+    assert availability.is_warm(vehicle_id)
+    assert user_cache.ttl == ttl
+    availability.invalidate(vehicle_id)
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from utils.common import (
+    CANCELLATION_RETENTION_DAYS,
+    HISTORIAL_BUCKET_SIZE,
+    RESERVATION_CONFLICT,
+    blocked_until,
+    bucket_ranges,
+    bulk_candidates,
+    bulk_reservations,
+    historial_bucket_writes,
+    historial_positions,
+    is_blocked,
+    mongo_client_options,
+    most_canceling_pipeline,
+    page_headers,
+    page_projection,
+    page_split,
+)
+
+
+def test_mongo_client_options():
+    environ = {"MONGO_MAX_POOL_SIZE": "50", "MONGO_CONNECT_TIMEOUT_MS": ""}
+    assert mongo_client_options(environ) == {"maxPoolSize": 50}
+    assert mongo_client_options({}) == {}
+
+
+def test_bucket_ranges():
+    assert bucket_ranges([100, 100, 30], 0, 10) == [(0, 0, 10)]
+    assert bucket_ranges([100, 100, 30], 95, 10) == [(0, 95, 100), (1, 0, 5)]
+    assert bucket_ranges([100, 100, 30], 210, 50) == [(2, 10, 30)]
+    assert bucket_ranges([100, 30], 500, 10) == []
+
+
+def test_bulk_reservations():
+    vehicle_id = ObjectId()
+    start = datetime.combine(datetime.now().date(), datetime.min.time())
+    start += timedelta(days=2)
+    item = {
+        "id_usuario": str(ObjectId()),
+        "id_vehiculo": str(vehicle_id),
+        "fecha_inicio": start.strftime("%Y-%m-%d"),
+        "fecha_fin": (start + timedelta(days=2)).strftime("%Y-%m-%d"),
+    }
+    results, candidates = bulk_candidates([item, "x", dict(item), dict(item)])
+    assert results[1]["status"] == 400
+    assert [candidate[0] for candidate in candidates] == [0, 2, 3]
+
+    # la reserva 0 choca con una activa y la 3 con la 2 del mismo lote
+    active = [
+        {
+            "_id": ObjectId(),
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": start - timedelta(days=1),
+            "fecha_fin": start,
+        }
+    ]
+    candidates[1] = candidates[1][:3] + (
+        start + timedelta(days=3),
+        start + timedelta(days=4),
+    )
+    candidates[2] = candidates[2][:3] + (
+        start + timedelta(days=4),
+        start + timedelta(days=5),
+    )
+    documents = bulk_reservations(candidates, active, results)
+    assert [index for index, _ in documents] == [2]
+    assert results[0]["error"] == RESERVATION_CONFLICT
+    assert results[3]["error"] == RESERVATION_CONFLICT
+    assert documents[0][1]["estado"] == "activa"
+
+
+def test_historial_bucket_writes():
+    entries = list(range(5))
+    writes = historial_bucket_writes("u", entries, HISTORIAL_BUCKET_SIZE - 2)
+    assert [
+        (write._filter["seq"], write._doc["$push"]["entradas"]["$each"])
+        for write in writes
+    ] == [(0, [0, 1]), (1, [2, 3, 4])]
+    assert historial_bucket_writes("u", entries, HISTORIAL_BUCKET_SIZE)[0]._filter == {
+        "id_usuario": "u",
+        "seq": 1,
+    }
+
+
+def test_historial_positions():
+    entries = [{"reserva_id": 1}, {"reserva_id": 2}]
+    users = [
+        # otra solicitud agregó la entrada 3 después de las del lote
+        {
+            "_id": "a",
+            "historial_total": 10,
+            "historial_reservas": [{"reserva_id": i} for i in (0, 1, 2, 3)],
+        },
+        {"_id": "b", "historial_total": 2, "historial_reservas": entries},
+        {"_id": "legacy", "historial_reservas": entries},
+    ]
+    historial = {"a": entries, "b": entries, "legacy": entries}
+    positions, legacy = historial_positions(users, historial)
+    assert positions == {"a": 7, "b": 0}
+    assert legacy == ["legacy"]
+
+
+def test_blocked_until():
+    when = datetime(2024, 5, 10, 15)
+    assert blocked_until({"2024-05-09": 3}, when) is None
+    # hay que esperar a que salga el 2024-05-05 para quedar en 3 cancelaciones
+    days = {"2024-05-01": 1, "2024-05-05": 1, "2024-05-09": 3}
+    assert blocked_until(days, when) == datetime(2024, 5, 13)
+    assert blocked_until({"2024-05-09": 5}, when) == datetime(2024, 5, 17)
+
+    now = datetime(2024, 5, 12)
+    assert is_blocked({"estado": True}, now)
+    assert is_blocked({"estado": True, "bloqueado_hasta": datetime(2024, 5, 13)}, now)
+    assert not is_blocked(
+        {"estado": True, "bloqueado_hasta": datetime(2024, 5, 11)}, now
+    )
+    assert not is_blocked({"estado": False}, now)
+
+
+def test_most_canceling_pipeline():
+    now = datetime(2024, 5, 10)
+    pipeline = most_canceling_pipeline(5, "30", now)
+    assert pipeline[0] == {"$match": {"fecha": {"$gte": datetime(2024, 4, 10)}}}
+    assert {"$limit": 5} in pipeline
+    assert "$match" not in most_canceling_pipeline(5)[0]
+    for limit, days in (
+        (0, None),
+        (5, "-1"),
+        (5, str(CANCELLATION_RETENTION_DAYS + 1)),
+    ):
+        with pytest.raises(ValueError):
+            most_canceling_pipeline(limit, days)
+
+
+def test_page_split():
+    documents = [{"_id": ObjectId(), "placa": f"P{i}"} for i in range(3)]
+    page, after = page_split([dict(d) for d in documents], 2)
+    assert page == documents[:2] and after == documents[1]["_id"]
+    assert page_split(documents[:2], 2) == (documents[:2], None)
+    # sin el _id pedido igual se lee para el cursor, y se quita de la página
+    assert page_projection({"_id": 0}) is None
+    assert page_projection({"_id": 0, "placa": 0}) == {"placa": 0}
+    page, after = page_split([dict(d) for d in documents], 2, {"_id": 0})
+    assert page == [{"placa": "P0"}, {"placa": "P1"}]
+    assert after == documents[1]["_id"]
+    assert page_headers(None, None) == {}
+    assert page_headers(3, after) == {"X-Total-Count": "3", "X-Next-Cursor": str(after)}
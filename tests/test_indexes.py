@@ -0,0 +1,45 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import utils.indexes
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+from utils.indexes import INDEXES, bootstrap_indexes, ensure_indexes
+
+
+def test_ensure_indexes():
+    db = mongomock.MongoClient().db
+    created = ensure_indexes(db)
+    assert "email_unico" in created["usuarios"]
+    assert "placa_unica" in created["vehiculos"]
+
+
+def test_ensure_indexes_fails_on_duplicates():
+    db = mongomock.MongoClient().db
+    db.usuarios.insert_many([{"email": "doble@example.com"} for _ in range(2)])
+    # sin el índice único no hay otra validación de duplicados: no se arranca
+    with pytest.raises(DuplicateKeyError):
+        ensure_indexes(db, {"usuarios": INDEXES["usuarios"]})
+
+
+def test_bootstrap_indexes_retries(monkeypatch):
+    errors = [ServerSelectionTimeoutError("mongo:27017"), None]
+
+    def ensure(db):
+        error = errors.pop(0)
+        if error:
+            raise error
+        return {"usuarios": ["email_unico"]}
+
+    monkeypatch.setattr(utils.indexes, "ensure_indexes", ensure)
+    # MongoDB todavía no responde: se vuelve a intentar
+    assert bootstrap_indexes(None, attempts=3, delay=0) == {"usuarios": ["email_unico"]}
+
+    # un duplicado no se arregla reintentando
+    monkeypatch.setattr(
+        utils.indexes, "ensure_indexes", lambda db: ensure_indexes(db, INDEXES)
+    )
+    db = mongomock.MongoClient().db
+    db.vehiculos.insert_many([{"placa": "DOBLE"} for _ in range(2)])
+    with pytest.raises(DuplicateKeyError):
+        bootstrap_indexes(db, attempts=3, delay=60)
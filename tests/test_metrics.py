@@ -0,0 +1,61 @@
+import pytest
+from app import app
+from utils.metrics import _collection
+
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr("utils.common.ADMIN_TOKEN", "prueba")
+
+
+def test_admin_routes_require_token(client, monkeypatch):
+    # sin ADMIN_TOKEN las rutas de administración no existen
+    monkeypatch.setattr("utils.common.ADMIN_TOKEN", "")
+    assert client.get("/metrics").status_code == 404
+    monkeypatch.setattr("utils.common.ADMIN_TOKEN", "prueba")
+    for path in ("/metrics", "/admin/cache", "/admin/slow-queries"):
+        assert client.get(path).status_code == 401
+        headers = {"Authorization": "Bearer otro"}
+        assert client.get(path, headers=headers).status_code == 401
+        headers = {"Authorization": "Bearer prueba"}
+        assert client.get(path, headers=headers).status_code == 200
+
+
+def test_metrics_by_route_template(client, admin_token):
+    response = client.post("/vehicles", json={"placa": "MET001", "tipo": "SUV"})
+    vehicle_id = response.get_json()["id"]
+    # las métricas se registran al terminar de enviar el cuerpo
+    with client.get(f"/vehicles/{vehicle_id}") as response:
+        assert response.status_code == 200
+    with client.get("/no-existe") as response:
+        assert response.status_code == 404
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer prueba"})
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    metrics = response.get_data(as_text=True)
+    assert (
+        'http_requests_total{method="GET",route="/vehicles/<id>",status="200"}'
+        in metrics
+    )
+    assert 'route="<unmatched>",status="404"' in metrics
+    assert "http_request_duration_seconds_bucket" in metrics
+    # la URL con el id no se usa como etiqueta
+    assert vehicle_id not in metrics
+
+    client.delete(f"/vehicles/{vehicle_id}")
+
+
+def test_command_collection():
+    assert _collection({"find": "reservas", "filter": {}}, "find") == "reservas"
+    assert (
+        _collection({"getMore": 1, "collection": "usuarios"}, "getMore") == "usuarios"
+    )
+    assert _collection({"aggregate": 1}, "aggregate") == ""
+    assert _collection({"ping": 1}, "ping") == ""
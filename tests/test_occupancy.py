@@ -0,0 +1,68 @@
+from datetime import date, datetime
+
+from bson import ObjectId
+
+from utils.occupancy import OccupancyIndex, report, utilization
+
+
+def day(n):
+    return datetime(2030, 1, n)
+
+
+def fleet():
+    vehicles = [
+        {"_id": ObjectId(), "placa": "OCC001", "tipo": "suv"},
+        {"_id": ObjectId(), "placa": "OCC002", "tipo": "suv"},
+        {"_id": ObjectId(), "placa": "OCC003", "tipo": "van"},
+    ]
+    index = OccupancyIndex(days=10)
+    index.load(
+        vehicles,
+        [
+            {"id_vehiculo": vehicles[0]["_id"], "dia": day(2)},
+            {"id_vehiculo": vehicles[0]["_id"], "dia": day(3)},
+            # fuera del calendario o de un vehículo que ya no existe
+            {"id_vehiculo": vehicles[2]["_id"], "dia": day(20)},
+            {"id_vehiculo": ObjectId(), "dia": day(2)},
+        ],
+        today=date(2030, 1, 1),
+    )
+    return index, vehicles
+
+
+def test_load_and_update():
+    index, vehicles = fleet()
+    bits = index.snapshot()["bits"]
+    assert bits.shape == (3, 10)
+    row = list(index.snapshot()["ids"]).index(vehicles[0]["_id"])
+    assert bits[row].nonzero()[0].tolist() == [1, 2]
+    assert bits.sum() == 2
+
+    index.add(vehicles[2]["_id"], day(9), day(15))
+    calendar = index.snapshot(tipo="van")
+    assert calendar["bits"].nonzero()[1].tolist() == [8, 9]
+
+    index.remove(vehicles[0]["_id"], day(1), day(3))
+    assert index.snapshot(tipo="suv")["bits"].sum() == 0
+
+
+def test_utilization():
+    index, vehicles = fleet()
+    calendar = index.snapshot()
+    assert utilization(calendar["tipos"], calendar["bits"]) == {"suv": 10.0, "van": 0.0}
+
+    result = report(index.snapshot(days=5))
+    assert result["dias"] == 5
+    assert len(result["ocupacion"]) == 3
+    assert result["utilizacion"]["total"] == round(2 / 15 * 100, 2)
+    assert result["utilizacion"]["por_dia"][1] == round(100 / 3, 2)
+
+
+def test_is_warm():
+    index = OccupancyIndex(days=10)
+    assert not index.is_warm()
+    index.load([], [], today=date(2030, 1, 1))
+    assert index.is_warm(today=date(2030, 1, 1))
+    assert not index.is_warm(today=date(2030, 1, 2))
+    index.invalidate()
+    assert not index.is_warm(today=date(2030, 1, 1))
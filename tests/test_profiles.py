@@ -0,0 +1,20 @@
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from utils.profiles import PROFILES, read_preference, write_concern
+
+
+def test_read_preference():
+    assert read_preference("primary") == Primary()
+    secondary = read_preference("secondaryPreferred", max_staleness=120)
+    assert isinstance(secondary, SecondaryPreferred)
+    assert secondary.max_staleness == 120
+
+
+def test_write_concern():
+    assert write_concern("majority").document == {"w": "majority"}
+    assert write_concern("0").acknowledged is False
+
+
+def test_profiles():
+    assert PROFILES["primary"]["read_preference"] == Primary()
+    assert PROFILES["analytics"]["read_preference"].max_staleness == 90
@@ -0,0 +1,543 @@
+import json
+import pytest
+from app import app, mongo
+from utils.common import (
+    HISTORIAL_BUCKET_SIZE,
+    HISTORIAL_RECENT,
+    MAX_RESERVATION_DAYS,
+    historial_entry,
+)
+from utils.availability import availability
+from utils.utils import migrate_user_historial
+from bson import ObjectId
+from datetime import datetime, timedelta
+
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def user_and_vehicle(client):
+    response = client.post(
+        "/users", json={"nombre": "Reserva Test", "email": "reserva.test@example.com"}
+    )
+    assert response.status_code == 201
+    user_id = json.loads(response.data)["id"]
+    response = client.post("/vehicles", json={"placa": "RES001", "tipo": "Sedán"})
+    assert response.status_code == 201
+    vehicle_id = json.loads(response.data)["id"]
+
+    yield user_id, vehicle_id
+
+    # Borrar el usuario y el vehículo después de la prueba
+    client.delete(f"/users/{user_id}")
+    client.delete(f"/vehicles/{vehicle_id}")
+
+
+def future(days):
+    return (datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def test_create_reservation_conflict(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(10),
+        "fecha_fin": future(12),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+
+    # Una reserva que se superpone con la anterior
+    overlapping = dict(reservation, fecha_inicio=future(12), fecha_fin=future(14))
+    response = client.post("/reserve", json=overlapping)
+    assert response.status_code == 400
+
+    # Al cancelar, las fechas quedan libres
+    response = client.put(f"/reserve/{reservation_id}")
+    assert response.status_code == 200
+    response = client.post("/reserve", json=overlapping)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+
+    response = client.put(f"/reserve/finished/{reservation_id}")
+    assert response.status_code == 200
+
+
+def test_create_reservation_stale_index(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    start = datetime.strptime(future(30), "%Y-%m-%d")
+    # el índice de este proceso todavía tiene una reserva que otro worker canceló
+    availability.load(
+        ObjectId(vehicle_id),
+        [{"_id": ObjectId(), "fecha_inicio": start, "fecha_fin": start}],
+    )
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(30),
+        "fecha_fin": future(31),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+    assert client.put(f"/reserve/{reservation_id}").status_code == 200
+
+
+def test_create_reservation_blocked_by_other_worker(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    # el usuario queda en la caché de este proceso sin bloqueo
+    assert client.get(f"/users/{user_id}").status_code == 200
+    # otro worker lo bloquea, sin invalidar la caché de este
+    mongo.db.usuarios.update_one(
+        {"_id": ObjectId(user_id)},
+        {
+            "$set": {
+                "estado": True,
+                "bloqueado_hasta": datetime.now() + timedelta(days=1),
+            }
+        },
+    )
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(40),
+        "fecha_fin": future(41),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 403
+
+
+def test_create_reservation_slot_taken(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    # Un día ocupado por otra solicitud que todavía no insertó su reserva
+    day = datetime.strptime(future(20), "%Y-%m-%d")
+    other = ObjectId()
+    mongo.db.ocupacion.insert_one(
+        {"id_vehiculo": ObjectId(vehicle_id), "dia": day, "id_reserva": other}
+    )
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(19),
+        "fecha_fin": future(21),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 400
+    # La solicitud rechazada no deja días ocupados
+    assert (
+        mongo.db.ocupacion.count_documents({"id_vehiculo": ObjectId(vehicle_id)}) == 1
+    )
+
+    mongo.db.ocupacion.delete_many({"id_reserva": other})
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+    assert (
+        mongo.db.ocupacion.count_documents({"id_reserva": ObjectId(reservation_id)})
+        == 3
+    )
+
+    # Al cancelar se liberan los días
+    response = client.put(f"/reserve/{reservation_id}")
+    assert response.status_code == 200
+    assert (
+        mongo.db.ocupacion.count_documents({"id_reserva": ObjectId(reservation_id)})
+        == 0
+    )
+
+
+def test_create_reservation_invalid_dates(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(5),
+        "fecha_fin": future(3),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 400
+
+
+def test_create_reservation_too_long(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(5),
+        "fecha_fin": future(5 + MAX_RESERVATION_DAYS),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 400
+    response = client.post("/reserve/bulk", json=[reservation])
+    assert response.status_code == 200
+    assert json.loads(response.data)[0]["status"] == 400
+    assert (
+        mongo.db.ocupacion.count_documents({"id_vehiculo": ObjectId(vehicle_id)}) == 0
+    )
+
+
+def test_cancel_reservation_twice(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(40),
+        "fecha_fin": future(41),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+    response = client.put(f"/reserve/{reservation_id}")
+    assert response.status_code == 200
+    # repetir la cancelación o terminarla después no cuenta otra cancelación
+    response = client.put(f"/reserve/{reservation_id}")
+    assert response.status_code == 409
+    response = client.put(f"/reserve/finished/{reservation_id}")
+    assert response.status_code == 409
+    assert (
+        mongo.db.cancelaciones.count_documents({"id_reserva": ObjectId(reservation_id)})
+        == 1
+    )
+    response = client.put(f"/reserve/{ObjectId()}")
+    assert response.status_code == 404
+
+
+def test_create_reservations_bulk(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservations = [
+        {
+            "id_usuario": user_id,
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": future(20),
+            "fecha_fin": future(22),
+        },
+        # Se superpone con la primera reserva del mismo lote
+        {
+            "id_usuario": user_id,
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": future(21),
+            "fecha_fin": future(23),
+        },
+        {
+            "id_usuario": user_id,
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": future(30),
+            "fecha_fin": future(31),
+        },
+        {"id_usuario": "invalid", "id_vehiculo": vehicle_id},
+    ]
+    response = client.post("/reserve/bulk", json=reservations)
+    assert response.status_code == 200
+    results = json.loads(response.data)
+    assert [result["status"] for result in results] == [201, 400, 201, 400]
+
+    response = client.get(f"/users/{user_id}/historial")
+    assert len(json.loads(response.data)) == 2
+
+    for result in results:
+        if result["status"] == 201:
+            reservation_id = result["_id"]["$oid"]
+            response = client.put(f"/reserve/finished/{reservation_id}")
+            assert response.status_code == 200
+
+    response = client.post("/reserve/bulk", json={})
+    assert response.status_code == 400
+
+
+def test_available_vehicles(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(40),
+        "fecha_fin": future(42),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+
+    def available(start, end, **params):
+        query = "&".join(f"{key}={value}" for key, value in params.items())
+        response = client.get(f"/vehicles/available?from={start}&to={end}&{query}")
+        assert response.status_code == 200
+        return [vehicle["_id"]["$oid"] for vehicle in json.loads(response.data)]
+
+    assert vehicle_id not in available(future(41), future(45), tipo="Sedán")
+    assert vehicle_id in available(future(43), future(45), tipo="Sedán")
+    assert vehicle_id not in available(future(43), future(45), tipo="SUV")
+
+    # Paginación por cursor
+    response = client.get(
+        f"/vehicles/available?from={future(43)}&to={future(45)}&limit=1"
+    )
+    assert len(json.loads(response.data)) == 1
+
+    response = client.get(f"/vehicles/available?from={future(45)}&to={future(43)}")
+    assert response.status_code == 400
+    response = client.get("/vehicles/available?from=mañana")
+    assert response.status_code == 400
+
+    client.put(f"/reserve/finished/{reservation_id}")
+
+
+def test_export_reservations(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(50),
+        "fecha_fin": future(51),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+    period = f"from={future(50)}&to={future(50)}&estado=activa"
+
+    response = client.get(f"/reserve/export?{period}&join=1")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row["_id"]["$oid"] for row in rows] == [reservation_id]
+    assert rows[0]["email"] == "reserva.test@example.com"
+    assert rows[0]["placa"] == "RES001"
+
+    response = client.get(f"/reserve/export?{period}&format=csv")
+    assert response.status_code == 200
+    header, row = response.data.decode().splitlines()
+    assert header.startswith("_id,id_usuario,email")
+    assert row.startswith(f"{reservation_id},{user_id},,")
+
+    response = client.get(f"/reserve/export?from={future(51)}&to={future(52)}")
+    assert response.data == b""
+    response = client.get("/reserve/export?format=xml")
+    assert response.status_code == 400
+    response = client.get("/reserve/export?estado=pendiente")
+    assert response.status_code == 400
+
+    client.put(f"/reserve/finished/{reservation_id}")
+
+
+def test_vehicle_occupancy(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(2),
+        "fecha_fin": future(3),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+
+    def row():
+        response = client.get("/vehicles/occupancy?days=7&tipo=Sedán")
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data["dias"] == 7
+        ids = [vehicle["_id"]["$oid"] for vehicle in data["vehiculos"]]
+        return data, data["ocupacion"][ids.index(vehicle_id)]
+
+    data, days = row()
+    assert days == [0, 0, 1, 1, 0, 0, 0]
+    assert data["utilizacion"]["por_tipo"]["Sedán"] > 0
+
+    response = client.put(f"/reserve/{reservation_id}")
+    assert response.status_code == 200
+    assert row()[1] == [0] * 7
+
+    response = client.get("/vehicles/occupancy?days=0")
+    assert response.status_code == 400
+
+
+def test_historial_recent_and_buckets(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    total = HISTORIAL_RECENT + 5
+    reservations = [
+        {
+            "id_usuario": user_id,
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": future(100 + 2 * day),
+            "fecha_fin": future(100 + 2 * day),
+        }
+        for day in range(total)
+    ]
+    response = client.post("/reserve/bulk", json=reservations)
+    results = json.loads(response.data)
+    assert all(result["status"] == 201 for result in results)
+    ids = [result["_id"]["$oid"] for result in results]
+
+    # El usuario guarda solo las entradas recientes
+    response = client.get(f"/users/{user_id}")
+    recent = json.loads(response.data)["historial_reservas"]
+    assert [entry["reserva_id"]["$oid"] for entry in recent] == ids[-HISTORIAL_RECENT:]
+
+    # El historial completo se lee paginado desde los buckets
+    response = client.get(f"/users/{user_id}/historial?offset=1&limit=3")
+    page = json.loads(response.data)
+    assert [entry["reserva_id"]["$oid"] for entry in page] == ids[1:4]
+
+    # Una entrada antigua se cancela en su bucket
+    response = client.put(f"/reserve/{ids[0]}")
+    assert response.status_code == 200
+    response = client.get(f"/users/{user_id}/historial?limit=1")
+    assert json.loads(response.data)[0]["estado"] == "cancelado"
+
+    for reservation_id in ids[1:]:
+        client.put(f"/reserve/finished/{reservation_id}")
+    client.delete(f"/users/{user_id}")
+    assert (
+        mongo.db.historial_buckets.count_documents({"id_usuario": ObjectId(user_id)})
+        == 0
+    )
+
+
+def test_historial_bucket_boundary(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+
+    def bulk(days):
+        reservations = [
+            {
+                "id_usuario": user_id,
+                "id_vehiculo": vehicle_id,
+                "fecha_inicio": future(200 + 2 * day),
+                "fecha_fin": future(200 + 2 * day),
+            }
+            for day in days
+        ]
+        response = client.post("/reserve/bulk", json=reservations)
+        results = json.loads(response.data)
+        assert all(result["status"] == 201 for result in results)
+        return [result["_id"]["$oid"] for result in results]
+
+    # el segundo lote no cabe en el primer bucket y se reparte con uno nuevo
+    ids = bulk(range(HISTORIAL_BUCKET_SIZE - 2))
+    ids += bulk(range(HISTORIAL_BUCKET_SIZE - 2, HISTORIAL_BUCKET_SIZE + 3))
+    buckets = list(
+        mongo.db.historial_buckets.find({"id_usuario": ObjectId(user_id)}).sort("seq")
+    )
+    assert [(bucket["seq"], bucket["cantidad"]) for bucket in buckets] == [
+        (0, HISTORIAL_BUCKET_SIZE),
+        (1, 3),
+    ]
+    response = client.get(
+        f"/users/{user_id}/historial?offset={HISTORIAL_BUCKET_SIZE - 4}&limit=10"
+    )
+    page = json.loads(response.data)
+    assert [entry["reserva_id"]["$oid"] for entry in page] == ids[-7:]
+
+    for reservation_id in ids:
+        client.put(f"/reserve/finished/{reservation_id}")
+
+
+def test_historial_legacy_user(client, user_and_vehicle):
+    _, vehicle_id = user_and_vehicle
+    # usuario con el historial completo en el documento, de antes de los buckets
+    legacy = [
+        historial_entry(ObjectId(), datetime(2024, 1, day))
+        for day in range(1, HISTORIAL_RECENT + 6)
+    ]
+    user_id = mongo.db.usuarios.insert_one(
+        {
+            "nombre": "Historial Antiguo",
+            "email": "historial.antiguo@example.com",
+            "estado": False,
+            "historial_reservas": legacy,
+        }
+    ).inserted_id
+
+    # reservar antes de migrar no pierde las entradas antiguas
+    reservation = {
+        "id_usuario": str(user_id),
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(60),
+        "fecha_fin": future(60),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+    assert not migrate_user_historial(user_id)
+
+    response = client.get(f"/users/{user_id}/historial?limit=100")
+    page = json.loads(response.data)
+    assert [entry["reserva_id"]["$oid"] for entry in page] == [
+        str(entry["reserva_id"]) for entry in legacy
+    ] + [reservation_id]
+    user = mongo.db.usuarios.find_one({"_id": user_id})
+    assert user["historial_total"] == len(legacy) + 1
+    assert len(user["historial_reservas"]) == HISTORIAL_RECENT
+
+    client.put(f"/reserve/finished/{reservation_id}")
+    client.delete(f"/users/{user_id}")
+
+
+def test_most_reserved_vehicles(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    reservation = {
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": future(40),
+        "fecha_fin": future(41),
+    }
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+
+    response = client.get("/reserve/vehicle/")
+    assert response.status_code == 200
+    assert "cantidad_reservas" in json.loads(response.data)
+
+    response = client.get("/reserve/vehicles/1000")
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert vehicle_id in [item["id_vehiculo"]["$oid"] for item in data]
+    counts = [item["cantidad_reservas"] for item in data]
+    assert counts == sorted(counts, reverse=True)
+
+    response = client.put(f"/reserve/finished/{reservation_id}")
+    assert response.status_code == 200
+
+
+def test_block_user_after_cancellations(client, user_and_vehicle):
+    user_id, vehicle_id = user_and_vehicle
+    # Más de 3 cancelaciones en 7 días bloquean al usuario
+    for day in range(50, 58, 2):
+        reservation = {
+            "id_usuario": user_id,
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": future(day),
+            "fecha_fin": future(day),
+        }
+        response = client.post("/reserve", json=reservation)
+        assert response.status_code == 201
+        reservation_id = json.loads(response.data)["_id"]["$oid"]
+        response = client.put(f"/reserve/{reservation_id}")
+        assert response.status_code == 200
+
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 403
+
+    response = client.get("/reserve/users/1000?days=7")
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    user = next(item for item in data if item["id_usuario"]["$oid"] == user_id)
+    assert user["cantidad_cancelaciones"] >= 4
+    assert "historial_reservas" not in user["usuario"]
+    response = client.get("/reserve/users/1?days=0")
+    assert response.status_code == 400
+    # el ranking no puede ir más atrás que la retención de cancelaciones
+    response = client.get("/reserve/users/1?days=100000")
+    assert response.status_code == 400
+
+    response = client.put(f"/reserve/user/{user_id}")
+    assert response.status_code == 200
+    response = client.post("/reserve", json=reservation)
+    assert response.status_code == 201
+    reservation_id = json.loads(response.data)["_id"]["$oid"]
+    response = client.put(f"/reserve/finished/{reservation_id}")
+    assert response.status_code == 200
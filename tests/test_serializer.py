@@ -0,0 +1,32 @@
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId, json_util
+
+from utils.serializer import dumps
+
+DOCUMENT = {
+    "_id": ObjectId(),
+    "fecha": datetime(2025, 3, 1, 10, 30, 0, 250000),
+    "historial": [{"reserva_id": ObjectId(), "fecha": datetime(2025, 3, 2)}],
+    "estado": True,
+}
+
+
+def test_extended_mode_matches_json_util():
+    assert json.loads(dumps(DOCUMENT, mode="extended")) == json.loads(
+        json_util.dumps(DOCUMENT)
+    )
+
+
+def test_plain_mode():
+    result = json.loads(dumps(DOCUMENT, mode="plain"))
+    assert result["_id"] == str(DOCUMENT["_id"])
+    assert result["fecha"] == "2025-03-01T10:30:00.250000"
+    assert result["historial"][0]["fecha"] == "2025-03-02T00:00:00"
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        dumps(DOCUMENT, mode="xml")
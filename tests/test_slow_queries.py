@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from pymongo.monitoring import CommandStartedEvent, CommandSucceededEvent
+
+from utils.slow_queries import SlowQueryLog, plan_stages, query_shape
+
+COLLSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {"stage": "COLLSCAN", "filter": {"id_usuario": {"$eq": 1}}}
+    }
+}
+IXSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "stage": "FETCH",
+            "inputStage": {"stage": "IXSCAN", "indexName": "usuario_id"},
+        }
+    }
+}
+
+
+class Database:
+    def command(self, command):
+        return COLLSCAN_EXPLAIN
+
+
+def run(log, command, duration_ms):
+    name = next(iter(command))
+    log.started(CommandStartedEvent(command, "reservas_db", 1, ("db", 27017), 1))
+    log.succeeded(
+        CommandSucceededEvent(
+            timedelta(milliseconds=duration_ms), {"ok": 1}, name, 1, ("db", 27017), 1
+        )
+    )
+
+
+def test_query_shape():
+    shape = query_shape(
+        {"id_vehiculo": 1, "fecha_inicio": {"$lte": 2}, "_id": {"$in": [1, 2, 3]}}
+    )
+    assert shape == {
+        "id_vehiculo": "?",
+        "fecha_inicio": {"$lte": "?"},
+        "_id": {"$in": ["?"]},
+    }
+
+
+def test_plan_stages():
+    assert plan_stages(COLLSCAN_EXPLAIN) == ["COLLSCAN"]
+    assert plan_stages(IXSCAN_EXPLAIN) == ["FETCH", "IXSCAN(usuario_id)"]
+    aggregate = {"stages": [{"$cursor": IXSCAN_EXPLAIN}, {"$group": {}}]}
+    assert plan_stages(aggregate) == ["FETCH", "IXSCAN(usuario_id)"]
+
+
+def test_slow_query_log():
+    log = SlowQueryLog(threshold_ms=50, size=10)
+    log.bind(lambda: {"reservas_db": Database()})
+    run(log, {"find": "reservas", "filter": {"id_usuario": 7}}, 10)
+    assert log.recent() == []
+
+    run(log, {"find": "reservas", "filter": {"id_usuario": 7}, "lsid": {}}, 80)
+    log._executor.shutdown(wait=True)
+    [entry] = log.recent()
+    assert entry["collection"] == "reservas"
+    assert entry["shape"] == {"id_usuario": "?"}
+    assert entry["plan"] == "COLLSCAN"
+    assert entry["collscan"] is True
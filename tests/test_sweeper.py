@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+
+from app import mongo
+from bson import ObjectId
+from utils.common import historial_entry, occupancy_slots
+from utils.sweeper import Sweeper, utcnow
+from utils.utils import (
+    append_historial,
+    finish_expired_reservations,
+    rebuild_occupancy,
+    release_orphan_slots,
+    unblock_expired_users,
+)
+
+
+def test_lease():
+    sweeper = Sweeper("test_lease", interval=60)
+    sweeper.bind(lambda: mongo.db, lambda: {"ok": 1})
+    now = utcnow()
+    mongo.db.tareas.delete_one({"_id": "test_lease"})
+    mongo.db.tareas.insert_one(
+        {
+            "_id": "test_lease",
+            "propietario": "otro-host:1",
+            "hasta": now + timedelta(seconds=60),
+        }
+    )
+    # la concesión vigente de otro proceso impide ejecutar la tarea
+    assert sweeper.run_once(now) is None
+
+    # vencida, la toma este proceso y guarda el resultado
+    assert sweeper.run_once(now + timedelta(seconds=61)) == {"ok": 1}
+    task = mongo.db.tareas.find_one({"_id": "test_lease"})
+    assert task["propietario"] == sweeper.owner
+    assert task["resultado"] == {"ok": 1}
+    # el dueño la renueva antes de que venza
+    assert sweeper.acquire(now + timedelta(seconds=62))
+    # al liberarla queda vencida y otro proceso la toma sin esperar dos intervalos
+    sweeper.release(now + timedelta(seconds=63))
+    task = mongo.db.tareas.find_one({"_id": "test_lease"})
+    assert task["hasta"] <= now + timedelta(seconds=63)
+    # solo el dueño la libera
+    mongo.db.tareas.update_one(
+        {"_id": "test_lease"},
+        {"$set": {"propietario": "otro-host:1", "hasta": now + timedelta(days=1)}},
+    )
+    sweeper.release(now + timedelta(seconds=64))
+    assert not sweeper.acquire(now + timedelta(seconds=64))
+    mongo.db.tareas.delete_one({"_id": "test_lease"})
+
+
+def test_finish_expired_reservations():
+    user_id = mongo.db.usuarios.insert_one(
+        {
+            "nombre": "Barrido",
+            "email": "barrido@example.com",
+            "estado": False,
+            "historial_reservas": [],
+        }
+    ).inserted_id
+    vehicle_id = ObjectId()
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    expired = [
+        {
+            "_id": ObjectId(),
+            "id_usuario": user_id,
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": today - timedelta(days=days + 1),
+            "fecha_fin": today - timedelta(days=days),
+            "estado": "activa",
+        }
+        for days in (5, 2)
+    ]
+    current = dict(
+        expired[0],
+        _id=ObjectId(),
+        fecha_inicio=today - timedelta(days=1),
+        fecha_fin=today,
+    )
+    mongo.db.reservas.insert_many(expired + [current])
+    append_historial(
+        {
+            user_id: [
+                historial_entry(reservation["_id"], reservation["fecha_inicio"])
+                for reservation in expired + [current]
+            ]
+        }
+    )
+
+    summary = finish_expired_reservations(batch_size=1)
+    assert summary["reservas"] >= 2
+    assert summary["lotes"] >= 2
+
+    states = {
+        reservation["_id"]: reservation["estado"]
+        for reservation in mongo.db.reservas.find({"id_usuario": user_id})
+    }
+    assert states == {
+        expired[0]["_id"]: "terminada",
+        expired[1]["_id"]: "terminada",
+        current["_id"]: "activa",
+    }
+    user = mongo.db.usuarios.find_one({"_id": user_id})
+    assert [entry["estado"] for entry in user["historial_reservas"]] == [
+        "terminada",
+        "terminada",
+        "confirmada",
+    ]
+    bucket = mongo.db.historial_buckets.find_one({"id_usuario": user_id})
+    assert [entry["estado"] for entry in bucket["entradas"]] == [
+        "terminada",
+        "terminada",
+        "confirmada",
+    ]
+
+    mongo.db.reservas.delete_many({"id_usuario": user_id})
+    mongo.db.historial_buckets.delete_many({"id_usuario": user_id})
+    mongo.db.usuarios.delete_one({"_id": user_id})
+
+
+def test_unblock_expired_users():
+    now = datetime.now()
+    expired, current = [
+        mongo.db.usuarios.insert_one(
+            {
+                "nombre": "Bloqueado",
+                "email": f"bloqueado{days}@example.com",
+                "estado": True,
+                "bloqueado_hasta": now + timedelta(days=days),
+                "historial_reservas": [],
+            }
+        ).inserted_id
+        for days in (-1, 1)
+    ]
+    assert unblock_expired_users(now) == 1
+    user = mongo.db.usuarios.find_one({"_id": expired})
+    assert user["estado"] is False and "bloqueado_hasta" not in user
+    assert mongo.db.usuarios.find_one({"_id": current})["estado"] is True
+    assert unblock_expired_users(now) == 0
+    mongo.db.usuarios.delete_many({"_id": {"$in": [expired, current]}})
+
+
+def test_release_orphan_slots():
+    vehicle_id = ObjectId()
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    active, cancelled, missing = [
+        {
+            "_id": ObjectId(),
+            "id_vehiculo": vehicle_id,
+            "fecha_inicio": today + timedelta(days=day),
+            "fecha_fin": today + timedelta(days=day + 1),
+            "estado": estado,
+        }
+        for day, estado in ((1, "activa"), (4, "cancelado"), (7, "activa"))
+    ]
+    mongo.db.reservas.insert_many([active, cancelled])
+    mongo.db.ocupacion.insert_many(
+        [
+            slot
+            for reservation in (active, cancelled, missing)
+            for slot in occupancy_slots(reservation)
+        ]
+    )
+    # una reserva que se está creando todavía no se toca
+    assert release_orphan_slots(utcnow() - timedelta(minutes=1)) == 0
+    assert release_orphan_slots(utcnow() + timedelta(seconds=1)) == 4
+    assert {
+        slot["id_reserva"]
+        for slot in mongo.db.ocupacion.find({"id_vehiculo": vehicle_id})
+    } == {active["_id"]}
+    # la siguiente ejecución empieza donde terminó esta: un día de una reserva más
+    # vieja queda para rebuild_occupancy
+    old = {
+        "id_vehiculo": vehicle_id,
+        "dia": today,
+        "id_reserva": ObjectId.from_datetime(utcnow() - timedelta(hours=2)),
+    }
+    mongo.db.ocupacion.insert_one(old)
+    assert release_orphan_slots() == 0
+    assert release_orphan_slots(since=utcnow() - timedelta(hours=3)) == 1
+
+    # rebuild_occupancy agrega los días que faltan y quita los que sobran
+    mongo.db.ocupacion.delete_one({"id_reserva": active["_id"]})
+    mongo.db.ocupacion.insert_many(occupancy_slots(cancelled))
+    rebuild_occupancy()
+    slots = list(mongo.db.ocupacion.find({"id_vehiculo": vehicle_id}))
+    assert sorted(slot["dia"] for slot in slots) == [
+        slot["dia"] for slot in occupancy_slots(active)
+    ]
+    mongo.db.ocupacion.delete_many({"id_vehiculo": vehicle_id})
+    mongo.db.reservas.delete_many({"id_vehiculo": vehicle_id})
+
+
+def test_stop_waits_for_thread():
+    sweeper = Sweeper("test_stop", interval=0.01)
+    sweeper.bind(lambda: mongo.db, lambda: {"ok": 1})
+    sweeper.start()
+    sweeper.stop(timeout=5)
+    # al volver de stop el hilo ya terminó y no usa el cliente
+    assert not sweeper._thread.is_alive()
+    mongo.db.tareas.delete_one({"_id": "test_stop"})
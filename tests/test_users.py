@@ -87,3 +87,33 @@ def test_update_user(client):
     # Borrar el usuario después de la prueba
     response = client.delete(f"/users/{user_id}")
     assert response.status_code == 204
+
+
+def test_get_users_projection(client):
+    new_user = {"nombre": "Marta Ruiz", "email": "marta.ruiz@example.com"}
+    response = client.post("/users", json=new_user)
+    assert response.status_code == 201
+    user_id = json.loads(response.data)["id"]
+
+    # El listado no incluye el historial por defecto
+    response = client.get("/users")
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert all("historial_reservas" not in user for user in data)
+
+    response = client.get(f"/users/{user_id}?fields=email")
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data["email"] == "marta.ruiz@example.com"
+    assert "nombre" not in data
+
+    response = client.get(f"/users/{user_id}?fields=email&exclude=nombre")
+    assert response.status_code == 400
+
+    response = client.get(f"/users/{user_id}/historial?limit=10")
+    assert response.status_code == 200
+    assert json.loads(response.data) == []
+
+    # Borrar el usuario después de la prueba
+    response = client.delete(f"/users/{user_id}")
+    assert response.status_code == 204
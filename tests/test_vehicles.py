@@ -2,6 +2,7 @@ import json
 import pytest
 from app import app
 from bson import ObjectId
+from utils.utils import get_version
 
 
 @pytest.fixture
@@ -79,6 +80,15 @@ def test_update_vehicle(client):
     assert response.status_code == 204
 
 
+def test_update_missing_vehicle(client):
+    version = get_version("vehiculos")
+    updated_vehicle = {"placa": "NOX001", "tipo": "SUV", "disponibilidad": True}
+    response = client.put(f"/vehicles/{ObjectId()}", json=updated_vehicle)
+    assert response.status_code == 404
+    # un 404 no cambia la versión, así que los ETag de /vehicles siguen valiendo
+    assert get_version("vehiculos") == version
+
+
 def test_delete_vehicle(client):
     new_vehicle = {"placa": "GHI987", "tipo": "Camioneta"}
     response = client.post("/vehicles", json=new_vehicle)
@@ -92,3 +102,95 @@ def test_delete_vehicle(client):
     data = json.loads(response.data)
     assert "error" in data
     assert "Vehicle not found" in data["error"]
+
+
+def test_get_vehicles_pagination(client):
+    vehicle_ids = []
+    for placa in ["PAG001", "PAG002", "PAG003"]:
+        response = client.post("/vehicles", json={"placa": placa, "tipo": "Sedán"})
+        assert response.status_code == 201
+        vehicle_ids.append(json.loads(response.data)["id"])
+
+    response = client.get("/vehicles?limit=2")
+    assert response.status_code == 200
+    assert "X-Total-Count" in response.headers
+    data = json.loads(response.data)
+    assert len(data) == 2
+
+    # Recorremos todas las páginas con el cursor hasta la última
+    seen = [vehicle["_id"]["$oid"] for vehicle in data]
+    cursor = response.headers.get("X-Next-Cursor")
+    while cursor:
+        response = client.get(f"/vehicles?limit=2&after={cursor}")
+        assert response.status_code == 200
+        seen.extend(vehicle["_id"]["$oid"] for vehicle in json.loads(response.data))
+        cursor = response.headers.get("X-Next-Cursor")
+    assert len(seen) == len(set(seen))
+    assert set(vehicle_ids) <= set(seen)
+
+    response = client.get("/vehicles?limit=0")
+    assert response.status_code == 400
+
+    # Borrar los vehículos después de la prueba
+    for vehicle_id in vehicle_ids:
+        response = client.delete(f"/vehicles/{vehicle_id}")
+        assert response.status_code == 204
+
+
+def test_update_vehicle_duplicate_plate(client):
+    response = client.post("/vehicles", json={"placa": "UPD001", "tipo": "SUV"})
+    assert response.status_code == 201
+    vehicle_id_1 = json.loads(response.data)["id"]
+    response = client.post("/vehicles", json={"placa": "UPD002", "tipo": "SUV"})
+    assert response.status_code == 201
+    vehicle_id_2 = json.loads(response.data)["id"]
+
+    # Actualizar el segundo vehículo con la placa del primero
+    updated_vehicle = {"placa": "UPD001", "tipo": "SUV", "disponibilidad": True}
+    response = client.put(f"/vehicles/{vehicle_id_2}", json=updated_vehicle)
+    assert response.status_code == 400
+    assert "Vehicle already exists" in json.loads(response.data)["error"]
+
+    response = client.put(f"/vehicles/{ObjectId()}", json=updated_vehicle)
+    assert response.status_code == 404
+
+    # Borrar los vehículos después de la prueba
+    for vehicle_id in [vehicle_id_1, vehicle_id_2]:
+        response = client.delete(f"/vehicles/{vehicle_id}")
+        assert response.status_code == 204
+
+
+def test_conditional_get_vehicle(client):
+    response = client.post("/vehicles", json={"placa": "ETG001", "tipo": "SUV"})
+    assert response.status_code == 201
+    vehicle_id = json.loads(response.data)["id"]
+
+    response = client.get(f"/vehicles/{vehicle_id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "public, no-cache"
+
+    # Sin cambios el servidor responde 304 sin cuerpo
+    response = client.get(f"/vehicles/{vehicle_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # Una actualización cambia la versión del documento
+    response = client.put(
+        f"/vehicles/{vehicle_id}",
+        json={"placa": "ETG001", "tipo": "Sedán", "disponibilidad": False},
+    )
+    assert response.status_code == 200
+    response = client.get(f"/vehicles/{vehicle_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert json.loads(response.data)["tipo"] == "Sedán"
+
+    # El ETag del listado depende de la query string
+    first = client.get("/vehicles?limit=1").headers["ETag"]
+    assert first != client.get("/vehicles?limit=2").headers["ETag"]
+
+    response = client.delete(f"/vehicles/{vehicle_id}")
+    assert response.status_code == 204
+    response = client.get("/vehicles?limit=1", headers={"If-None-Match": first})
+    assert response.status_code == 200
@@ -0,0 +1,60 @@
+import inspect
+
+from bson import json_util
+from pymongo import AsyncMongoClient, uri_parser
+from quart.json.provider import JSONProvider
+from utils.serializer import dumps
+
+
+class BSONProvider(JSONProvider):
+    """Serializa las respuestas JSON de Quart con utils.serializer y lee con bson.json_util."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return json_util.loads(s)
+
+
+class AsyncPyMongo:
+    """
+    Equivalente asíncrono de flask_pymongo.PyMongo para la aplicación Quart
+
+    Expone el cliente en cx y la base de datos del MONGO_URI en db. Se puede entregar
+    un cliente ya creado (por ejemplo uno en memoria para pruebas) en init_app.
+    """
+
+    def __init__(self, app=None, uri=None, *args, **kwargs):
+        self.cx = None
+        self.db = None
+        if app is not None:
+            self.init_app(app, uri, *args, **kwargs)
+
+    def init_app(self, app, uri=None, *args, client=None, **kwargs):
+        if uri is None:
+            uri = app.config.get("MONGO_URI", None)
+        if uri is None:
+            raise ValueError(
+                "You must specify a URI or set the MONGO_URI Quart config variable"
+            )
+        database_name = uri_parser.parse_uri(uri)["database"]
+
+        # AsyncMongoClient no se conecta hasta la primera operación
+        self.cx = (
+            client if client is not None else AsyncMongoClient(uri, *args, **kwargs)
+        )
+        self.db = self.cx[database_name] if database_name else None
+        app.json = BSONProvider(app)
+
+
+async def aggregate(collection, pipeline, **kwargs):
+    """
+    Ejecuta un pipeline de agregación y devuelve el cursor
+
+    AsyncCollection.aggregate es una corrutina, mientras que los clientes estilo Motor
+    devuelven el cursor directamente; aquí se aceptan ambos.
+    """
+    cursor = collection.aggregate(pipeline, **kwargs)
+    if inspect.isawaitable(cursor):
+        cursor = await cursor
+    return cursor
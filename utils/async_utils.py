@@ -0,0 +1,455 @@
+from app_async import mongo
+from bson import ObjectId
+from functools import wraps
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from quart import Response, jsonify, make_response, request
+from utils.async_mongo import aggregate
+from utils.availability import availability
+from utils.cache import refresh_on_version, user_cache
+from utils.occupancy import occupancy
+from utils.sweeper import (
+    SWEEPER_BATCH_SIZE,
+    SWEEPER_MAX_BATCHES,
+    SWEEPER_ORPHAN_WINDOW,
+    SWEEPER_SLOT_GRACE,
+    ORPHAN_SLOTS_TASK,
+    utcnow,
+)
+from utils.profiles import get_collection
+from utils.common import *
+
+# Versiones asíncronas de las funciones de utils/utils.py para la aplicación Quart
+
+
+async def cached_find_one(cache, collection, id):
+    """
+    Lectura a través de la caché con el cliente asíncrono, ver utils.cache.cached_find_one
+
+    Args:
+        cache: TTLCache a usar
+        collection: Colección del cliente asíncrono
+        id: _id del documento
+    returns:
+        dict | None: El documento, que no debe modificarse porque es compartido
+    """
+    document = cache.get(id)
+    if document is None:
+        document = await collection.find_one({"_id": id})
+        if document is not None:
+            cache.set(id, document)
+    return document
+
+
+async def check_reserve(vehicle_id, start_date, end_date):
+    """
+    Verifica si existe una reserva activa que se superponga con las fechas entregadas
+
+    Args:
+        vehicle_id: Id del vehiculo
+        start_date: Fecha inicial
+        end_date: Fecha final
+    returns:
+        reservation: Una reserva que se superpone con las fechas, o None si están libres
+    """
+    warm, hint = availability.find_conflict(vehicle_id, start_date, end_date)
+    if warm and hint is None:
+        return None
+    # la validación de create_reservation siempre lee del primario
+    reservas = get_collection(mongo.db, "reservas", "primary")
+    reservation = await reservas.find_one(
+        overlap_query(vehicle_id, start_date, end_date),
+        {"fecha_inicio": 1, "fecha_fin": 1},
+    )
+    if not warm or reservation is None or reservation["_id"] != hint["_id"]:
+        await availability.warm_async(reservas, vehicle_id)
+    return reservation
+
+
+async def claim_slots(reservations):
+    """Versión asíncrona de utils.utils.claim_slots."""
+    slots = [
+        slot for reservation in reservations for slot in occupancy_slots(reservation)
+    ]
+    if not slots:
+        return set()
+    try:
+        await mongo.db.ocupacion.insert_many(slots, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+            await release_slots([reservation["_id"] for reservation in reservations])
+            raise
+        rejected = {slots[error["index"]]["id_reserva"] for error in errors}
+        await release_slots(rejected)
+        return rejected
+    return set()
+
+
+async def release_slots(reservation_ids):
+    """Versión asíncrona de utils.utils.release_slots."""
+    await mongo.db.ocupacion.delete_many({"id_reserva": {"$in": list(reservation_ids)}})
+
+
+async def find_slot_conflict(reservation):
+    """Versión asíncrona de utils.utils.find_slot_conflict."""
+    slot = await mongo.db.ocupacion.find_one(slot_conflict_query(reservation))
+    if slot is None:
+        return None
+    return await mongo.db.reservas.find_one(
+        {"_id": slot["id_reserva"]}, {"fecha_inicio": 1, "fecha_fin": 1}
+    )
+
+
+async def update_historial(user_id, reserva_id, start_date):
+    """
+    Actualiza el historial de reservas en el usuario asignado
+
+    Args:
+        user_id: Id del usuario
+        reserva_id: Id de la reserva
+        start_date: Fecha inicial
+    """
+    await append_historial({user_id: [historial_entry(reserva_id, start_date)]})
+
+
+async def append_historial(historial):
+    """Versión asíncrona de utils.utils.append_historial."""
+    if not historial:
+        return
+    await mongo.db.usuarios.bulk_write(historial_user_writes(historial), ordered=False)
+    users = await mongo.db.usuarios.find(
+        {"_id": {"$in": list(historial)}},
+        {"historial_total": 1, "historial_reservas.reserva_id": 1},
+    ).to_list(None)
+    positions, legacy = historial_positions(users, historial)
+    for user_id in legacy:
+        await migrate_user_historial(user_id)
+        user = await mongo.db.usuarios.find_one_and_update(
+            {"_id": user_id, "historial_total": {"$exists": True}},
+            historial_user_update(historial[user_id]),
+            projection={"historial_total": 1},
+        )
+        if user is not None:
+            positions[user_id] = user["historial_total"]
+    buckets = [
+        write
+        for user_id, position in positions.items()
+        for write in historial_bucket_writes(user_id, historial[user_id], position)
+    ]
+    if buckets:
+        await mongo.db.historial_buckets.bulk_write(buckets, ordered=False)
+    for user_id in historial:
+        user_cache.invalidate(user_id)
+    await bump_versions("usuarios", list(historial))
+
+
+async def migrate_user_historial(user_id):
+    """Versión asíncrona de utils.utils.migrate_user_historial."""
+    query = {"_id": user_id, "historial_total": {"$exists": False}}
+    user = await mongo.db.usuarios.find_one(query, {"historial_reservas": 1})
+    if user is None:
+        return False
+    entries = user.get("historial_reservas", [])
+    result = await mongo.db.usuarios.update_one(
+        query, {"$set": {"historial_total": len(entries)}}
+    )
+    if result.modified_count == 0:
+        return False
+    if entries:
+        await mongo.db.historial_buckets.bulk_write(
+            historial_bucket_writes(user_id, entries, 0, prepend=True), ordered=False
+        )
+        await mongo.db.usuarios.update_one(
+            {"_id": user_id},
+            {
+                "$push": {
+                    "historial_reservas": {"$each": [], "$slice": -HISTORIAL_RECENT}
+                }
+            },
+        )
+    user_cache.invalidate(user_id)
+    await bump_versions("usuarios", [user_id])
+    return True
+
+
+async def cancel_historial_entry(user_id, reserva_id, until):
+    """Versión asíncrona de utils.utils.cancel_historial_entry."""
+    await mongo.db.usuarios.update_one(
+        {"_id": user_id},
+        block_update(until, {"historial_reservas.$[entrada].estado": "cancelado"}),
+        array_filters=[{"entrada.reserva_id": reserva_id}],
+    )
+    await mongo.db.historial_buckets.update_one(
+        {"id_usuario": user_id, "entradas.reserva_id": reserva_id},
+        {"$set": {"entradas.$.estado": "cancelado"}},
+    )
+    user_cache.invalidate(user_id)
+    await bump_versions("usuarios", [user_id])
+
+
+async def set_historial_estado(reservations, estado):
+    """Versión asíncrona de utils.utils.set_historial_estado."""
+    users, buckets = historial_estado_writes(reservations, estado)
+    await mongo.db.usuarios.bulk_write(users, ordered=False)
+    await mongo.db.historial_buckets.bulk_write(buckets, ordered=False)
+    for user_id in reservations:
+        user_cache.invalidate(user_id)
+    await bump_versions("usuarios", list(reservations))
+
+
+async def finish_expired_reservations(
+    now=None, batch_size=SWEEPER_BATCH_SIZE, max_batches=SWEEPER_MAX_BATCHES
+):
+    """Versión asíncrona de utils.utils.finish_expired_reservations."""
+    query = expired_reservations_query(now)
+    summary = {"reservas": 0, "usuarios": 0, "lotes": 0}
+    users = set()
+    while summary["lotes"] < max_batches:
+        batch = (
+            await mongo.db.reservas.find(
+                query,
+                {"id_usuario": 1, "id_vehiculo": 1, "fecha_inicio": 1, "fecha_fin": 1},
+            )
+            .limit(batch_size)
+            .to_list(None)
+        )
+        if not batch:
+            break
+        ids = [reservation["_id"] for reservation in batch]
+        result = await mongo.db.reservas.update_many(
+            {"_id": {"$in": ids}, "estado": "activa"},
+            {"$set": {"estado": "terminada"}},
+        )
+        await release_slots(ids)
+        by_user = {}
+        for reservation in batch:
+            availability.remove(reservation["id_vehiculo"], reservation["_id"])
+            occupancy.remove(
+                reservation["id_vehiculo"],
+                reservation["fecha_inicio"],
+                reservation["fecha_fin"],
+            )
+            by_user.setdefault(reservation["id_usuario"], []).append(reservation["_id"])
+        await set_historial_estado(by_user, "terminada")
+        users.update(by_user)
+        summary["reservas"] += result.modified_count
+        summary["lotes"] += 1
+        if len(batch) < batch_size:
+            break
+    summary["usuarios"] = len(users)
+    return summary
+
+
+async def unblock_expired_users(now=None):
+    """Versión asíncrona de utils.utils.unblock_expired_users."""
+    query = expired_blocks_query(now)
+    users = await mongo.db.usuarios.find(query, {"_id": 1}).to_list(None)
+    ids = [user["_id"] for user in users]
+    if not ids:
+        return 0
+    result = await mongo.db.usuarios.update_many(
+        {"_id": {"$in": ids}, **query}, block_update(None)
+    )
+    for user_id in ids:
+        user_cache.invalidate(user_id)
+    await bump_versions("usuarios", ids)
+    return result.modified_count
+
+
+async def release_orphan_slots(before=None, since=None):
+    """Versión asíncrona de utils.utils.release_orphan_slots."""
+    before = before or utcnow() - timedelta(seconds=SWEEPER_SLOT_GRACE)
+    if since is None:
+        task = await mongo.db.tareas.find_one({"_id": ORPHAN_SLOTS_TASK}, {"hasta": 1})
+        since = (
+            task["hasta"] if task else before - timedelta(seconds=SWEEPER_ORPHAN_WINDOW)
+        )
+    cursor = await aggregate(mongo.db.ocupacion, orphan_slots_pipeline(since, before))
+    orphans = [slot["_id"] for slot in await cursor.to_list(None)]
+    released = 0
+    if orphans:
+        result = await mongo.db.ocupacion.delete_many({"id_reserva": {"$in": orphans}})
+        released = result.deleted_count
+    await mongo.db.tareas.update_one(
+        {"_id": ORPHAN_SLOTS_TASK}, {"$max": {"hasta": before}}, upsert=True
+    )
+    return released
+
+
+async def run_maintenance(now=None):
+    """Versión asíncrona de utils.utils.run_maintenance."""
+    summary = await finish_expired_reservations(now)
+    summary["desbloqueados"] = await unblock_expired_users(now)
+    summary["dias_liberados"] = await release_orphan_slots()
+    return summary
+
+
+async def historial_page(user_id, offset, limit):
+    """Versión asíncrona de utils.utils.historial_page."""
+    buckets = (
+        await mongo.db.historial_buckets.find({"id_usuario": user_id}, {"cantidad": 1})
+        .sort("seq", 1)
+        .to_list(None)
+    )
+    if not buckets:
+        return None
+    page = []
+    for index, start, end in bucket_ranges(
+        [bucket["cantidad"] for bucket in buckets], offset, limit
+    ):
+        bucket = await mongo.db.historial_buckets.find_one(
+            {"_id": buckets[index]["_id"]},
+            {"_id": 0, "entradas": {"$slice": [start, end - start]}},
+        )
+        page.extend(bucket["entradas"])
+    return page
+
+
+async def register_cancellation(user_id, when):
+    """
+    Suma una cancelación al contador diario del usuario y devuelve el total de la ventana
+
+    Args:
+        user_id: Id del usuario
+        when: Fecha de la cancelación
+    returns:
+        tuple(int, datetime | None): Cancelaciones del usuario en los últimos
+        CANCELLATION_WINDOW_DAYS días y fin del bloqueo si supera CANCELLATION_LIMIT
+    """
+    window = await mongo.db.cancelaciones_ventana.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {f"dias.{when.strftime('%Y-%m-%d')}": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    count, stale = cancellation_window(window["dias"], when)
+    if stale:
+        await mongo.db.cancelaciones_ventana.update_one(
+            {"_id": user_id}, {"$unset": {f"dias.{day}": "" for day in stale}}
+        )
+    return count, blocked_until(window["dias"], when)
+
+
+async def update_reservation_counters(counts):
+    """
+    Suma reservas a los contadores por vehículo de la colección conteo_reservas
+
+    Args:
+        counts: dict {id_vehiculo: cantidad de reservas nuevas}
+    """
+    await mongo.db.conteo_reservas.bulk_write(
+        reservation_counter_writes(counts), ordered=False
+    )
+
+
+async def join_export_batch(reservations):
+    """Versión asíncrona de utils.utils.join_export_batch."""
+    users = get_collection(mongo.db, "usuarios", "analytics").find(
+        {"_id": {"$in": list({r["id_usuario"] for r in reservations})}}, {"email": 1}
+    )
+    vehicles = get_collection(mongo.db, "vehiculos", "analytics").find(
+        {"_id": {"$in": list({r["id_vehiculo"] for r in reservations})}}, {"placa": 1}
+    )
+    emails = {user["_id"]: user.get("email") async for user in users}
+    placas = {vehicle["_id"]: vehicle.get("placa") async for vehicle in vehicles}
+    for reservation in reservations:
+        reservation["email"] = emails.get(reservation["id_usuario"])
+        reservation["placa"] = placas.get(reservation["id_vehiculo"])
+
+
+async def export_reservations(query, format, join=False, batch_size=EXPORT_BATCH_SIZE):
+    """Versión asíncrona de utils.utils.export_reservations."""
+    yield export_header(format)
+    cursor = (
+        get_collection(mongo.db, "reservas", "analytics")
+        .find(query)
+        .sort("fecha_inicio", 1)
+        .batch_size(batch_size)
+    )
+    batch = []
+    async for reservation in cursor:
+        batch.append(reservation)
+        if len(batch) >= batch_size:
+            if join:
+                await join_export_batch(batch)
+            yield export_lines(batch, format)
+            batch = []
+    if batch:
+        if join:
+            await join_export_batch(batch)
+        yield export_lines(batch, format)
+
+
+async def paginated_response(collection, query, limit, after, projection=None):
+    """Versión asíncrona de utils.utils.paginated_response."""
+    total = None
+    if not query:
+        total = await collection.estimated_document_count()
+    elif request.args.get("count") in ("1", "true"):
+        total = await collection.count_documents(query)
+
+    documents = await (
+        collection.find(page_query(query, after), page_projection(projection))
+        .sort("_id", 1)
+        .limit(limit + 1)
+    ).to_list(limit + 1)
+    page, after = page_split(documents, limit, projection)
+    return Response(
+        dumps(page),
+        mimetype="application/json",
+        status=200,
+        headers=page_headers(total, after),
+    )
+
+
+async def bump_versions(collection, ids=()):
+    """Versión asíncrona de utils.utils.bump_versions."""
+    await mongo.db.versiones.bulk_write(version_updates(collection, ids), ordered=False)
+
+
+async def get_version(collection, id=None):
+    """Versión asíncrona de utils.utils.get_version."""
+    document = await mongo.db.versiones.find_one({"_id": version_key(collection, id)})
+    return document["version"] if document else 0
+
+
+def admin_only(view):
+    """Versión asíncrona de utils.utils.admin_only."""
+
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        denied = admin_denied(request.headers.get("Authorization"))
+        if denied is not None:
+            error, status = denied
+            return jsonify(error), status
+        return await view(*args, **kwargs)
+
+    return wrapper
+
+
+def conditional(collection, id_arg=None, cache=None):
+    """Versión asíncrona de utils.utils.conditional para las rutas de Quart."""
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            id = kwargs.get(id_arg) if id_arg else None
+            key = version_key(collection, id)
+            version = await get_version(collection, id)
+            if cache is not None and ObjectId.is_valid(id):
+                refresh_on_version(cache, key, ObjectId(id), version)
+            etag = make_etag(version, request.full_path)
+            if request.if_none_match.contains(etag):
+                response = Response("", status=304)
+            else:
+                response = await make_response(await view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = CACHE_CONTROL
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,189 @@
+import threading
+import time
+from bisect import bisect_right
+
+# Segundos que se confía en los intervalos cargados de un vehículo antes de volver a
+# consultar MongoDB. Acota el desfase con las reservas creadas por otros procesos.
+DEFAULT_TTL = 60
+
+
+class _VehicleIntervals:
+    """
+    Reservas activas de un vehículo ordenadas por fecha de inicio
+
+    max_ends[i] guarda el mayor fecha_fin entre las posiciones 0..i, así la consulta de
+    disponibilidad es una búsqueda binaria aunque existan intervalos solapados.
+    """
+
+    __slots__ = ("starts", "ends", "ids", "max_ends", "loaded_at")
+
+    def __init__(self, loaded_at):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.max_ends = []
+        self.loaded_at = loaded_at
+
+    def _refresh_max_ends(self, position):
+        for i in range(position, len(self.ends)):
+            previous = self.max_ends[i - 1] if i else None
+            if previous is None or self.ends[i] > previous:
+                self.max_ends[i] = self.ends[i]
+            else:
+                self.max_ends[i] = previous
+
+    def add(self, reservation_id, start, end):
+        if reservation_id in self.ids:
+            return
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+        self.ids.insert(position, reservation_id)
+        self.max_ends.insert(position, end)
+        self._refresh_max_ends(position)
+
+    def remove(self, reservation_id):
+        if reservation_id not in self.ids:
+            return
+        position = self.ids.index(reservation_id)
+        del self.starts[position]
+        del self.ends[position]
+        del self.ids[position]
+        del self.max_ends[position]
+        self._refresh_max_ends(position)
+
+    def find_conflict(self, start, end):
+        # último intervalo que empieza antes o el mismo día que termina el pedido
+        position = bisect_right(self.starts, end) - 1
+        if position < 0 or self.max_ends[position] < start:
+            return None
+        # el primer intervalo hacia atrás que termina después del inicio pedido
+        while self.ends[position] < start:
+            position -= 1
+        return {
+            "_id": self.ids[position],
+            "fecha_inicio": self.starts[position],
+            "fecha_fin": self.ends[position],
+        }
+
+
+class AvailabilityIndex:
+    """
+    Índice en memoria de las reservas activas por vehículo
+
+    Responde si [inicio, fin] está libre en O(log n). Un vehículo está "frío" si nunca se
+    cargó o si su carga superó el TTL; en ese caso quien consulta debe ir a MongoDB.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vehicles = {}
+
+    def _get_warm(self, vehicle_id):
+        intervals = self._vehicles.get(vehicle_id)
+        if intervals is None or time.monotonic() - intervals.loaded_at > self.ttl:
+            return None
+        return intervals
+
+    def load(self, vehicle_id, reservations):
+        """
+        Reemplaza los intervalos de un vehículo y lo marca como caliente
+
+        Args:
+            vehicle_id: Id del vehiculo
+            reservations: Iterable de reservas activas con _id, fecha_inicio y fecha_fin
+        """
+        intervals = _VehicleIntervals(time.monotonic())
+        for reservation in reservations:
+            intervals.add(
+                reservation["_id"],
+                reservation["fecha_inicio"],
+                reservation["fecha_fin"],
+            )
+        with self._lock:
+            self._vehicles[vehicle_id] = intervals
+
+    def warm(self, collection, vehicle_id=None):
+        """
+        Carga desde MongoDB las reservas activas de un vehículo o de toda la flota
+
+        Args:
+            collection: Colección de reservas
+            vehicle_id: Id del vehiculo, None para cargar todos los vehículos
+        returns:
+            int: Cantidad de reservas cargadas
+        """
+        by_vehicle = {} if vehicle_id is None else {vehicle_id: []}
+        count = 0
+        for reservation in collection.find(*self._warm_query(vehicle_id)):
+            by_vehicle.setdefault(reservation["id_vehiculo"], []).append(reservation)
+            count += 1
+        for vehicle, reservations in by_vehicle.items():
+            self.load(vehicle, reservations)
+        return count
+
+    async def warm_async(self, collection, vehicle_id=None):
+        """Igual que warm, para una colección del cliente asíncrono."""
+        by_vehicle = {} if vehicle_id is None else {vehicle_id: []}
+        count = 0
+        async for reservation in collection.find(*self._warm_query(vehicle_id)):
+            by_vehicle.setdefault(reservation["id_vehiculo"], []).append(reservation)
+            count += 1
+        for vehicle, reservations in by_vehicle.items():
+            self.load(vehicle, reservations)
+        return count
+
+    @staticmethod
+    def _warm_query(vehicle_id):
+        query = {"estado": "activa"}
+        if vehicle_id is not None:
+            query["id_vehiculo"] = vehicle_id
+        return query, {"id_vehiculo": 1, "fecha_inicio": 1, "fecha_fin": 1}
+
+    def is_warm(self, vehicle_id):
+        with self._lock:
+            return self._get_warm(vehicle_id) is not None
+
+    def find_conflict(self, vehicle_id, start, end):
+        """
+        Busca una reserva activa que se superponga con [start, end]
+
+        Args:
+            vehicle_id: Id del vehiculo
+            start: Fecha inicial
+            end: Fecha final
+        returns:
+            tuple(bool, dict | None): Si el vehículo está caliente y la reserva en
+            conflicto (None si está libre). Si no está caliente el conflicto es None.
+        """
+        with self._lock:
+            intervals = self._get_warm(vehicle_id)
+            if intervals is None:
+                return False, None
+            return True, intervals.find_conflict(start, end)
+
+    def add(self, vehicle_id, reservation_id, start, end):
+        """Registra una reserva activa si el vehículo está cargado."""
+        with self._lock:
+            intervals = self._vehicles.get(vehicle_id)
+            if intervals is not None:
+                intervals.add(reservation_id, start, end)
+
+    def remove(self, vehicle_id, reservation_id):
+        """Quita una reserva que dejó de estar activa si el vehículo está cargado."""
+        with self._lock:
+            intervals = self._vehicles.get(vehicle_id)
+            if intervals is not None:
+                intervals.remove(reservation_id)
+
+    def invalidate(self, vehicle_id=None):
+        """Marca un vehículo (o todos) como frío."""
+        with self._lock:
+            if vehicle_id is None:
+                self._vehicles.clear()
+            else:
+                self._vehicles.pop(vehicle_id, None)
+
+
+availability = AvailabilityIndex()
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Caché en memoria con expulsión LRU por tamaño y expiración por tiempo
+
+    Es segura entre hilos y lleva contadores de aciertos, fallos y expulsiones para
+    dimensionarla.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """Devuelve el valor guardado o None si no existe o ya expiró."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+def cached_find_one(cache, collection, id):
+    """
+    Lectura a través de la caché: busca el documento por _id y lo guarda si existe
+
+    Args:
+        cache: TTLCache a usar
+        collection: Colección de pymongo
+        id: _id del documento
+    returns:
+        dict | None: El documento, que no debe modificarse porque es compartido
+    """
+    document = cache.get(id)
+    if document is None:
+        document = collection.find_one({"_id": id})
+        if document is not None:
+            cache.set(id, document)
+    return document
+
+
+# El catálogo de vehículos casi no cambia, los usuarios cambian con cada reserva
+user_cache = TTLCache(maxsize=1024, ttl=30)
+vehicle_cache = TTLCache(maxsize=1024, ttl=300)
+
+
+# última versión de cada documento vista por este proceso, ver refresh_on_version
+seen_versions = TTLCache(maxsize=4096, ttl=3600)
+
+
+def refresh_on_version(cache, key, id, version):
+    """
+    Descarta un documento de la caché si su versión cambió desde la última vez que este
+    proceso la vio, así las escrituras de otros workers también invalidan esta caché
+
+    Args:
+        cache: TTLCache donde se guarda el documento
+        key: _id del contador de versiones del documento
+        id: _id del documento
+        version: Versión actual del documento
+    """
+    if seen_versions.get(key) != version:
+        cache.invalidate(id)
+        seen_versions.set(key, version)
@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+
+from pymongo.errors import OperationFailure, PyMongoError
+from utils.availability import availability
+from utils.cache import user_cache, vehicle_cache
+from utils.occupancy import occupancy
+
+logger = logging.getLogger(__name__)
+
+# 0 desactiva el listener
+CHANGE_STREAM_ENABLED = os.environ.get("CHANGE_STREAM", "1") == "1"
+# TTL de las cachés mientras el listener las mantiene al día
+CHANGE_STREAM_CACHE_TTL = float(os.environ.get("CHANGE_STREAM_CACHE_TTL", "600"))
+WATCHED_COLLECTIONS = ("usuarios", "vehiculos", "reservas")
+# el resume token ya no está en el oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+# campos de vehiculos que muestra el calendario de ocupación
+OCCUPANCY_FIELDS = {"placa", "tipo"}
+
+
+def clear_caches():
+    """Vacía las cachés que mantiene el listener, por ejemplo al perder eventos."""
+    user_cache.clear()
+    vehicle_cache.clear()
+    availability.invalidate()
+    occupancy.invalidate()
+
+
+def apply_change(change):
+    """
+    Aplica un evento del change stream a las cachés de este proceso
+
+    Los eventos de las escrituras del propio proceso también llegan; repetirlos no
+    cambia nada porque las cachés ya los reflejan. Los de update traen la reserva
+    actual en fullDocument (el stream se abre con updateLookup), así que una
+    cancelación no necesita otra consulta.
+
+    Args:
+        change: Evento de watch
+    """
+    collection = change["ns"]["coll"]
+    operation = change["operationType"]
+    if operation not in ("insert", "update", "replace", "delete"):
+        # drop, rename...: no se sabe qué documentos cambiaron
+        clear_caches()
+        return
+    id = change["documentKey"]["_id"]
+    fields = change.get("updateDescription", {}).get("updatedFields", {})
+
+    if collection == "usuarios":
+        user_cache.invalidate(id)
+    elif collection == "vehiculos":
+        vehicle_cache.invalidate(id)
+        if operation != "update" or OCCUPANCY_FIELDS & fields.keys():
+            occupancy.invalidate()
+    elif collection == "reservas":
+        if operation == "insert":
+            reservation = change["fullDocument"]
+            if reservation.get("estado") == "activa":
+                availability.add(
+                    reservation["id_vehiculo"],
+                    id,
+                    reservation["fecha_inicio"],
+                    reservation["fecha_fin"],
+                )
+                occupancy.add(
+                    reservation["id_vehiculo"],
+                    reservation["fecha_inicio"],
+                    reservation["fecha_fin"],
+                )
+        elif operation == "update":
+            if fields.get("estado", "activa") == "activa":
+                return
+            # None si la reserva se borró después de la actualización
+            reservation = change.get("fullDocument")
+            if reservation is None:
+                return
+            availability.remove(reservation["id_vehiculo"], id)
+            occupancy.remove(
+                reservation["id_vehiculo"],
+                reservation["fecha_inicio"],
+                reservation["fecha_fin"],
+            )
+        else:
+            availability.invalidate()
+            occupancy.invalidate()
+
+
+class ChangeListener:
+    """
+    Mantiene al día las cachés de este proceso con un change stream de MongoDB
+
+    Cada proceso tiene un hilo que observa usuarios, vehiculos y reservas, así las
+    escrituras de otros workers o de scripts invalidan user_cache y vehicle_cache y
+    actualizan los índices de disponibilidad y de ocupación. Mientras el stream está
+    abierto las cachés usan un TTL largo; si se cae vuelven a su TTL y se vacían.
+
+    El resume token solo se guarda en memoria, para reconectar sin perder eventos: un
+    proceso nuevo empieza con las cachés vacías, así que no necesita los eventos de
+    antes de arrancar. Los change streams necesitan un replica set; con un servidor
+    solo el hilo no se inicia.
+    """
+
+    def __init__(self, name, enabled=CHANGE_STREAM_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self.db = None
+        self.connected = False
+        self.events = 0
+        self.token = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._ttls = None
+
+    def bind(self, db):
+        """
+        Define la base de datos
+
+        Args:
+            db: Función que devuelve la base de datos de pymongo
+        """
+        self.db = db
+
+    def supported(self):
+        """
+        Indica si el servidor admite change streams
+
+        returns:
+            bool: True para un replica set o un clúster fragmentado
+        """
+        hello = self.db().client.admin.command("hello")
+        return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+    def _extend_ttls(self):
+        caches = (user_cache, vehicle_cache, availability, occupancy)
+        if self._ttls is None:
+            self._ttls = [cache.ttl for cache in caches]
+        for cache in caches:
+            cache.ttl = max(cache.ttl, CHANGE_STREAM_CACHE_TTL)
+
+    def _restore_ttls(self, clear=True):
+        if self._ttls is None:
+            return
+        caches = (user_cache, vehicle_cache, availability, occupancy)
+        for cache, ttl in zip(caches, self._ttls):
+            cache.ttl = ttl
+        self._ttls = None
+        # si el stream se cayó, lo que se cacheó con el TTL largo pudo cambiar sin que
+        # llegara el evento; al detenerlo a pedido las cachés siguen al día
+        if clear:
+            clear_caches()
+
+    def listen(self):
+        """
+        Abre el change stream desde self.token y aplica los eventos hasta que se detiene
+        el hilo
+        """
+        db = self.db()
+        pipeline = [{"$match": {"ns.coll": {"$in": list(WATCHED_COLLECTIONS)}}}]
+        with db.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=self.token,
+            max_await_time_ms=1000,
+        ) as stream:
+            self.connected = True
+            self._extend_ttls()
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    apply_change(change)
+                    self.events += 1
+                # también avanza sin eventos, con el token del último lote
+                self.token = stream.resume_token
+
+    def _loop(self):
+        try:
+            if not self.supported():
+                logger.info("MongoDB is not a replica set, change stream disabled")
+                return
+        except PyMongoError as e:
+            logger.warning("Change stream %s could not start: %s", self.name, e)
+            return
+        while not self._stop.is_set():
+            try:
+                self.listen()
+            except OperationFailure as e:
+                logger.warning("Change stream %s failed: %s", self.name, e)
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # se empieza de nuevo; _restore_ttls vacía las cachés
+                    self.token = None
+            except PyMongoError as e:
+                logger.warning("Change stream %s failed: %s", self.name, e)
+            except Exception:
+                logger.exception("Change stream %s failed", self.name)
+            if self._stop.is_set():
+                break
+            self.connected = False
+            self._restore_ttls()
+            self._stop.wait(5)
+        self.connected = False
+        self._restore_ttls(clear=False)
+
+    def start(self):
+        """Inicia el hilo si el listener está activo y no corre ya en este proceso."""
+        if not self.enabled or self.db is None:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, name=f"change-stream-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Detiene el hilo y espera a que termine la espera en curso del stream (un
+        segundo como máximo)
+
+        Args:
+            timeout: Segundos máximos de espera, None para esperar sin límite
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {"conectado": self.connected, "eventos": self.events}
+
+
+# listener de las cachés; app.py le asigna la base de datos
+change_listener = ChangeListener("cambios_cache")
@@ -0,0 +1,1122 @@
+import csv
+import hmac
+import io
+import os
+import zlib
+
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+from utils.availability import AvailabilityIndex
+from utils.serializer import dumps
+from datetime import datetime, timedelta
+
+DEFAULT_MONGO_URI = "mongodb://mongo:27017/reservas_db"
+
+# variable de entorno -> opción de MongoClient para el pool de conexiones
+MONGO_POOL_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+# Cache-Control de las respuestas con ETag: un proxy puede guardarlas, pero debe
+# revalidarlas con If-None-Match antes de entregarlas
+CACHE_CONTROL = os.environ.get("CACHE_CONTROL", "public, no-cache")
+
+# Token de /metrics y /admin/*, que se envía como "Authorization: Bearer <token>";
+# sin definir, esas rutas responden 404
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+EMAIL_REGEX = r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)"
+
+# El historial puede ser muy grande, por eso el listado no lo incluye por defecto
+USER_LIST_PROJECTION = {"historial_reservas": 0}
+# Campos del usuario que decide si puede reservar; se leen del primario y no de la
+# caché, para que un bloqueo se respete desde la cancelación que lo causa
+USER_BLOCK_PROJECTION = {"estado": 1, "bloqueado_hasta": 1}
+
+# El documento del usuario guarda solo las últimas HISTORIAL_RECENT entradas del
+# historial; el historial completo queda en historial_buckets, en documentos de hasta
+# HISTORIAL_BUCKET_SIZE entradas
+HISTORIAL_RECENT = int(os.environ.get("HISTORIAL_RECENT", "20"))
+HISTORIAL_BUCKET_SIZE = 100
+
+# cantidad máxima de reservas por solicitud en /reserve/bulk
+MAX_BULK_RESERVATIONS = 1000
+# días máximos de una reserva; cada día ocupa un documento en la colección ocupacion
+MAX_RESERVATION_DAYS = int(os.environ.get("MAX_RESERVATION_DAYS", "365"))
+
+# errores de creación de reservas, iguales en /reserve y /reserve/bulk
+RESERVATION_CONFLICT = "there are already active reservations for these dates"
+USER_BLOCKED = "User temporarily blocked from making reservations."
+
+# código de error de MongoDB para una clave duplicada en un índice único
+DUPLICATE_KEY_ERROR = 11000
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+# /reserve/export lee las reservas en lotes de EXPORT_BATCH_SIZE documentos; cada lote
+# se completa con el email y la placa con una consulta $in por colección
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = (
+    "_id",
+    "id_usuario",
+    "email",
+    "id_vehiculo",
+    "placa",
+    "fecha_inicio",
+    "fecha_fin",
+    "estado",
+)
+RESERVATION_STATES = ("activa", "cancelado", "terminada")
+
+# Un usuario con más de CANCELLATION_LIMIT cancelaciones en CANCELLATION_WINDOW_DAYS días
+# queda bloqueado para reservar
+CANCELLATION_LIMIT = 3
+CANCELLATION_WINDOW_DAYS = 7
+# Días que se conservan los eventos de cancelaciones (índice TTL). Es el período que
+# cubre el ranking de /reserve/users/<limit> y el máximo de su parámetro days.
+CANCELLATION_RETENTION_DAYS = int(os.environ.get("CANCELLATION_RETENTION_DAYS", "365"))
+
+
+def overlap_query(vehicle_id, start_date, end_date):
+    """
+    Filtro de las reservas activas de un vehículo que se superponen con [start_date, end_date]
+
+    Usa el índice (id_vehiculo, estado, fecha_inicio, fecha_fin).
+
+    Args:
+        vehicle_id: Id del vehiculo
+        start_date: Fecha inicial
+        end_date: Fecha final
+    returns:
+        dict: El filtro de la consulta
+    """
+    return {
+        "id_vehiculo": vehicle_id,
+        "estado": "activa",
+        "fecha_inicio": {"$lte": end_date},
+        "fecha_fin": {"$gte": start_date},
+    }
+
+
+def available_vehicles_pipeline(start_date, end_date, tipo=None, after=None, limit=100):
+    """
+    Pipeline de agregación de los vehículos sin reservas activas en [start_date, end_date]
+
+    Recorre vehiculos por _id y descarta con un $lookup (anti-join) los que tienen una
+    reserva que cumple overlap_query. El $lookup une por id_vehiculo y busca una sola
+    reserva por vehículo sobre el índice (id_vehiculo, estado, fecha_inicio, fecha_fin).
+    Trae un vehículo más que limit para saber si hay una página siguiente.
+
+    Args:
+        start_date: Fecha inicial
+        end_date: Fecha final
+        tipo: Tipo de vehículo o None para todos
+        after: _id del último vehículo de la página anterior o None
+        limit: Cantidad máxima de vehículos de la página
+    returns:
+        list[dict]: El pipeline para vehiculos.aggregate
+    """
+    match = {"disponibilidad": True}
+    if tipo:
+        match["tipo"] = tipo
+    if after is not None:
+        match["_id"] = {"$gt": after}
+    # id_vehiculo lo aporta la unión del $lookup
+    conflicts = overlap_query(None, start_date, end_date)
+    del conflicts["id_vehiculo"]
+    return [
+        {"$match": match},
+        {"$sort": {"_id": 1}},
+        {
+            "$lookup": {
+                "from": "reservas",
+                "localField": "_id",
+                "foreignField": "id_vehiculo",
+                "pipeline": [
+                    {"$match": conflicts},
+                    {"$limit": 1},
+                    {"$project": {"_id": 1}},
+                ],
+                "as": "conflictos",
+            }
+        },
+        {"$match": {"conflictos": {"$size": 0}}},
+        {"$limit": limit + 1},
+        {"$project": {"conflictos": 0}},
+    ]
+
+
+def parse_reservation_dates(start_date, end_date):
+    """
+    Convierte las fechas de una reserva desde el formato YYYY-MM-DD
+
+    Args:
+        start_date: Fecha inicial (str)
+        end_date: Fecha final (str)
+    returns:
+        tuple(datetime, datetime): Las fechas a medianoche
+
+    Raises:
+        ValueError: Si alguna fecha no tiene el formato esperado.
+    """
+    if not isinstance(start_date, str) or not isinstance(end_date, str):
+        raise ValueError("'fecha_inicio' and 'fecha_fin' must be strings (YYYY-MM-DD)")
+    start_date = datetime.strptime(start_date, "%Y-%m-%d")
+    end_date = datetime.strptime(end_date, "%Y-%m-%d")
+    return start_date, end_date
+
+
+def export_query(start_date=None, end_date=None, estado=None):
+    """
+    Filtro de /reserve/export por rango de fecha_inicio y estado
+
+    Args:
+        start_date: Primer día de fecha_inicio (YYYY-MM-DD), opcional
+        end_date: Último día de fecha_inicio (YYYY-MM-DD, incluido), opcional
+        estado: Estado de las reservas, opcional
+    returns:
+        dict: El filtro para find
+
+    Raises:
+        ValueError: Si alguna fecha o el estado son inválidos.
+    """
+    query = {}
+    if estado:
+        if estado not in RESERVATION_STATES:
+            raise ValueError(f"'estado' must be one of {', '.join(RESERVATION_STATES)}")
+        query["estado"] = estado
+    dates = {}
+    if start_date:
+        dates["$gte"] = datetime.strptime(start_date, "%Y-%m-%d")
+    if end_date:
+        dates["$lt"] = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+    if dates.keys() == {"$gte", "$lt"} and dates["$gte"] >= dates["$lt"]:
+        raise ValueError("'from' must not be later than 'to'")
+    if dates:
+        query["fecha_inicio"] = dates
+    return query
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def export_header(format):
+    """
+    Primer fragmento de la exportación: los nombres de las columnas en CSV
+
+    Args:
+        format: "ndjson" o "csv"
+    returns:
+        str: Encabezado, vacío en NDJSON
+    """
+    return ",".join(EXPORT_COLUMNS) + "\n" if format == "csv" else ""
+
+
+def export_lines(reservations, format):
+    """
+    Serializa un lote de reservas de /reserve/export
+
+    Args:
+        reservations: Lista de reservas, con email y placa si se pidieron
+        format: "ndjson" (un documento JSON por línea) o "csv"
+    returns:
+        str: Las líneas del lote
+    """
+    if format == "ndjson":
+        return "".join(dumps(reservation) + "\n" for reservation in reservations)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for reservation in reservations:
+        writer.writerow(
+            [_csv_value(reservation.get(column)) for column in EXPORT_COLUMNS]
+        )
+    return buffer.getvalue()
+
+
+def most_canceling_pipeline(limit, days=None, now=None):
+    """
+    Pipeline de /reserve/users/<limit>: usuarios con más cancelaciones, con sus datos
+    unidos en el servidor con $lookup
+
+    Args:
+        limit: Número máximo de usuarios (entero positivo)
+        days: Si se entrega, solo cuenta las cancelaciones de los últimos días (str)
+        now: Fecha actual, por defecto datetime.now()
+    returns:
+        list[dict]: El pipeline de aggregate sobre cancelaciones
+
+    Raises:
+        ValueError: Si el límite o los días son inválidos.
+    """
+    if not isinstance(limit, int) or limit <= 0:
+        raise ValueError("'limit' must be a positive integer.")
+    if days is not None and (not str(days).isdigit() or int(days) <= 0):
+        raise ValueError("'days' must be a positive integer.")
+    # los eventos más antiguos ya los borró el índice TTL
+    if days is not None and int(days) > CANCELLATION_RETENTION_DAYS:
+        raise ValueError(f"'days' must be at most {CANCELLATION_RETENTION_DAYS}.")
+
+    pipeline = []
+    if days is not None:
+        # usa el índice de cancelaciones.fecha
+        since = (now or datetime.now()) - timedelta(days=int(days))
+        pipeline.append({"$match": {"fecha": {"$gte": since}}})
+    return pipeline + [
+        {"$group": {"_id": "$id_usuario", "cantidad_cancelaciones": {"$sum": 1}}},
+        {"$sort": {"cantidad_cancelaciones": -1}},
+        {"$limit": limit},
+        {
+            "$lookup": {
+                "from": "usuarios",
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "usuario",
+            }
+        },
+        # descarta las cancelaciones de usuarios que ya no existen
+        {"$unwind": "$usuario"},
+        {
+            "$project": {
+                "_id": 0,
+                "id_usuario": "$_id",
+                "cantidad_cancelaciones": 1,
+                "usuario._id": 1,
+                "usuario.nombre": 1,
+                "usuario.email": 1,
+                "usuario.estado": 1,
+            }
+        },
+    ]
+
+
+def occupancy_slots(reservation):
+    """
+    Documentos de la colección ocupacion de una reserva, uno por cada día entre la fecha
+    inicial y la final (ambas incluidas, como en overlap_query)
+
+    Args:
+        reservation: Reserva con _id, id_vehiculo, fecha_inicio y fecha_fin
+    returns:
+        list[dict]: Un documento {id_vehiculo, dia, id_reserva} por día
+    """
+    first = datetime.combine(reservation["fecha_inicio"].date(), datetime.min.time())
+    days = (reservation["fecha_fin"].date() - first.date()).days + 1
+    return [
+        {
+            "id_vehiculo": reservation["id_vehiculo"],
+            "dia": first + timedelta(days=day),
+            "id_reserva": reservation["_id"],
+        }
+        for day in range(days)
+    ]
+
+
+def slot_conflict_query(reservation):
+    """
+    Filtro de los días de la colección ocupacion que otra reserva ocupa dentro de las
+    fechas de una reserva
+
+    Args:
+        reservation: Reserva con _id, id_vehiculo, fecha_inicio y fecha_fin
+    returns:
+        dict: El filtro de ocupacion
+    """
+    return {
+        "id_vehiculo": reservation["id_vehiculo"],
+        "dia": {
+            "$gte": datetime.combine(
+                reservation["fecha_inicio"].date(), datetime.min.time()
+            ),
+            "$lte": reservation["fecha_fin"],
+        },
+        "id_reserva": {"$ne": reservation["_id"]},
+    }
+
+
+def reservation_counter_writes(counts):
+    """
+    Operaciones de bulk_write que suman reservas a los contadores de conteo_reservas
+
+    Args:
+        counts: dict {id_vehiculo: cantidad de reservas nuevas}
+    returns:
+        list[UpdateOne]: Una operación por vehículo
+    """
+    return [
+        UpdateOne({"_id": vehicle_id}, {"$inc": {"cantidad": amount}}, upsert=True)
+        for vehicle_id, amount in counts.items()
+    ]
+
+
+def valid_reservation_dates(start_date, end_date):
+    """
+    Valida que la fecha de inicio sea hoy o en el futuro y que no sea posterior a la final
+
+    Args:
+        start_date: Fecha inicial
+        end_date: Fecha final
+    returns:
+        bool: True si las fechas son válidas
+    """
+    return start_date <= end_date and start_date.date() >= datetime.now().date()
+
+
+def valid_reservation_length(start_date, end_date):
+    """
+    Valida que la reserva no dure más de MAX_RESERVATION_DAYS días
+
+    Args:
+        start_date: Fecha inicial
+        end_date: Fecha final
+    returns:
+        bool: True si la reserva no supera el máximo
+    """
+    return (end_date.date() - start_date.date()).days + 1 <= MAX_RESERVATION_DAYS
+
+
+def new_reservation(user_id, vehicle_id, start_date, end_date):
+    """
+    Documento de una reserva activa nueva
+
+    El _id se genera aquí y no al insertar porque claim_slots lo necesita antes.
+
+    Args:
+        user_id: Id del usuario
+        vehicle_id: Id del vehículo
+        start_date: Fecha inicial
+        end_date: Fecha final
+    returns:
+        dict: La reserva
+    """
+    return {
+        "_id": ObjectId(),
+        "id_usuario": user_id,
+        "id_vehiculo": vehicle_id,
+        "fecha_inicio": start_date,
+        "fecha_fin": end_date,
+        "estado": "activa",
+    }
+
+
+def bulk_candidates(reservations):
+    """
+    Valida los ids y las fechas de las reservas de /reserve/bulk, sin consultar la base
+    de datos
+
+    Args:
+        reservations: Reservas del cuerpo de la solicitud
+    returns:
+        tuple(list, list): Resultados por reserva (None si todavía no hay) y candidatos
+        (index, id_usuario, id_vehiculo, fecha_inicio, fecha_fin)
+    """
+    results = [None] * len(reservations)
+    candidates = []
+    for index, item in enumerate(reservations):
+        if not isinstance(item, dict):
+            results[index] = {"index": index, "status": 400, "error": "Invalid item"}
+            continue
+        try:
+            user_id = ObjectId(item.get("id_usuario"))
+            vehicle_id = ObjectId(item.get("id_vehiculo"))
+        except Exception as e:
+            results[index] = {
+                "index": index,
+                "status": 400,
+                "error": "Invalid ID",
+                "message": str(e),
+            }
+            continue
+        try:
+            start_date, end_date = parse_reservation_dates(
+                item.get("fecha_inicio"), item.get("fecha_fin")
+            )
+        except ValueError as e:
+            results[index] = {
+                "index": index,
+                "status": 400,
+                "error": "Invalid date format",
+                "message": str(e),
+            }
+            continue
+        if not valid_reservation_dates(start_date, end_date):
+            results[index] = {"index": index, "status": 400, "error": "Invalid dates"}
+            continue
+        if not valid_reservation_length(start_date, end_date):
+            results[index] = {
+                "index": index,
+                "status": 400,
+                "error": f"Reservation too long. The maximum is {MAX_RESERVATION_DAYS} days.",
+            }
+            continue
+        candidates.append((index, user_id, vehicle_id, start_date, end_date))
+    return results, candidates
+
+
+def bulk_valid(candidates, users, vehicles, results):
+    """
+    Descarta los candidatos con un usuario inexistente o bloqueado o con un vehículo
+    inexistente
+
+    Args:
+        candidates: Candidatos de bulk_candidates
+        users: {_id: usuario con estado y bloqueado_hasta} de los usuarios del lote
+        vehicles: _id de los vehículos del lote que existen
+        results: Resultados por reserva, se completan con los descartados
+    returns:
+        list: Los candidatos válidos
+    """
+    valid = []
+    for index, user_id, vehicle_id, start_date, end_date in candidates:
+        user = users.get(user_id)
+        if user is None:
+            results[index] = {"index": index, "status": 404, "error": "User not found"}
+        elif is_blocked(user):
+            results[index] = {"index": index, "status": 403, "error": USER_BLOCKED}
+        elif vehicle_id not in vehicles:
+            results[index] = {
+                "index": index,
+                "status": 404,
+                "error": "Vehicle not found",
+            }
+        else:
+            valid.append((index, user_id, vehicle_id, start_date, end_date))
+    return valid
+
+
+def bulk_active_query(valid):
+    """
+    Filtro de las reservas activas que pueden chocar con las del lote
+
+    Args:
+        valid: Candidatos de bulk_valid
+    returns:
+        dict: El filtro, cubierto por el índice (id_vehiculo, estado, fecha_inicio, fecha_fin)
+    """
+    return {
+        "id_vehiculo": {"$in": list({item[2] for item in valid})},
+        "estado": "activa",
+        "fecha_inicio": {"$lte": max(item[4] for item in valid)},
+        "fecha_fin": {"$gte": min(item[3] for item in valid)},
+    }
+
+
+def bulk_reservations(valid, active, results):
+    """
+    Revisa en una sola pasada los conflictos del lote con las reservas activas y entre
+    las reservas del mismo lote
+
+    Args:
+        valid: Candidatos de bulk_valid
+        active: Reservas activas de bulk_active_query
+        results: Resultados por reserva, se completan con los conflictos
+    returns:
+        list[tuple]: (index, reserva) de las reservas sin conflicto
+    """
+    existing = {item[2]: [] for item in valid}
+    for reservation in active:
+        existing[reservation["id_vehiculo"]].append(reservation)
+    batch = AvailabilityIndex()
+    for vehicle_id, reservations in existing.items():
+        batch.load(vehicle_id, reservations)
+
+    documents = []
+    for index, user_id, vehicle_id, start_date, end_date in valid:
+        _, conflict = batch.find_conflict(vehicle_id, start_date, end_date)
+        if conflict:
+            results[index] = {
+                "index": index,
+                "status": 400,
+                "error": RESERVATION_CONFLICT,
+                "reservation": conflict,
+            }
+            continue
+        reservation = new_reservation(user_id, vehicle_id, start_date, end_date)
+        batch.add(vehicle_id, reservation["_id"], start_date, end_date)
+        documents.append((index, reservation))
+    return documents
+
+
+def bulk_created(documents, failed, results):
+    """
+    Resultados, entradas del historial y contadores de las reservas insertadas del lote
+
+    Args:
+        documents: (index, reserva) de las reservas con días ocupados
+        failed: Índices de las reservas que no se pudieron insertar
+        results: Resultados por reserva, se completan con las creadas
+    returns:
+        tuple(list, dict, dict): Reservas creadas, {id_usuario: [entradas]} y
+        {id_vehiculo: cantidad}
+    """
+    created = []
+    historial = {}
+    counters = {}
+    for index, reservation in documents:
+        if index in failed:
+            continue
+        created.append(reservation)
+        historial.setdefault(reservation["id_usuario"], []).append(
+            historial_entry(reservation["_id"], reservation["fecha_inicio"])
+        )
+        counters[reservation["id_vehiculo"]] = (
+            counters.get(reservation["id_vehiculo"], 0) + 1
+        )
+        results[index] = {"index": index, "status": 201, "_id": reservation["_id"]}
+    return created, historial, counters
+
+
+def historial_entry(reserva_id, start_date):
+    """
+    Construye una entrada del historial de reservas de un usuario
+
+    Args:
+        reserva_id: Id de la reserva
+        start_date: Fecha inicial
+    returns:
+        dict: La entrada del historial
+    """
+    return {
+        "reserva_id": reserva_id,
+        "fecha": start_date,
+        "estado": "confirmada",
+    }
+
+
+def historial_user_update(entries):
+    """
+    Update del usuario que agrega entradas a su historial
+
+    $push con $slice conserva solo las últimas HISTORIAL_RECENT entradas. historial_total
+    cuenta todas las entradas del usuario: su valor antes del update es la posición de la
+    primera entrada nueva en historial_buckets, ver historial_positions y
+    historial_bucket_writes.
+
+    Args:
+        entries: Entradas en orden cronológico
+    returns:
+        dict: El update
+    """
+    return {
+        "$push": {
+            "historial_reservas": {"$each": entries, "$slice": -HISTORIAL_RECENT}
+        },
+        "$inc": {"historial_total": len(entries)},
+    }
+
+
+def historial_user_writes(historial):
+    """
+    Operaciones de bulk_write que agregan entradas al historial de varios usuarios, ver
+    historial_user_update
+
+    Solo afectan a los usuarios con historial_total; los que no lo tienen guardan todavía
+    el historial completo en el documento y se deben migrar antes.
+
+    Args:
+        historial: {id_usuario: [entradas]} en orden cronológico
+    returns:
+        list[UpdateOne]: Una operación por usuario
+    """
+    return [
+        UpdateOne(
+            {"_id": user_id, "historial_total": {"$exists": True}},
+            historial_user_update(entries),
+        )
+        for user_id, entries in historial.items()
+    ]
+
+
+def historial_positions(users, historial):
+    """
+    Posición en el historial de la primera entrada nueva de cada usuario, leída después
+    de aplicar historial_user_writes
+
+    Si otra solicitud agregó entradas al mismo usuario entre el update y la lectura,
+    historial_total ya las cuenta; esas entradas están en historial_reservas después de
+    las de este lote, así que se descuentan. Solo si llegaron tantas que las del lote
+    salieron de las recientes se asume que no hubo otras.
+
+    Args:
+        users: Usuarios con historial_total y los reserva_id de historial_reservas
+        historial: {id_usuario: [entradas]} del lote
+    returns:
+        tuple(dict, list): {id_usuario: posición} y los ids de los usuarios sin
+        historial_total, que no se actualizaron
+    """
+    positions = {}
+    legacy = []
+    for user in users:
+        if "historial_total" not in user:
+            legacy.append(user["_id"])
+            continue
+        entries = historial[user["_id"]]
+        recent = [
+            entry.get("reserva_id") for entry in user.get("historial_reservas", [])
+        ]
+        last = entries[-1]["reserva_id"]
+        later = len(recent) - 1 - recent.index(last) if last in recent else 0
+        positions[user["_id"]] = user["historial_total"] - later - len(entries)
+    return positions, legacy
+
+
+def historial_bucket_writes(user_id, entries, position, prepend=False):
+    """
+    Operaciones de bulk_write que agregan entradas a historial_buckets
+
+    La entrada en la posición p del historial va al bucket seq = p // HISTORIAL_BUCKET_SIZE
+    del usuario, así las entradas nuevas siempre van al último bucket y un grupo que no
+    cabe se reparte entre ese bucket y los siguientes (upsert).
+
+    Args:
+        user_id: Id del usuario
+        entries: Entradas en orden cronológico
+        position: Posición de la primera entrada en el historial del usuario
+        prepend: Agrega cada grupo al principio del bucket, para migrar un historial
+            cuando ya pueden haber llegado entradas posteriores
+    returns:
+        list: Operaciones sobre historial_buckets, una por bucket
+    """
+    writes = []
+    start = 0
+    while start < len(entries):
+        seq, used = divmod(position + start, HISTORIAL_BUCKET_SIZE)
+        chunk = entries[start : start + HISTORIAL_BUCKET_SIZE - used]
+        push = {"$each": chunk, "$position": 0} if prepend else {"$each": chunk}
+        writes.append(
+            UpdateOne(
+                {"id_usuario": user_id, "seq": seq},
+                {
+                    "$push": {"entradas": push},
+                    "$inc": {"cantidad": len(chunk)},
+                },
+                upsert=True,
+            )
+        )
+        start += len(chunk)
+    return writes
+
+
+def historial_estado_writes(reservations, estado):
+    """
+    Operaciones de bulk_write que cambian el estado de entradas del historial
+
+    Solo cambian las entradas confirmadas, para no pisar una cancelación concurrente.
+    Usan arrayFilters porque la entrada puede no estar entre las recientes del usuario.
+
+    Args:
+        reservations: {id_usuario: [ids de reservas]}
+        estado: Nuevo estado de las entradas
+    returns:
+        tuple(list, list): Operaciones sobre usuarios y sobre historial_buckets
+    """
+    users = []
+    buckets = []
+    for user_id, ids in reservations.items():
+        array_filters = [
+            {"entrada.reserva_id": {"$in": ids}, "entrada.estado": "confirmada"}
+        ]
+        users.append(
+            UpdateOne(
+                {"_id": user_id},
+                {"$set": {"historial_reservas.$[entrada].estado": estado}},
+                array_filters=array_filters,
+            )
+        )
+        buckets.append(
+            UpdateMany(
+                {"id_usuario": user_id, "entradas.reserva_id": {"$in": ids}},
+                {"$set": {"entradas.$[entrada].estado": estado}},
+                array_filters=array_filters,
+            )
+        )
+    return users, buckets
+
+
+def bucket_ranges(counts, offset, limit):
+    """
+    Calcula qué parte de cada bucket del historial cae en una página
+
+    Args:
+        counts: Cantidad de entradas de cada bucket, en orden
+        offset: Posición de la primera entrada de la página
+        limit: Cantidad máxima de entradas de la página
+    returns:
+        list[tuple]: (posición del bucket, inicio, fin) de cada bucket con entradas en la página
+    """
+    ranges = []
+    position = 0
+    for index, count in enumerate(counts):
+        start = max(offset - position, 0)
+        end = min(offset + limit - position, count)
+        if start < end:
+            ranges.append((index, start, end))
+        position += count
+        if position >= offset + limit:
+            break
+    return ranges
+
+
+def parse_limit(limit):
+    """
+    Valida el parámetro limit de los listados
+
+    Args:
+        limit: Cantidad máxima de documentos a devolver (str o None)
+    returns:
+        int: El límite convertido, DEFAULT_PAGE_LIMIT si no se entrega
+
+    Raises:
+        ValueError: Si el límite no es un entero entre 1 y MAX_PAGE_LIMIT.
+    """
+    if limit is None or limit == "":
+        return DEFAULT_PAGE_LIMIT
+    limit = int(limit)
+    if limit <= 0 or limit > MAX_PAGE_LIMIT:
+        raise ValueError(f"'limit' must be an integer between 1 and {MAX_PAGE_LIMIT}")
+    return limit
+
+
+def parse_pagination(limit, after):
+    """
+    Valida los parámetros de paginación por cursor (keyset)
+
+    Args:
+        limit: Cantidad máxima de documentos a devolver (str o None)
+        after: _id del último documento de la página anterior (str o None)
+    returns:
+        tuple(int, ObjectId | None): El límite y el cursor convertidos
+
+    Raises:
+        ValueError: Si el límite no es un entero entre 1 y MAX_PAGE_LIMIT.
+        InvalidId: Si el cursor no es un ObjectId válido.
+    """
+    after = ObjectId(after) if after else None
+    return parse_limit(limit), after
+
+
+def page_query(query, after):
+    """
+    Agrega el cursor de la página anterior al filtro de una consulta paginada por _id
+
+    Args:
+        query: Filtro de la consulta
+        after: _id del último documento de la página anterior o None
+    returns:
+        dict: El filtro de la página
+    """
+    if after is None:
+        return query
+    return {"$and": [query, {"_id": {"$gt": after}}]}
+
+
+def page_projection(projection):
+    """
+    Proyección de los documentos de una página, que siempre incluye el _id porque de él
+    sale el cursor de la página siguiente
+
+    Args:
+        projection: Proyección pedida o None
+    returns:
+        dict | None: La proyección a usar en la consulta
+    """
+    if not projection or projection.get("_id", 1):
+        return projection
+    return {name: value for name, value in projection.items() if name != "_id"} or None
+
+
+def page_split(documents, limit, projection=None):
+    """
+    Separa una página del documento de más que se lee para saber si hay otra
+
+    Args:
+        documents: Hasta limit + 1 documentos leídos con page_projection(projection)
+        limit: Cantidad máxima de documentos de la página
+        projection: Proyección pedida, para quitar el _id si se excluyó
+    returns:
+        tuple(list, ObjectId | None): Los documentos de la página y el cursor de la
+            siguiente, o None si es la última
+    """
+    after = documents[limit - 1]["_id"] if len(documents) > limit else None
+    page = documents[:limit]
+    if projection and projection.get("_id", 1) == 0:
+        for document in page:
+            document.pop("_id", None)
+    return page, after
+
+
+def page_headers(total, after):
+    """
+    Cabeceras de una respuesta paginada por _id
+
+    Args:
+        total: Total de documentos de la consulta, o None si no se contó
+        after: Cursor de la página siguiente, o None si es la última
+    returns:
+        dict: X-Total-Count si se contó y X-Next-Cursor si hay una página siguiente
+    """
+    headers = {}
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+    if after is not None:
+        headers["X-Next-Cursor"] = str(after)
+    return headers
+
+
+def admin_denied(authorization):
+    """
+    Verifica la cabecera Authorization de una ruta de administración contra ADMIN_TOKEN
+
+    Args:
+        authorization: Valor de la cabecera Authorization o None
+    returns:
+        tuple(dict, int) | None: Error y código HTTP, o None si la solicitud se permite
+    """
+    if not ADMIN_TOKEN:
+        return {"error": "Not found"}, 404
+    # comparación en tiempo constante para no revelar el token por la latencia
+    if not hmac.compare_digest(
+        (authorization or "").encode(), f"Bearer {ADMIN_TOKEN}".encode()
+    ):
+        return {
+            "error": "Unauthorized",
+            "message": "A valid admin token is required.",
+        }, 401
+    return None
+
+
+def parse_projection(fields, exclude, default=None):
+    """
+    Convierte los parámetros fields/exclude en una proyección de MongoDB
+
+    Args:
+        fields: Campos a incluir separados por comas (str o None)
+        exclude: Campos a excluir separados por comas (str o None)
+        default: Proyección a usar si no se entrega ninguno de los dos
+    returns:
+        dict | None: La proyección para find/find_one
+
+    Raises:
+        ValueError: Si se combinan fields y exclude o si algún campo es inválido.
+    """
+    if fields and exclude:
+        raise ValueError("'fields' and 'exclude' cannot be combined")
+    names = fields or exclude
+    if not names:
+        return default
+    names = [name.strip() for name in names.split(",") if name.strip()]
+    if not names or any(name.startswith("$") for name in names):
+        raise ValueError("Invalid field list")
+    return {name: 1 if fields else 0 for name in names}
+
+
+def cancellation_window(days, when):
+    """
+    Resume los contadores diarios de cancelaciones de un usuario
+
+    Args:
+        days: dict {"YYYY-MM-DD": cancelaciones del día}
+        when: Fecha de referencia
+    returns:
+        tuple(int, list[str]): Cancelaciones dentro de la ventana y días fuera de ella
+    """
+    first_day = (when - timedelta(days=CANCELLATION_WINDOW_DAYS)).strftime("%Y-%m-%d")
+    stale = [day for day in days if day < first_day]
+    count = sum(value for day, value in days.items() if day >= first_day)
+    return count, stale
+
+
+def blocked_until(days, when):
+    """
+    Calcula hasta cuándo queda bloqueado un usuario si no vuelve a cancelar
+
+    Un día de cancelaciones deja de contar CANCELLATION_WINDOW_DAYS + 1 días después, a
+    medianoche (ver cancellation_window). El bloqueo termina cuando salen de la ventana
+    suficientes días para quedar en CANCELLATION_LIMIT cancelaciones o menos.
+
+    Args:
+        days: dict {"YYYY-MM-DD": cancelaciones del día}
+        when: Fecha de referencia
+    returns:
+        datetime | None: Fin del bloqueo, o None si el usuario no supera el límite
+    """
+    count, stale = cancellation_window(days, when)
+    if count <= CANCELLATION_LIMIT:
+        return None
+    for day in sorted(day for day in days if day not in stale):
+        count -= days[day]
+        if count <= CANCELLATION_LIMIT:
+            return datetime.strptime(day, "%Y-%m-%d") + timedelta(
+                days=CANCELLATION_WINDOW_DAYS + 1
+            )
+
+
+def block_update(until, fields=None):
+    """
+    Actualización del bloqueo de un usuario
+
+    Args:
+        until: Fin del bloqueo, o None para desbloquear
+        fields: Otros campos a modificar con $set
+    returns:
+        dict: El documento de actualización
+    """
+    update = {"$set": {**(fields or {}), "estado": until is not None}}
+    if until is None:
+        update["$unset"] = {"bloqueado_hasta": ""}
+    else:
+        update["$set"]["bloqueado_hasta"] = until
+    return update
+
+
+def is_blocked(user, now=None):
+    """
+    Indica si un usuario tiene bloqueado crear reservas
+
+    Un bloqueo con bloqueado_hasta vencido ya no cuenta aunque el barrido todavía no
+    haya actualizado estado; los bloqueos sin fecha duran hasta activate_user.
+
+    Args:
+        user: Usuario con estado y bloqueado_hasta
+        now: Fecha actual, por defecto datetime.now()
+    returns:
+        bool: True si el usuario está bloqueado
+    """
+    if not user.get("estado"):
+        return False
+    until = user.get("bloqueado_hasta")
+    return until is None or until > (now or datetime.now())
+
+
+def expired_reservations_query(now=None):
+    """
+    Filtro de las reservas activas cuya fecha final ya pasó
+
+    Args:
+        now: Fecha actual, por defecto datetime.now()
+    returns:
+        dict: El filtro, cubierto por el índice (estado, fecha_fin)
+    """
+    today = datetime.combine((now or datetime.now()).date(), datetime.min.time())
+    return {"estado": "activa", "fecha_fin": {"$lt": today}}
+
+
+def expired_blocks_query(now=None):
+    """
+    Filtro de los usuarios bloqueados cuyo bloqueado_hasta ya pasó
+
+    Args:
+        now: Fecha actual, por defecto datetime.now()
+    returns:
+        dict: El filtro
+    """
+    return {"estado": True, "bloqueado_hasta": {"$lte": now or datetime.now()}}
+
+
+def orphan_slots_pipeline(since, before):
+    """
+    Agregación sobre ocupacion con los _id de las reservas que ocupan días sin existir
+    o sin estar activas
+
+    El $match usa el índice por id_reserva, así que solo se agrupan los días de las
+    reservas creadas entre las dos fechas y no toda la colección.
+
+    Args:
+        since: Solo reservas con _id desde esta fecha (UTC)
+        before: Solo reservas con _id anterior a esta fecha (UTC)
+    returns:
+        list: El pipeline; cada resultado es {_id: id_reserva}
+    """
+    return [
+        {
+            "$match": {
+                "id_reserva": {
+                    "$gte": ObjectId.from_datetime(since),
+                    "$lt": ObjectId.from_datetime(before),
+                }
+            }
+        },
+        {"$group": {"_id": "$id_reserva"}},
+        {
+            "$lookup": {
+                "from": "reservas",
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "reserva",
+            }
+        },
+        {"$match": {"reserva.estado": {"$ne": "activa"}}},
+    ]
+
+
+def mongo_client_options(environ=os.environ):
+    """
+    Lee del entorno las opciones del pool de conexiones de MongoClient; las variables
+    que no están definidas conservan el valor por defecto de pymongo
+
+    Args:
+        environ: Variables de entorno
+    returns:
+        dict: Argumentos para MongoClient
+    Raises:
+        ValueError: Si alguna variable no es un entero
+    """
+    return {
+        option: int(environ[variable])
+        for variable, option in MONGO_POOL_SETTINGS.items()
+        if environ.get(variable)
+    }
+
+
+def version_key(collection, id=None):
+    """
+    _id del contador de versiones de una colección o de uno de sus documentos
+
+    Args:
+        collection: Nombre de la colección
+        id: Id del documento, o None para la colección completa
+    returns:
+        str: _id en la colección versiones
+    """
+    return collection if id is None else f"{collection}:{id}"
+
+
+def version_updates(collection, ids=()):
+    """
+    Operaciones de bump_versions: incrementan la versión de la colección y la de cada
+    documento modificado
+
+    Args:
+        collection: Nombre de la colección modificada
+        ids: Ids de los documentos modificados
+    returns:
+        list[UpdateOne]: Operaciones para bulk_write
+    """
+    return [
+        UpdateOne({"_id": key}, {"$inc": {"version": 1}}, upsert=True)
+        for key in [collection] + [version_key(collection, id) for id in ids]
+    ]
+
+
+def make_etag(version, path):
+    """
+    Construye el ETag de una respuesta a partir de la versión de los datos y de la URL,
+    que incluye los parámetros de paginación y proyección
+
+    Args:
+        version: Versión de la colección o del documento
+        path: Ruta con la query string de la solicitud
+    returns:
+        str: ETag sin comillas
+    """
+    return f"{version}-{zlib.crc32(path.encode()):08x}"
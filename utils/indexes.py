@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import os
+import time
+
+import pymongo
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError
+from utils.common import CANCELLATION_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# código de error de create_indexes cuando el índice existe con otras opciones
+INDEX_OPTIONS_CONFLICT = 85
+
+# Tiempo máximo de la creación de índices al arrancar, para no quedar esperando la
+# selección de servidor (30 segundos por defecto en pymongo) si MongoDB no responde
+INDEXES_TIMEOUT_SECONDS = (
+    float(os.environ.get("MONGO_INDEXES_TIMEOUT_MS", "5000")) / 1000
+)
+# Intentos de bootstrap_indexes mientras MongoDB no responde, por ejemplo si la API
+# arranca antes que el contenedor de MongoDB, y segundos entre intentos
+INDEXES_ATTEMPTS = int(os.environ.get("MONGO_INDEXES_ATTEMPTS", "10"))
+INDEXES_RETRY_DELAY = float(os.environ.get("MONGO_INDEXES_RETRY_DELAY", "3"))
+
+# Los eventos de cancelaciones son el registro de auditoría y la fuente del ranking de
+# /reserve/users/<limit>; la penalización usa cancelaciones_ventana
+CANCELLATION_TTL_SECONDS = CANCELLATION_RETENTION_DAYS * 24 * 60 * 60
+
+# Manifiesto de índices por colección. Se aplica en cada arranque con create_indexes,
+# que no hace nada si el índice ya existe con la misma definición.
+INDEXES = {
+    "reservas": [
+        # check_reserve: vehículo + estado por igualdad y rango de fechas
+        IndexModel(
+            [
+                ("id_vehiculo", ASCENDING),
+                ("estado", ASCENDING),
+                ("fecha_inicio", ASCENDING),
+                ("fecha_fin", ASCENDING),
+            ],
+            name="vehiculo_estado_fechas",
+        ),
+        # barrido de reservas activas vencidas, ver finish_expired_reservations
+        IndexModel(
+            [("estado", ASCENDING), ("fecha_fin", ASCENDING)], name="estado_fin"
+        ),
+        # get_reservations_by_user, paginado por _id
+        IndexModel(
+            [("id_usuario", ASCENDING), ("_id", ASCENDING)],
+            name="usuario_id",
+        ),
+        # /reserve/export por rango de fecha_inicio, con o sin estado, ya ordenado
+        IndexModel(
+            [("estado", ASCENDING), ("fecha_inicio", ASCENDING)],
+            name="estado_inicio",
+        ),
+        IndexModel([("fecha_inicio", ASCENDING)], name="inicio"),
+    ],
+    "cancelaciones": [
+        # conteo de cancelaciones de un usuario en los últimos días
+        IndexModel(
+            [("id_usuario", ASCENDING), ("fecha", ASCENDING)],
+            name="usuario_fecha",
+        ),
+        # los eventos se borran solos después de CANCELLATION_RETENTION_DAYS días
+        IndexModel(
+            [("fecha", ASCENDING)],
+            expireAfterSeconds=CANCELLATION_TTL_SECONDS,
+            name="fecha_ttl",
+        ),
+    ],
+    "conteo_reservas": [
+        # vehículo más reservado y top-N
+        IndexModel([("cantidad", DESCENDING)], name="cantidad"),
+    ],
+    "ocupacion": [
+        # un día de un vehículo lo ocupa una sola reserva, ver utils.utils.claim_slots
+        IndexModel(
+            [("id_vehiculo", ASCENDING), ("dia", ASCENDING)],
+            unique=True,
+            name="vehiculo_dia_unico",
+        ),
+        # liberar los días al cancelar o terminar una reserva
+        IndexModel([("id_reserva", ASCENDING)], name="reserva"),
+    ],
+    "historial_buckets": [
+        # buckets de un usuario en orden; único para que dos upserts concurrentes del
+        # mismo bucket no creen dos documentos
+        IndexModel(
+            [("id_usuario", ASCENDING), ("seq", ASCENDING)],
+            unique=True,
+            name="usuario_seq",
+        ),
+    ],
+    "usuarios": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unico"),
+        # usuarios con bloqueo vencido, ver unblock_expired_users
+        IndexModel(
+            [("bloqueado_hasta", ASCENDING)], sparse=True, name="bloqueado_hasta"
+        ),
+    ],
+    "vehiculos": [
+        IndexModel([("placa", ASCENDING)], unique=True, name="placa_unica"),
+        # /vehicles/available filtrado por tipo y recorrido por _id
+        IndexModel([("tipo", ASCENDING), ("_id", ASCENDING)], name="tipo_id"),
+    ],
+}
+
+
+def _split_unique(models):
+    # los índices únicos son los que evitan duplicados de email y placa
+    unique = [model for model in models if model.document.get("unique")]
+    return unique, [model for model in models if not model.document.get("unique")]
+
+
+def _ttl_updates(collection, models):
+    # collMod cambia el TTL de un índice existente sin volver a crearlo
+    return [
+        {
+            "collMod": collection,
+            "index": {
+                "name": model.document["name"],
+                "expireAfterSeconds": model.document["expireAfterSeconds"],
+            },
+        }
+        for model in models
+        if "expireAfterSeconds" in model.document
+    ]
+
+
+def ensure_indexes(db, indexes=INDEXES, timeout=INDEXES_TIMEOUT_SECONDS):
+    """
+    Crea los índices del manifiesto en la base de datos
+
+    Los índices únicos son la única validación de duplicados de create_user y
+    create_vehicle, por eso si no se pueden crear (MongoDB no responde o ya existen
+    duplicados) el error se propaga y la aplicación no arranca. Los demás solo se
+    registran en el log. Si un índice TTL ya existe con otra duración se actualiza con
+    collMod.
+
+    Args:
+        db: Base de datos de pymongo
+        indexes: Manifiesto {colección: [IndexModel]}
+        timeout: Segundos máximos de cada operación
+    returns:
+        dict: Nombres de los índices creados por colección
+    Raises:
+        PyMongoError: Si no se puede crear algún índice único
+    """
+    created = {}
+    with pymongo.timeout(timeout):
+        for collection, models in indexes.items():
+            unique, others = _split_unique(models)
+            created[collection] = []
+            if unique:
+                try:
+                    created[collection] += db[collection].create_indexes(unique)
+                except PyMongoError:
+                    logger.error("Could not create unique indexes on %s", collection)
+                    raise
+            if others:
+                try:
+                    try:
+                        created[collection] += db[collection].create_indexes(others)
+                    except OperationFailure as e:
+                        # un TTL distinto del manifiesto, por ejemplo al cambiar
+                        # CANCELLATION_RETENTION_DAYS
+                        if e.code != INDEX_OPTIONS_CONFLICT:
+                            raise
+                        for command in _ttl_updates(collection, others):
+                            db.command(command)
+                        created[collection] += db[collection].create_indexes(others)
+                except PyMongoError as e:
+                    logger.warning("Could not create indexes on %s: %s", collection, e)
+    return created
+
+
+async def ensure_indexes_async(db, indexes=INDEXES, timeout=INDEXES_TIMEOUT_SECONDS):
+    """Igual que ensure_indexes, para una base de datos del cliente asíncrono."""
+    created = {}
+    with pymongo.timeout(timeout):
+        for collection, models in indexes.items():
+            unique, others = _split_unique(models)
+            created[collection] = []
+            if unique:
+                try:
+                    created[collection] += await db[collection].create_indexes(unique)
+                except PyMongoError:
+                    logger.error("Could not create unique indexes on %s", collection)
+                    raise
+            if others:
+                try:
+                    try:
+                        created[collection] += await db[collection].create_indexes(
+                            others
+                        )
+                    except OperationFailure as e:
+                        if e.code != INDEX_OPTIONS_CONFLICT:
+                            raise
+                        for command in _ttl_updates(collection, others):
+                            await db.command(command)
+                        created[collection] += await db[collection].create_indexes(
+                            others
+                        )
+                except PyMongoError as e:
+                    logger.warning("Could not create indexes on %s: %s", collection, e)
+    return created
+
+
+def _unreachable(error):
+    # MongoDB no responde: se reintenta; un duplicado u otro error del servidor no
+    return isinstance(error, ConnectionFailure) or error.timeout
+
+
+def bootstrap_indexes(db, attempts=INDEXES_ATTEMPTS, delay=INDEXES_RETRY_DELAY):
+    """
+    Crea los índices al arrancar con ensure_indexes, reintentando mientras MongoDB no
+    responde
+
+    Se llama desde when_ready de gunicorn, el comando flask ensure-indexes y app.run, no
+    al importar app.py.
+
+    Args:
+        db: Base de datos de pymongo
+        attempts: Cantidad máxima de intentos
+        delay: Segundos entre intentos
+    returns:
+        dict: Nombres de los índices creados por colección
+    Raises:
+        PyMongoError: Si no se puede crear algún índice único, de inmediato si el error
+        no es de conexión y después del último intento si lo es
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return ensure_indexes(db)
+        except PyMongoError as e:
+            if attempt == attempts or not _unreachable(e):
+                raise
+            logger.warning(
+                "MongoDB is not reachable (attempt %s of %s), retrying in %s seconds: %s",
+                attempt,
+                attempts,
+                delay,
+                e,
+            )
+            time.sleep(delay)
+
+
+async def bootstrap_indexes_async(
+    db, attempts=INDEXES_ATTEMPTS, delay=INDEXES_RETRY_DELAY
+):
+    """Versión asíncrona de bootstrap_indexes."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return await ensure_indexes_async(db)
+        except PyMongoError as e:
+            if attempt == attempts or not _unreachable(e):
+                raise
+            logger.warning(
+                "MongoDB is not reachable (attempt %s of %s), retrying in %s seconds: %s",
+                attempt,
+                attempts,
+                delay,
+                e,
+            )
+            await asyncio.sleep(delay)
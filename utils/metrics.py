@@ -0,0 +1,300 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
+from werkzeug.exceptions import HTTPException
+
+# Las etiquetas usan la plantilla de la ruta (/users/<id>) y no la URL, para que la
+# cantidad de series no crezca con los ids
+UNMATCHED_ROUTE = "<unmatched>"
+
+MONGO_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Duración de las solicitudes HTTP, hasta enviar el último byte",
+    ["method", "route"],
+)
+REQUESTS = Counter(
+    "http_requests",
+    "Solicitudes HTTP por código de respuesta",
+    ["method", "route", "status"],
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Tamaño del cuerpo de las respuestas HTTP",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "Duración de los comandos de MongoDB por ruta, colección y comando",
+    ["route", "collection", "command"],
+    buckets=MONGO_BUCKETS,
+)
+COMMAND_FAILURES = Counter(
+    "mongodb_command_failures",
+    "Comandos de MongoDB que terminaron con error",
+    ["route", "collection", "command"],
+)
+CHECKOUT_WAIT = Histogram(
+    "mongodb_pool_checkout_wait_seconds",
+    "Tiempo de espera por una conexión del pool de MongoDB",
+    buckets=MONGO_BUCKETS,
+)
+CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures",
+    "Esperas por una conexión del pool que fallaron",
+    ["reason"],
+)
+
+# ruta de la solicitud en curso, para etiquetar los comandos de MongoDB que ejecuta
+current_route = ContextVar("current_route", default="")
+
+
+class MetricsMiddleware:
+    """
+    Middleware WSGI que mide la duración, el código y el tamaño de cada respuesta por
+    plantilla de ruta
+
+    Mide hasta que el servidor termina de enviar el cuerpo, así que incluye las
+    respuestas transmitidas en streaming.
+    """
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+
+    def route(self, environ):
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.rule
+        except HTTPException:
+            return UNMATCHED_ROUTE
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        method = environ.get("REQUEST_METHOD", "")
+        route = self.route(environ)
+        current_route.set(route)
+        status = []
+
+        def capture(code, headers, *args):
+            status.append(code.split(" ", 1)[0])
+            return start_response(code, headers, *args)
+
+        def observe(size):
+            REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, status[0] if status else "500").inc()
+            RESPONSE_SIZE.labels(method, route).observe(size)
+
+        try:
+            body = self.wsgi_app(environ, capture)
+        except Exception:
+            observe(0)
+            raise
+        return _MeasuredBody(body, observe)
+
+
+class AsgiMetricsMiddleware:
+    """
+    Versión ASGI de MetricsMiddleware, para app_async
+
+    Mide hasta el último mensaje del cuerpo, así que también incluye las respuestas
+    transmitidas en streaming.
+    """
+
+    def __init__(self, app, asgi_app):
+        self.app = app
+        self.asgi_app = asgi_app
+
+    def route(self, scope):
+        try:
+            rule, _ = self.app.url_map.bind("").match(
+                scope["path"], method=scope["method"], return_rule=True
+            )
+            return rule.rule
+        except HTTPException:
+            return UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.asgi_app(scope, receive, send)
+        start = time.perf_counter()
+        method = scope["method"]
+        route = self.route(scope)
+        # las tareas que crea Quart para la solicitud copian este contexto
+        current_route.set(route)
+        status = []
+        size = 0
+
+        async def capture(message):
+            nonlocal size
+            if message["type"] == "http.response.start":
+                status.append(str(message["status"]))
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.asgi_app(scope, receive, capture)
+        finally:
+            REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, status[0] if status else "500").inc()
+            RESPONSE_SIZE.labels(method, route).observe(size)
+
+
+class _MeasuredBody:
+    """
+    Recorre el cuerpo de una respuesta WSGI contando bytes y mide una sola vez, al
+    terminar de recorrerlo o al cerrarlo si el cliente se desconecta antes
+    """
+
+    def __init__(self, body, observe):
+        self.body = body
+        self.observe = observe
+        self.size = 0
+        self.done = False
+
+    def _finish(self):
+        if not self.done:
+            self.done = True
+            self.observe(self.size)
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self._finish()
+
+
+def _collection(command, name):
+    # find, aggregate, update, insert, delete, count... guardan la colección como
+    # valor del comando; getMore la guarda en "collection"
+    collection = command.get("collection") if name == "getMore" else command.get(name)
+    return collection if isinstance(collection, str) else ""
+
+
+class CommandMetrics(CommandListener):
+    """Registra la duración de cada comando de MongoDB por ruta, colección y comando."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        labels = (
+            current_route.get(),
+            _collection(event.command, event.command_name),
+            event.command_name,
+        )
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = labels
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        labels = self._finish(event)
+        if labels is not None:
+            COMMAND_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        labels = self._finish(event)
+        if labels is not None:
+            COMMAND_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+            COMMAND_FAILURES.labels(*labels).inc()
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Registra el tiempo de espera por una conexión del pool."""
+
+    def connection_checked_out(self, event):
+        CHECKOUT_WAIT.observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        CHECKOUT_WAIT.observe(event.duration)
+        CHECKOUT_FAILURES.labels(str(event.reason)).inc()
+
+    # El resto de eventos del pool no se registran
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+# listeners que se entregan a MongoClient(event_listeners=...)
+MONGO_LISTENERS = [CommandMetrics(), PoolMetrics()]
+
+
+def metrics_payload():
+    """
+    Métricas en formato de texto de Prometheus
+
+    Con gunicorn, si PROMETHEUS_MULTIPROC_DIR está definida, junta las métricas de todos
+    los workers; si no, devuelve las de este proceso.
+
+    returns:
+        tuple(bytes, str): Cuerpo y Content-Type de la respuesta
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
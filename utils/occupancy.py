@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+# Días del calendario de ocupación, desde hoy
+OCCUPANCY_DAYS = int(os.environ.get("OCCUPANCY_DAYS", "90"))
+# Segundos que se confía en el calendario cargado antes de volver a leer MongoDB. Acota
+# el desfase con las reservas creadas o canceladas por otros procesos.
+DEFAULT_TTL = 60
+
+
+def _objects(values):
+    # arreglo de objetos de una dimensión, sin que NumPy intente convertir los valores
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def utilization(tipos, bits):
+    """
+    Porcentaje de días ocupados por tipo de vehículo
+
+    Args:
+        tipos: Arreglo con el tipo de cada fila de bits
+        bits: Matriz booleana vehículo × día
+    returns:
+        dict: {tipo: porcentaje de días ocupados}
+    """
+    if not len(tipos) or not bits.shape[1]:
+        return {}
+    names, inverse = np.unique(tipos.astype(str), return_inverse=True)
+    busy = np.bincount(inverse, weights=bits.sum(axis=1), minlength=len(names))
+    capacity = np.bincount(inverse, minlength=len(names)) * bits.shape[1]
+    percentages = np.round(100 * busy / capacity, 2)
+    return dict(zip(names.tolist(), percentages.tolist()))
+
+
+def report(calendar):
+    """
+    Respuesta de /vehicles/occupancy a partir de OccupancyIndex.snapshot
+
+    Args:
+        calendar: Resultado de snapshot
+    returns:
+        dict: Vehículos, matriz de ocupación (1 = día ocupado) y porcentajes de
+        utilización total, por tipo y por día
+    """
+    bits = calendar["bits"]
+    days = bits.shape[1]
+    return {
+        "desde": calendar["origin"].isoformat() if calendar["origin"] else None,
+        "dias": days,
+        "vehiculos": [
+            {"_id": id, "placa": placa, "tipo": tipo}
+            for id, placa, tipo in zip(
+                calendar["ids"], calendar["placas"], calendar["tipos"]
+            )
+        ],
+        "ocupacion": bits.astype(np.uint8).tolist(),
+        "utilizacion": {
+            "total": round(float(bits.mean()) * 100, 2) if bits.size else 0.0,
+            "por_tipo": utilization(calendar["tipos"], bits),
+            "por_dia": (
+                np.round(bits.mean(axis=0) * 100, 2).tolist()
+                if len(bits)
+                else [0.0] * days
+            ),
+        },
+    }
+
+
+class OccupancyIndex:
+    """
+    Calendario en memoria de los días ocupados de cada vehículo de la flota
+
+    Guarda una matriz booleana de NumPy con una fila por vehículo (ordenadas por _id) y
+    una columna por día desde hoy. Se carga desde la colección ocupacion, que tiene un
+    documento por día de cada reserva activa, y se actualiza al crear, cancelar y
+    terminar reservas. Se vuelve a cargar cuando supera el TTL o cambia el día.
+    """
+
+    def __init__(self, days=OCCUPANCY_DAYS, ttl=DEFAULT_TTL):
+        self.days = days
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._origin = None
+        self._loaded_at = None
+        self._keys = np.empty(0, dtype="S12")
+        self._ids = np.empty(0, dtype=object)
+        self._placas = np.empty(0, dtype=object)
+        self._tipos = np.empty(0, dtype=object)
+        self._bits = np.zeros((0, days), dtype=bool)
+
+    def is_warm(self, today=None):
+        with self._lock:
+            return (
+                self._loaded_at is not None
+                and time.monotonic() - self._loaded_at <= self.ttl
+                and self._origin == (today or date.today())
+            )
+
+    def load(self, vehicles, slots, today=None):
+        """
+        Reemplaza el calendario completo
+
+        Args:
+            vehicles: Iterable de vehículos con _id, placa y tipo
+            slots: Iterable de documentos de ocupacion con id_vehiculo y dia
+            today: Primer día del calendario, por defecto hoy
+        """
+        origin = today or date.today()
+        vehicles = sorted(vehicles, key=lambda vehicle: vehicle["_id"].binary)
+        keys = np.array([vehicle["_id"].binary for vehicle in vehicles], dtype="S12")
+        ids = _objects([vehicle["_id"] for vehicle in vehicles])
+        placas = _objects([vehicle.get("placa") for vehicle in vehicles])
+        tipos = _objects([vehicle.get("tipo") for vehicle in vehicles])
+        bits = np.zeros((len(vehicles), self.days), dtype=bool)
+
+        slots = list(slots)
+        if slots and len(keys):
+            slot_keys = np.array([slot["id_vehiculo"].binary for slot in slots], "S12")
+            slot_days = np.array([slot["dia"] for slot in slots], "datetime64[D]")
+            # los vehículos que ya no existen quedan con rows == right
+            rows = np.searchsorted(keys, slot_keys)
+            right = np.searchsorted(keys, slot_keys, side="right")
+            columns = (slot_days - np.datetime64(origin, "D")).astype(int)
+            valid = (rows < right) & (columns >= 0) & (columns < self.days)
+            bits[rows[valid], columns[valid]] = True
+
+        with self._lock:
+            self._origin = origin
+            self._keys, self._ids, self._placas, self._tipos = keys, ids, placas, tipos
+            self._bits = bits
+            self._loaded_at = time.monotonic()
+
+    def _queries(self, today):
+        origin = datetime.combine(today or date.today(), datetime.min.time())
+        return (
+            ({}, {"placa": 1, "tipo": 1}),
+            (
+                {"dia": {"$gte": origin, "$lt": origin + timedelta(days=self.days)}},
+                {"_id": 0, "id_vehiculo": 1, "dia": 1},
+            ),
+        )
+
+    def warm(self, db, today=None):
+        """
+        Carga el calendario desde las colecciones vehiculos y ocupacion
+
+        Args:
+            db: Base de datos de pymongo
+            today: Primer día del calendario, por defecto hoy
+        """
+        vehicles, slots = self._queries(today)
+        self.load(db.vehiculos.find(*vehicles), db.ocupacion.find(*slots), today)
+
+    async def warm_async(self, db, today=None):
+        """Igual que warm, para una base de datos del cliente asíncrono."""
+        vehicles, slots = self._queries(today)
+        self.load(
+            await db.vehiculos.find(*vehicles).to_list(None),
+            await db.ocupacion.find(*slots).to_list(None),
+            today,
+        )
+
+    def _mark(self, vehicle_id, start, end, value):
+        with self._lock:
+            if self._origin is None:
+                return
+            key = np.array(vehicle_id.binary, dtype="S12")
+            row = np.searchsorted(self._keys, key)
+            if row == np.searchsorted(self._keys, key, side="right"):
+                return
+            first = max((start.date() - self._origin).days, 0)
+            last = min((end.date() - self._origin).days, self.days - 1)
+            if first <= last:
+                self._bits[row, first : last + 1] = value
+
+    def add(self, vehicle_id, start, end):
+        """Marca como ocupados los días de una reserva si el vehículo está cargado."""
+        self._mark(vehicle_id, start, end, True)
+
+    def remove(self, vehicle_id, start, end):
+        """Libera los días de una reserva que dejó de estar activa."""
+        self._mark(vehicle_id, start, end, False)
+
+    def invalidate(self):
+        """Obliga a volver a cargar el calendario, por ejemplo al cambiar la flota."""
+        with self._lock:
+            self._loaded_at = None
+
+    def snapshot(self, days=None, tipo=None):
+        """
+        Copia del calendario para responder una consulta
+
+        Args:
+            days: Cantidad de días desde hoy, por defecto todos
+            tipo: Tipo de vehículo o None para toda la flota
+        returns:
+            dict: origin, ids, placas, tipos y bits (matriz vehículo × día)
+        """
+        with self._lock:
+            selected = (
+                self._tipos == tipo if tipo else np.ones(len(self._keys), dtype=bool)
+            )
+            return {
+                "origin": self._origin,
+                "ids": self._ids[selected],
+                "placas": self._placas[selected],
+                "tipos": self._tipos[selected],
+                "bits": self._bits[selected, : days or self.days].copy(),
+            }
+
+
+occupancy = OccupancyIndex()
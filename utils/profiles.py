@@ -0,0 +1,92 @@
+import os
+
+from pymongo import WriteConcern
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+# MongoDB exige un maxStalenessSeconds de al menos 90 segundos
+MAX_STALENESS_SECONDS = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "90"))
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def read_preference(mode, max_staleness=MAX_STALENESS_SECONDS):
+    """
+    Construye la preferencia de lectura a partir de su nombre
+
+    Args:
+        mode: Nombre de la preferencia, por ejemplo "secondaryPreferred"
+        max_staleness: Retraso máximo en segundos de un secundario (no aplica a primary)
+    returns:
+        _ServerMode: Preferencia de lectura de pymongo
+    Raises:
+        KeyError: Si la preferencia no existe
+    """
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+def write_concern(w):
+    """
+    Construye el write concern a partir de su valor textual ("majority", "1", "0")
+
+    Args:
+        w: Cantidad de nodos que deben confirmar la escritura o "majority"
+    returns:
+        WriteConcern: Write concern de pymongo
+    """
+    return WriteConcern(w=int(w) if w.isdigit() else w)
+
+
+# Perfiles de acceso por tipo de operación. Las estadísticas y los listados toleran
+# datos con algunos segundos de retraso y se leen de los secundarios; las validaciones
+# de create_reservation se leen siempre del primario. El registro de cancelaciones es
+# un log de eventos, por lo que se puede escribir con un write concern más débil.
+PROFILES = {
+    "analytics": {
+        "read_preference": read_preference(
+            os.environ.get("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+        ),
+        "read_concern": ReadConcern("local"),
+    },
+    "lists": {
+        "read_preference": read_preference(
+            os.environ.get("MONGO_LISTS_READ_PREFERENCE", "secondaryPreferred")
+        ),
+        "read_concern": ReadConcern("local"),
+    },
+    "primary": {
+        "read_preference": Primary(),
+        "read_concern": ReadConcern("local"),
+    },
+    "cancellations_log": {
+        "write_concern": write_concern(os.environ.get("MONGO_CANCELLATIONS_W", "1")),
+    },
+}
+
+
+def get_collection(db, name, profile):
+    """
+    Devuelve la colección con las opciones de lectura y escritura de un perfil
+
+    Args:
+        db: Base de datos (síncrona o asíncrona)
+        name: Nombre de la colección
+        profile: Nombre del perfil en PROFILES
+    returns:
+        Collection: Colección configurada con el perfil
+    """
+    return db.get_collection(name, **PROFILES[profile])
@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.json_util import default as bson_default
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional, se usa json de la librería estándar
+    orjson = None
+
+# "extended" conserva el formato de bson.json_util ({"$oid": ...}, {"$date": ...}),
+# "plain" emite los ids como texto y las fechas en ISO 8601
+EXTENDED = "extended"
+PLAIN = "plain"
+JSON_MODE = os.environ.get("JSON_MODE", EXTENDED)
+
+
+def _extended_default(obj):
+    """
+    Convierte los tipos BSON que el codificador no conoce al formato Extended JSON relajado
+
+    Args:
+        obj: Valor a convertir
+    returns:
+        dict: Representación Extended JSON del valor
+    """
+    if isinstance(obj, ObjectId):
+        return {"$oid": str(obj)}
+    if (
+        isinstance(obj, datetime)
+        and obj.utcoffset() in (None, timedelta(0))
+        and obj.year >= 1970
+    ):
+        millis = obj.microsecond // 1000
+        date = obj.replace(tzinfo=None).isoformat(timespec="seconds")
+        return {"$date": f"{date}.{millis:03d}Z" if millis else f"{date}Z"}
+    return bson_default(obj)
+
+
+def _plain_default(obj):
+    """
+    Convierte ObjectId a texto y datetime a ISO 8601, el resto como Extended JSON
+
+    Args:
+        obj: Valor a convertir
+    returns:
+        str | dict: Representación JSON del valor
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return bson_default(obj)
+
+
+_DEFAULTS = {EXTENDED: _extended_default, PLAIN: _plain_default}
+
+
+def dumps(obj, mode=None):
+    """
+    Serializa documentos de MongoDB a JSON sin recorrerlos antes en Python, como hace
+    bson.json_util.dumps; solo los valores BSON pasan por la función de conversión
+
+    Args:
+        obj: Documento, lista de documentos o cualquier valor serializable
+        mode: "extended" o "plain"; por defecto el valor de JSON_MODE
+    returns:
+        str: Texto JSON
+    Raises:
+        ValueError: Si el modo no existe
+    """
+    mode = mode or JSON_MODE
+    if mode not in _DEFAULTS:
+        raise ValueError(f"Unknown JSON mode: {mode}")
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_DEFAULTS[mode],
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        ).decode()
+    return json.dumps(obj, default=_DEFAULTS[mode])
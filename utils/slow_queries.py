@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import CommandListener
+from utils.cache import TTLCache
+from utils.metrics import current_route
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", "200"))
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "1") == "1"
+
+# comando -> campo con el filtro; update y delete llevan una lista de operaciones
+FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+    "update": "updates",
+    "delete": "deletes",
+}
+# campos del comando que explain no acepta
+EXPLAIN_EXCLUDED = {"lsid", "txnNumber", "readConcern", "writeConcern"}
+
+
+def query_shape(value):
+    """
+    Reemplaza los valores de un filtro por "?" conservando campos y operadores, para
+    agrupar las consultas iguales sin registrar datos de los usuarios
+
+    Args:
+        value: Filtro, pipeline o valor
+    returns:
+        Forma del filtro
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+def command_shape(command, name):
+    """
+    Forma del filtro de un comando, ver query_shape
+
+    Args:
+        command: Documento del comando
+        name: Nombre del comando
+    returns:
+        Forma del filtro o del pipeline
+    """
+    field = FILTER_FIELDS[name]
+    value = command.get(field)
+    if name in ("update", "delete"):
+        value = [operation.get("q") for operation in value or []]
+    return query_shape(value or {})
+
+
+def plan_stages(explain):
+    """
+    Etapas del plan ganador de un explain, de la raíz a las hojas
+
+    Args:
+        explain: Resultado del comando explain (find, aggregate, update...)
+    returns:
+        list[str]: Etapas, con el índice usado en las de tipo IXSCAN
+    """
+    stages = []
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        if "winningPlan" in node:
+            walk(node["winningPlan"])
+            return
+        if "stage" in node:
+            stage = node["stage"]
+            if "indexName" in node:
+                stage = f"{stage}({node['indexName']})"
+            stages.append(stage)
+        for key in ("queryPlan", "inputStage", "inputStages", "queryPlanner"):
+            if key in node:
+                walk(node[key])
+        # explain de aggregate: la primera etapa ($cursor) contiene el queryPlanner
+        for key in ("stages", "shards", "$cursor"):
+            if key in node and not stages:
+                walk(node[key])
+
+    walk(explain)
+    return stages
+
+
+class SlowQueryLog(CommandListener):
+    """
+    Registra los comandos de MongoDB que superan threshold_ms con la forma de su filtro
+
+    El explain de cada comando lento se obtiene en un hilo aparte, para no demorar la
+    solicitud, y se marca si el plan ganador recorre la colección completa (COLLSCAN).
+    Las entradas recientes quedan en memoria para /admin/slow-queries.
+    """
+
+    def __init__(
+        self,
+        threshold_ms=SLOW_QUERY_MS,
+        size=SLOW_QUERY_LOG_SIZE,
+        explain=SLOW_QUERY_EXPLAIN,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.entries = deque(maxlen=size)
+        # getter del MongoClient con el que se ejecutan los explain, ver bind
+        self.client = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        # un explain por forma de consulta cada 5 minutos
+        self._plans = TTLCache(maxsize=512, ttl=300)
+
+    def bind(self, client):
+        """Define la función que devuelve el MongoClient para ejecutar los explain."""
+        self.client = client
+
+    def started(self, event):
+        if event.command_name not in FILTER_FIELDS:
+            return
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                current_route.get(),
+                event.database_name,
+                event.command,
+            )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        route, database, command = pending
+        name = event.command_name
+        entry = {
+            "fecha": datetime.now(),
+            "route": route,
+            "database": database,
+            "collection": command.get(name),
+            "command": name,
+            "duration_ms": round(duration_ms, 3),
+            "shape": command_shape(command, name),
+            "plan": None,
+            "collscan": None,
+        }
+        self.entries.append(entry)
+        logger.warning(
+            "Slow %s on %s (%.1f ms, route %s): %s",
+            name,
+            entry["collection"],
+            duration_ms,
+            route or "-",
+            json.dumps(entry["shape"]),
+        )
+        if self.explain and self.client is not None and name != "getMore":
+            self._submit(entry, database, command)
+
+    def _submit(self, entry, database, command):
+        shape_key = json.dumps([entry["collection"], entry["command"], entry["shape"]])
+        plan = self._plans.get(shape_key)
+        if plan is not None:
+            entry["plan"], entry["collscan"] = plan
+            return
+        # el hilo del executor no sobrevive al fork de gunicorn, cada worker crea el suyo
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._pid = os.getpid()
+        explained = {
+            key: value
+            for key, value in command.items()
+            if key not in EXPLAIN_EXCLUDED and not key.startswith("$")
+        }
+        self._executor.submit(self._explain, shape_key, entry, database, explained)
+
+    def _explain(self, shape_key, entry, database, command):
+        try:
+            explain = self.client()[database].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+        except PyMongoError as e:
+            logger.warning("Could not explain slow %s: %s", entry["command"], e)
+            return
+        stages = plan_stages(explain)
+        entry["plan"] = " > ".join(stages)
+        entry["collscan"] = "COLLSCAN" in stages
+        self._plans.set(shape_key, (entry["plan"], entry["collscan"]))
+        if entry["collscan"]:
+            logger.warning(
+                "COLLSCAN in slow %s on %s: %s",
+                entry["command"],
+                entry["collection"],
+                json.dumps(entry["shape"]),
+            )
+
+    def recent(self, limit=None):
+        """
+        Entradas registradas, de la más reciente a la más antigua
+
+        Args:
+            limit: Cantidad máxima de entradas
+        returns:
+            list[dict]: Entradas del registro
+        """
+        entries = list(reversed(self.entries))
+        return entries[:limit] if limit else entries
+
+
+# registro de este proceso; app.py lo agrega a los event_listeners de MongoClient
+slow_queries = SlowQueryLog()
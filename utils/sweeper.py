@@ -0,0 +1,159 @@
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre ejecuciones del barrido, 0 lo desactiva
+SWEEPER_INTERVAL = float(os.environ.get("SWEEPER_INTERVAL", "300"))
+# Reservas por lote y lotes por ejecución
+SWEEPER_BATCH_SIZE = int(os.environ.get("SWEEPER_BATCH_SIZE", "500"))
+SWEEPER_MAX_BATCHES = int(os.environ.get("SWEEPER_MAX_BATCHES", "20"))
+# Segundos que se respetan los días ocupados de una reserva que todavía no se insertó
+SWEEPER_SLOT_GRACE = float(os.environ.get("SWEEPER_SLOT_GRACE", "60"))
+# Segundos hacia atrás que se revisan los días ocupados la primera vez, cuando todavía
+# no hay una ejecución anterior; el documento {_id: ORPHAN_SLOTS_TASK} de la colección
+# tareas guarda hasta dónde llegó la última
+SWEEPER_ORPHAN_WINDOW = float(os.environ.get("SWEEPER_ORPHAN_WINDOW", "3600"))
+ORPHAN_SLOTS_TASK = "dias_huerfanos"
+
+
+def utcnow():
+    # MongoDB guarda las fechas en UTC sin zona horaria
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Sweeper:
+    """
+    Ejecuta una tarea de mantenimiento cada interval segundos en un hilo del proceso
+
+    Con varios workers (o varias réplicas de la API) todos tienen su hilo, pero solo
+    ejecuta la tarea quien tiene la concesión del documento {_id: name} de la colección
+    tareas. El dueño la renueva en cada ejecución; si el proceso muere, otro la toma
+    cuando vence (dos intervalos después). El documento guarda también el resultado de
+    la última ejecución.
+    """
+
+    def __init__(self, name, interval=SWEEPER_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.db = None
+        self.job = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def owner(self):
+        # se calcula en cada llamada: los workers de gunicorn heredan el objeto del maestro
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def bind(self, db, job):
+        """
+        Define la base de datos y la tarea
+
+        Args:
+            db: Función que devuelve la base de datos de pymongo
+            job: Función sin argumentos que ejecuta la tarea y devuelve un resumen
+        """
+        self.db = db
+        self.job = job
+
+    def acquire(self, now=None):
+        """
+        Toma o renueva la concesión de la tarea
+
+        Args:
+            now: Fecha actual en UTC
+        returns:
+            bool: True si este proceso es el dueño de la concesión
+        """
+        now = now or utcnow()
+        try:
+            self.db().tareas.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"hasta": {"$lt": now}}, {"propietario": self.owner}],
+                },
+                {
+                    "$set": {
+                        "propietario": self.owner,
+                        "hasta": now + timedelta(seconds=2 * self.interval),
+                    }
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # el documento existe con una concesión vigente de otro proceso
+            return False
+        return True
+
+    def release(self, now=None):
+        """
+        Deja vencida la concesión si este proceso es el dueño, para que otro la tome
+        en su próxima ejecución sin esperar dos intervalos
+
+        Args:
+            now: Fecha actual en UTC
+        """
+        self.db().tareas.update_one(
+            {"_id": self.name, "propietario": self.owner},
+            {"$set": {"hasta": now or utcnow()}},
+        )
+
+    def run_once(self, now=None):
+        """
+        Ejecuta la tarea si este proceso tiene la concesión
+
+        returns:
+            dict | None: Resumen de la tarea, o None si la tiene otro proceso
+        """
+        if not self.acquire(now):
+            return None
+        result = self.job()
+        logger.info("Task %s: %s", self.name, result)
+        self.db().tareas.update_one(
+            {"_id": self.name},
+            {"$set": {"ultima_ejecucion": now or utcnow(), "resultado": result}},
+        )
+        return result
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except PyMongoError as e:
+                logger.warning("Task %s failed: %s", self.name, e)
+            except Exception:
+                logger.exception("Task %s failed", self.name)
+
+    def start(self):
+        """Inicia el hilo si la tarea está activa y no corre ya en este proceso."""
+        if self.interval <= 0 or self.job is None:
+            return
+        # tras un fork el hilo del proceso padre no existe en el hijo
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, name=f"sweeper-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Detiene el hilo y espera a que termine la ejecución en curso
+
+        Args:
+            timeout: Segundos máximos de espera, None para esperar sin límite
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+
+# barrido de reservas y bloqueos vencidos; app.py le asigna la tarea
+sweeper = Sweeper("reservas_vencidas")
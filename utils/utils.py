@@ -1,41 +1,205 @@
 from app import mongo
+from bson import ObjectId
+from functools import wraps
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from flask import Response, jsonify, make_response, request
+from utils.availability import availability
+from utils.occupancy import occupancy
+from utils.sweeper import (
+    SWEEPER_BATCH_SIZE,
+    SWEEPER_MAX_BATCHES,
+    SWEEPER_ORPHAN_WINDOW,
+    SWEEPER_SLOT_GRACE,
+    ORPHAN_SLOTS_TASK,
+    utcnow,
+)
+from utils.cache import refresh_on_version, user_cache
+from utils.profiles import get_collection
+from utils.common import *
 
 
 def check_reserve(vehicle_id, start_date, end_date):
     """
-    Realiza una consulta a la base de datos para verificar si existen reservas activas que se superpongan con las fechas entregadas
+    Verifica si existe una reserva activa que se superponga con las fechas entregadas
+
+    Si el vehículo está cargado en el índice de disponibilidad y las fechas están libres
+    responde sin consultar MongoDB; claim_slots decide en último término. Un conflicto
+    del índice es solo una pista: sin change stream el índice no ve las cancelaciones de
+    otros workers hasta que vence su TTL, así que se confirma con una consulta de
+    existencia en el primario. Si el vehículo no está cargado, hace esa consulta y lo
+    carga para las siguientes.
 
     Args:
         vehicle_id: Id del vehiculo
         start_date: Fecha inicial
         end_date: Fecha final
     returns:
-        list(reservation): Una lista con todas las reservas que cumplan la coincidencia
+        reservation: Una reserva que se superpone con las fechas, o None si están libres
+
+    """
+    warm, hint = availability.find_conflict(vehicle_id, start_date, end_date)
+    if warm and hint is None:
+        return None
+    # la validación de create_reservation siempre lee del primario
+    reservas = get_collection(mongo.db, "reservas", "primary")
+    reservation = reservas.find_one(
+        overlap_query(vehicle_id, start_date, end_date),
+        {"fecha_inicio": 1, "fecha_fin": 1},
+    )
+    if not warm or reservation is None or reservation["_id"] != hint["_id"]:
+        availability.warm(reservas, vehicle_id)
+    return reservation
+
+
+def claim_slots(reservations):
+    """
+    Ocupa en la colección ocupacion los días de cada reserva
+
+    El índice único (id_vehiculo, dia) hace que dos solicitudes concurrentes no puedan
+    ocupar el mismo día: la segunda recibe un error de clave duplicada. Las reservas con
+    algún día ya ocupado liberan los días que sí alcanzaron a ocupar.
+
+    Args:
+        reservations: Reservas con _id, id_vehiculo, fecha_inicio y fecha_fin
+    returns:
+        set: _id de las reservas rechazadas por tener algún día ocupado
+    Raises:
+        BulkWriteError: Si la inserción falla por otro motivo; no queda ningún día ocupado
+    """
+    slots = [
+        slot for reservation in reservations for slot in occupancy_slots(reservation)
+    ]
+    if not slots:
+        return set()
+    try:
+        mongo.db.ocupacion.insert_many(slots, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+            release_slots([reservation["_id"] for reservation in reservations])
+            raise
+        rejected = {slots[error["index"]]["id_reserva"] for error in errors}
+        release_slots(rejected)
+        return rejected
+    return set()
+
+
+def release_slots(reservation_ids):
+    """
+    Libera los días ocupados por las reservas
+
+    Args:
+        reservation_ids: Ids de las reservas
+    """
+    mongo.db.ocupacion.delete_many({"id_reserva": {"$in": list(reservation_ids)}})
+
+
+def find_slot_conflict(reservation):
+    """
+    Busca la reserva que ocupa alguno de los días de otra
+
+    Args:
+        reservation: Reserva rechazada por claim_slots
+    returns:
+        dict | None: Fechas de la reserva que ocupa el día, o None si ya se liberó
+    """
+    slot = mongo.db.ocupacion.find_one(slot_conflict_query(reservation))
+    if slot is None:
+        return None
+    return mongo.db.reservas.find_one(
+        {"_id": slot["id_reserva"]}, {"fecha_inicio": 1, "fecha_fin": 1}
+    )
+
+
+def release_orphan_slots(before=None, since=None):
+    """
+    Libera los días ocupados por reservas que no existen o que ya no están activas
+
+    Quedan, por ejemplo, si el proceso se cae entre claim_slots y la inserción de la
+    reserva. El _id de la reserva se genera antes de ocupar los días, así que su fecha
+    sirve para no tocar los días de una reserva que se está creando ahora y para
+    revisar solo las reservas creadas desde la ejecución anterior, que queda guardada
+    en la colección tareas. Los días de reservas más viejas que quedaron ocupados, por
+    ejemplo si el proceso se cayó al cancelar, los libera rebuild_occupancy.
+
+    Args:
+        before: Solo revisa reservas con _id anterior a esta fecha (UTC), por defecto
+            SWEEPER_SLOT_GRACE segundos atrás
+        since: Solo revisa reservas con _id desde esta fecha (UTC), por defecto donde
+            terminó la ejecución anterior o SWEEPER_ORPHAN_WINDOW segundos antes de
+            before si no hubo ninguna
+    returns:
+        int: Cantidad de días liberados
+    """
+    before = before or utcnow() - timedelta(seconds=SWEEPER_SLOT_GRACE)
+    if since is None:
+        task = mongo.db.tareas.find_one({"_id": ORPHAN_SLOTS_TASK}, {"hasta": 1})
+        since = (
+            task["hasta"] if task else before - timedelta(seconds=SWEEPER_ORPHAN_WINDOW)
+        )
+    orphans = [
+        slot["_id"]
+        for slot in mongo.db.ocupacion.aggregate(orphan_slots_pipeline(since, before))
+    ]
+    released = 0
+    if orphans:
+        released = mongo.db.ocupacion.delete_many(
+            {"id_reserva": {"$in": orphans}}
+        ).deleted_count
+    mongo.db.tareas.update_one(
+        {"_id": ORPHAN_SLOTS_TASK}, {"$max": {"hasta": before}}, upsert=True
+    )
+    return released
+
+
+def rebuild_occupancy():
+    """
+    Recalcula la colección ocupacion a partir de las reservas activas
+
+    Se hace vehículo por vehículo: primero se borran los días de reservas que ya no
+    están activas y después se insertan los que faltan. Los días bien ocupados no se
+    borran en ningún momento, así que la API puede seguir creando reservas mientras
+    tanto sin que se cuele una superpuesta.
 
+    returns:
+        int: Cantidad de días ocupados
     """
-    reservation = list(
-        mongo.db.reservas.find(
+    active = {}
+    for reservation in mongo.db.reservas.find(
+        {"estado": "activa"},
+        {"id_vehiculo": 1, "fecha_inicio": 1, "fecha_fin": 1},
+    ):
+        active.setdefault(reservation["id_vehiculo"], []).append(reservation)
+    vehicle_ids = set(active) | set(mongo.db.ocupacion.distinct("id_vehiculo"))
+    for vehicle_id in vehicle_ids:
+        reservations = active.get(vehicle_id, [])
+        mongo.db.ocupacion.delete_many(
             {
-                "$and": [
-                    {"id_vehiculo": vehicle_id},
-                    {"estado": "activa"},
-                    {
-                        "$or": [
-                            {
-                                "fecha_fin": {"$gte": start_date},
-                                "fecha_inicio": {"$lte": end_date},
-                            },
-                            {
-                                "fecha_inicio": {"$lte": end_date},
-                                "fecha_fin": {"$gte": start_date},
-                            },
-                        ]
-                    },
-                ]
+                "id_vehiculo": vehicle_id,
+                "id_reserva": {
+                    "$nin": [reservation["_id"] for reservation in reservations]
+                },
             }
         )
-    )
-    return reservation
+        slots = [
+            slot
+            for reservation in reservations
+            for slot in occupancy_slots(reservation)
+        ]
+        if not slots:
+            continue
+        try:
+            mongo.db.ocupacion.insert_many(slots, ordered=False)
+        except BulkWriteError as e:
+            # días que ya estaban ocupados por su reserva, o reservas activas
+            # superpuestas de antes de esta colección: el día queda asignado a una
+            if any(
+                error["code"] != DUPLICATE_KEY_ERROR
+                for error in e.details.get("writeErrors", [])
+            ):
+                raise
+    return mongo.db.ocupacion.count_documents({})
 
 
 def update_historial(user_id, reserva_id, start_date):
@@ -47,12 +211,505 @@ def update_historial(user_id, reserva_id, start_date):
         reserva_id: Id de la reserva
         start_date: Fecha inicial
     """
-    historial_reservas = {
-        "reserva_id": reserva_id,
-        "fecha": start_date,
-        "estado": "confirmada",
-    }
+    append_historial({user_id: [historial_entry(reserva_id, start_date)]})
+
 
+def append_historial(historial):
+    """
+    Agrega entradas al historial de varios usuarios
+
+    Tres operaciones para todo el lote: un bulk_write agrega las entradas recientes y
+    reserva sus posiciones con historial_total, una consulta $in lee esas posiciones (ver
+    historial_positions) y otro bulk_write agrega las entradas a los buckets que les
+    corresponden, ver historial_bucket_writes. Un usuario sin historial_total tiene
+    todavía el historial en el documento: se migra y se actualiza por separado.
+
+    Args:
+        historial: {id_usuario: [entradas]} en orden cronológico
+    """
+    if not historial:
+        return
+    mongo.db.usuarios.bulk_write(historial_user_writes(historial), ordered=False)
+    users = mongo.db.usuarios.find(
+        {"_id": {"$in": list(historial)}},
+        {"historial_total": 1, "historial_reservas.reserva_id": 1},
+    )
+    positions, legacy = historial_positions(users, historial)
+    for user_id in legacy:
+        migrate_user_historial(user_id)
+        user = mongo.db.usuarios.find_one_and_update(
+            {"_id": user_id, "historial_total": {"$exists": True}},
+            historial_user_update(historial[user_id]),
+            projection={"historial_total": 1},
+        )
+        if user is not None:
+            positions[user_id] = user["historial_total"]
+    buckets = [
+        write
+        for user_id, position in positions.items()
+        for write in historial_bucket_writes(user_id, historial[user_id], position)
+    ]
+    if buckets:
+        mongo.db.historial_buckets.bulk_write(buckets, ordered=False)
+    for user_id in historial:
+        user_cache.invalidate(user_id)
+    bump_versions("usuarios", list(historial))
+
+
+def cancel_historial_entry(user_id, reserva_id, until):
+    """
+    Marca como cancelada una entrada del historial y actualiza el bloqueo del usuario
+
+    La entrada puede ya no estar entre las recientes del usuario, por eso se actualiza
+    con arrayFilters (que no exige que exista) y también en su bucket.
+
+    Args:
+        user_id: Id del usuario
+        reserva_id: Id de la reserva cancelada
+        until: Fin del bloqueo del usuario, o None si no queda bloqueado
+    """
     mongo.db.usuarios.update_one(
-        {"_id": user_id}, {"$push": {"historial_reservas": historial_reservas}}
+        {"_id": user_id},
+        block_update(until, {"historial_reservas.$[entrada].estado": "cancelado"}),
+        array_filters=[{"entrada.reserva_id": reserva_id}],
+    )
+    mongo.db.historial_buckets.update_one(
+        {"id_usuario": user_id, "entradas.reserva_id": reserva_id},
+        {"$set": {"entradas.$.estado": "cancelado"}},
     )
+    user_cache.invalidate(user_id)
+    bump_versions("usuarios", [user_id])
+
+
+def set_historial_estado(reservations, estado):
+    """
+    Cambia el estado de entradas del historial de varios usuarios, ver
+    historial_estado_writes
+
+    Args:
+        reservations: {id_usuario: [ids de reservas]}
+        estado: Nuevo estado de las entradas
+    """
+    users, buckets = historial_estado_writes(reservations, estado)
+    mongo.db.usuarios.bulk_write(users, ordered=False)
+    mongo.db.historial_buckets.bulk_write(buckets, ordered=False)
+    for user_id in reservations:
+        user_cache.invalidate(user_id)
+    bump_versions("usuarios", list(reservations))
+
+
+def finish_expired_reservations(
+    now=None, batch_size=SWEEPER_BATCH_SIZE, max_batches=SWEEPER_MAX_BATCHES
+):
+    """
+    Pasa a terminada las reservas activas cuya fecha final ya pasó, por lotes
+
+    Cada lote se lee por el índice (estado, fecha_fin), se actualiza con un update_many
+    que vuelve a exigir estado activa (una cancelación concurrente gana) y actualiza el
+    historial de sus usuarios con un bulk_write por colección.
+
+    Args:
+        now: Fecha actual, por defecto datetime.now()
+        batch_size: Reservas por lote
+        max_batches: Lotes como máximo en esta ejecución
+    returns:
+        dict: Reservas terminadas, usuarios actualizados y lotes procesados
+    """
+    query = expired_reservations_query(now)
+    summary = {"reservas": 0, "usuarios": 0, "lotes": 0}
+    users = set()
+    while summary["lotes"] < max_batches:
+        batch = list(
+            mongo.db.reservas.find(
+                query,
+                {"id_usuario": 1, "id_vehiculo": 1, "fecha_inicio": 1, "fecha_fin": 1},
+            ).limit(batch_size)
+        )
+        if not batch:
+            break
+        ids = [reservation["_id"] for reservation in batch]
+        result = mongo.db.reservas.update_many(
+            {"_id": {"$in": ids}, "estado": "activa"},
+            {"$set": {"estado": "terminada"}},
+        )
+        release_slots(ids)
+        by_user = {}
+        for reservation in batch:
+            availability.remove(reservation["id_vehiculo"], reservation["_id"])
+            occupancy.remove(
+                reservation["id_vehiculo"],
+                reservation["fecha_inicio"],
+                reservation["fecha_fin"],
+            )
+            by_user.setdefault(reservation["id_usuario"], []).append(reservation["_id"])
+        set_historial_estado(by_user, "terminada")
+        users.update(by_user)
+        summary["reservas"] += result.modified_count
+        summary["lotes"] += 1
+        if len(batch) < batch_size:
+            break
+    summary["usuarios"] = len(users)
+    return summary
+
+
+def unblock_expired_users(now=None):
+    """
+    Desbloquea con un solo update_many a los usuarios cuyo bloqueado_hasta ya pasó
+
+    Args:
+        now: Fecha actual, por defecto datetime.now()
+    returns:
+        int: Cantidad de usuarios desbloqueados
+    """
+    query = expired_blocks_query(now)
+    # los ids solo se leen para invalidar la caché y las versiones de esos usuarios
+    ids = [user["_id"] for user in mongo.db.usuarios.find(query, {"_id": 1})]
+    if not ids:
+        return 0
+    result = mongo.db.usuarios.update_many(
+        {"_id": {"$in": ids}, **query}, block_update(None)
+    )
+    for user_id in ids:
+        user_cache.invalidate(user_id)
+    bump_versions("usuarios", ids)
+    return result.modified_count
+
+
+def run_maintenance(now=None):
+    """
+    Tarea del barrido periódico: termina las reservas vencidas, desbloquea usuarios y
+    libera los días ocupados sin reserva activa
+
+    Args:
+        now: Fecha actual, por defecto datetime.now()
+    returns:
+        dict: Resumen de finish_expired_reservations, usuarios desbloqueados y días
+        liberados
+    """
+    summary = finish_expired_reservations(now)
+    summary["desbloqueados"] = unblock_expired_users(now)
+    summary["dias_liberados"] = release_orphan_slots()
+    return summary
+
+
+def historial_page(user_id, offset, limit):
+    """
+    Lee una página del historial completo de un usuario desde historial_buckets
+
+    Args:
+        user_id: Id del usuario
+        offset: Posición de la primera entrada
+        limit: Cantidad máxima de entradas
+    returns:
+        list | None: Las entradas de la página, o None si el usuario no tiene historial
+    """
+    buckets = list(
+        mongo.db.historial_buckets.find({"id_usuario": user_id}, {"cantidad": 1}).sort(
+            "seq", 1
+        )
+    )
+    if not buckets:
+        return None
+    page = []
+    for index, start, end in bucket_ranges(
+        [bucket["cantidad"] for bucket in buckets], offset, limit
+    ):
+        # $slice trae solo las entradas de la página, no el bucket completo
+        bucket = mongo.db.historial_buckets.find_one(
+            {"_id": buckets[index]["_id"]},
+            {"_id": 0, "entradas": {"$slice": [start, end - start]}},
+        )
+        page.extend(bucket["entradas"])
+    return page
+
+
+def migrate_user_historial(user_id):
+    """
+    Pasa a historial_buckets el historial guardado en un usuario sin historial_total y
+    deja en el usuario solo las últimas HISTORIAL_RECENT entradas
+
+    historial_total se fija con un update condicional, así solo uno de los procesos que
+    lo intentan a la vez copia las entradas. Las que se agreguen desde ese momento van
+    detrás: las migradas se agregan al principio de cada bucket.
+
+    Args:
+        user_id: Id del usuario
+    returns:
+        bool: True si este llamado migró al usuario
+    """
+    query = {"_id": user_id, "historial_total": {"$exists": False}}
+    user = mongo.db.usuarios.find_one(query, {"historial_reservas": 1})
+    if user is None:
+        return False
+    entries = user.get("historial_reservas", [])
+    result = mongo.db.usuarios.update_one(
+        query, {"$set": {"historial_total": len(entries)}}
+    )
+    if result.modified_count == 0:
+        return False
+    if entries:
+        mongo.db.historial_buckets.bulk_write(
+            historial_bucket_writes(user_id, entries, 0, prepend=True), ordered=False
+        )
+        mongo.db.usuarios.update_one(
+            {"_id": user_id},
+            {
+                "$push": {
+                    "historial_reservas": {"$each": [], "$slice": -HISTORIAL_RECENT}
+                }
+            },
+        )
+    user_cache.invalidate(user_id)
+    bump_versions("usuarios", [user_id])
+    return True
+
+
+def migrate_historial():
+    """
+    Migra a historial_buckets a todos los usuarios que todavía no tienen historial_total,
+    ver migrate_user_historial
+
+    returns:
+        int: Cantidad de usuarios migrados
+    """
+    count = 0
+    for user in mongo.db.usuarios.find(
+        {"historial_total": {"$exists": False}}, {"_id": 1}
+    ):
+        count += migrate_user_historial(user["_id"])
+    return count
+
+
+def register_cancellation(user_id, when):
+    """
+    Suma una cancelación al contador diario del usuario y devuelve el total de la ventana
+
+    La colección cancelaciones_ventana guarda un documento por usuario con un contador
+    por día ({_id: id_usuario, dias: {"YYYY-MM-DD": n}}). El incremento y la lectura
+    son una sola operación atómica; los días fuera de la ventana se eliminan después.
+
+    Args:
+        user_id: Id del usuario
+        when: Fecha de la cancelación
+    returns:
+        tuple(int, datetime | None): Cancelaciones del usuario en los últimos
+        CANCELLATION_WINDOW_DAYS días y fin del bloqueo si supera CANCELLATION_LIMIT
+    """
+    window = mongo.db.cancelaciones_ventana.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {f"dias.{when.strftime('%Y-%m-%d')}": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    count, stale = cancellation_window(window["dias"], when)
+    if stale:
+        mongo.db.cancelaciones_ventana.update_one(
+            {"_id": user_id}, {"$unset": {f"dias.{day}": "" for day in stale}}
+        )
+    return count, blocked_until(window["dias"], when)
+
+
+def update_reservation_counters(counts):
+    """
+    Suma reservas a los contadores por vehículo de la colección conteo_reservas
+
+    Args:
+        counts: dict {id_vehiculo: cantidad de reservas nuevas}
+    """
+    mongo.db.conteo_reservas.bulk_write(
+        reservation_counter_writes(counts), ordered=False
+    )
+
+
+def rebuild_reservation_counters():
+    """
+    Recalcula desde cero los contadores de conteo_reservas a partir de la colección reservas
+
+    $out reemplaza la colección conservando sus índices.
+
+    returns:
+        int: Cantidad de vehículos con reservas
+    """
+    mongo.db.reservas.aggregate(
+        [
+            {"$group": {"_id": "$id_vehiculo", "cantidad": {"$sum": 1}}},
+            {"$out": "conteo_reservas"},
+        ]
+    )
+    return mongo.db.conteo_reservas.estimated_document_count()
+
+
+def join_export_batch(reservations):
+    """
+    Agrega el email del usuario y la placa del vehículo a un lote de reservas, con una
+    consulta $in por colección
+
+    Args:
+        reservations: Lista de reservas
+    """
+    users = get_collection(mongo.db, "usuarios", "analytics").find(
+        {"_id": {"$in": list({r["id_usuario"] for r in reservations})}}, {"email": 1}
+    )
+    vehicles = get_collection(mongo.db, "vehiculos", "analytics").find(
+        {"_id": {"$in": list({r["id_vehiculo"] for r in reservations})}}, {"placa": 1}
+    )
+    emails = {user["_id"]: user.get("email") for user in users}
+    placas = {vehicle["_id"]: vehicle.get("placa") for vehicle in vehicles}
+    for reservation in reservations:
+        reservation["email"] = emails.get(reservation["id_usuario"])
+        reservation["placa"] = placas.get(reservation["id_vehiculo"])
+
+
+def export_reservations(query, format, join=False, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Transmite las reservas que cumplen el filtro, ordenadas por fecha_inicio
+
+    El cursor lee lotes de batch_size documentos y cada lote se serializa antes de
+    pedir el siguiente, así la memoria usada no depende de la cantidad de reservas.
+
+    Args:
+        query: Filtro de export_query
+        format: "ndjson" o "csv"
+        join: Si se agregan el email del usuario y la placa del vehículo
+        batch_size: Documentos por lote del cursor
+    returns:
+        generator(str): Encabezado y un fragmento por lote
+    """
+    yield export_header(format)
+    cursor = (
+        get_collection(mongo.db, "reservas", "analytics")
+        .find(query)
+        .sort("fecha_inicio", 1)
+        .batch_size(batch_size)
+    )
+    batch = []
+    for reservation in cursor:
+        batch.append(reservation)
+        if len(batch) >= batch_size:
+            if join:
+                join_export_batch(batch)
+            yield export_lines(batch, format)
+            batch = []
+    if batch:
+        if join:
+            join_export_batch(batch)
+        yield export_lines(batch, format)
+
+
+def paginated_response(collection, query, limit, after, projection=None):
+    """
+    Construye una respuesta paginada por _id
+
+    Se leen limit + 1 documentos: si llega el de más, hay una página siguiente y su
+    cursor se envía en la cabecera X-Next-Cursor. X-Total-Count lleva el total estimado
+    de la colección en los listados sin filtro; con filtro contar es recorrer todos los
+    resultados, así que solo se cuenta si la solicitud lo pide con ?count=true.
+
+    Args:
+        collection: Colección de pymongo a consultar
+        query: Filtro de la consulta
+        limit: Cantidad máxima de documentos de la página
+        after: _id del último documento de la página anterior o None
+        projection: Proyección opcional de campos
+    returns:
+        Response: Respuesta HTTP con el arreglo JSON de la página
+    """
+    total = None
+    if not query:
+        total = collection.estimated_document_count()
+    elif request.args.get("count") in ("1", "true"):
+        total = collection.count_documents(query)
+
+    documents = list(
+        collection.find(page_query(query, after), page_projection(projection))
+        .sort("_id", 1)
+        .limit(limit + 1)
+    )
+    page, after = page_split(documents, limit, projection)
+    return Response(
+        dumps(page),
+        mimetype="application/json",
+        status=200,
+        headers=page_headers(total, after),
+    )
+
+
+def bump_versions(collection, ids=()):
+    """
+    Incrementa el contador de versiones de una colección y de los documentos modificados,
+    que usan los ETag de las lecturas
+
+    Args:
+        collection: Nombre de la colección modificada
+        ids: Ids de los documentos modificados
+    """
+    mongo.db.versiones.bulk_write(version_updates(collection, ids), ordered=False)
+
+
+def get_version(collection, id=None):
+    """
+    Versión actual de una colección o de uno de sus documentos
+
+    Args:
+        collection: Nombre de la colección
+        id: Id del documento, o None para la colección completa
+    returns:
+        int: Versión, 0 si nunca se modificó
+    """
+    document = mongo.db.versiones.find_one({"_id": version_key(collection, id)})
+    return document["version"] if document else 0
+
+
+def admin_only(view):
+    """
+    Decorador de las rutas de administración: responden solo con el ADMIN_TOKEN en la
+    cabecera Authorization, ver admin_denied
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        denied = admin_denied(request.headers.get("Authorization"))
+        if denied is not None:
+            error, status = denied
+            return jsonify(error), status
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def conditional(collection, id_arg=None, cache=None):
+    """
+    Decorador de rutas GET que responde 304 Not Modified si el If-None-Match de la
+    solicitud coincide con el ETag de la versión actual, sin leer los documentos
+
+    La versión se lee antes que los datos: como las escrituras incrementan la versión
+    después de modificar los documentos, un ETag nunca queda asociado a datos más viejos.
+
+    Args:
+        collection: Nombre de la colección que devuelve la ruta
+        id_arg: Argumento de la ruta con el id del documento, o None para listados
+        cache: TTLCache del documento, se invalida si otro proceso lo modificó
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            id = kwargs.get(id_arg) if id_arg else None
+            key = version_key(collection, id)
+            version = get_version(collection, id)
+            if cache is not None and ObjectId.is_valid(id):
+                refresh_on_version(cache, key, ObjectId(id), version)
+            etag = make_etag(version, request.full_path)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = CACHE_CONTROL
+            return response
+
+        return wrapper
+
+    return decorator